@@ -0,0 +1,70 @@
+import sys
+import time
+
+import numpy as np
+
+from gym_peggle.envs import PeggleEnv
+from gym_peggle.sim import BatchSimulator
+from gym_peggle.wrappers import MaskedDiscreteActions
+
+# Aim actions every 0.005 rad, plus one fire action (its angle is ignored, the env fires at the current aim)
+DISC_TO_CONT = [[0, angle] for angle in range(0, 314159, 500)] + [[1, 0]]
+
+
+def main(games):
+    env = MaskedDiscreteActions(PeggleEnv(), DISC_TO_CONT)
+    update_contacts = env.update_contacts
+    update_time = 0
+
+    def timed_update():
+        nonlocal update_time
+        start = time.perf_counter()
+        update_contacts()
+        update_time += time.perf_counter() - start
+    env.update_contacts = timed_update
+
+    rng = np.random.default_rng(0)
+    shots = aims = 0
+    sweep_time = 0
+    for seed in range(games):
+        env.reset(seed=seed)
+        game = env.unwrapped.game
+        simulator = BatchSimulator.from_game(game)
+        terminated = truncated = False
+        while not (terminated or truncated):
+            mask = env.action_masks()
+            if (env.first_contact < 0).all():
+                break   # Nothing can hit a peg, so every action is left open; no masked action can hit
+            action = int(rng.choice(np.flatnonzero(mask)))
+            pegs_before = game.pegs_hit
+
+            _, _, terminated, truncated, _ = env.step(action)
+            game = env.unwrapped.game
+
+            if env.is_fire[action]:
+                # An allowed fire hits at least one peg, and the incremental re-sweep matches a full one
+                assert game.pegs_hit > pegs_before, "a masked fire action missed"
+                start = time.perf_counter()
+                pegs, alive = simulator.board_arrays(game)
+                first_contact, _ = simulator.first_contacts(pegs, alive, env.aim_angles)
+                sweep_time += time.perf_counter() - start
+                assert np.array_equal(env.first_contact, first_contact)
+                shots += 1
+            else:
+                # An allowed aim touches a peg: the aim dots of the new direction pass through one
+                assert game.pegs_in_trajectory > 0, "a masked aim action points at a miss"
+                aims += 1
+
+    print(f"{games} games: {shots} masked shots all hit a peg and {aims} masked aims all pointed at one")
+    print(f"After every shot the incremental mask matched a full first_contacts sweep of {len(env.aim_angles)} angles")
+    print(f"Mask update after a shot {update_time / max(shots, 1) * 1000:.2f}ms, "
+          f"full first_contacts sweep {sweep_time / max(shots, 1) * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    games = 5
+
+    if len(sys.argv) > 1:
+        games = int(sys.argv[1])
+
+    main(games)
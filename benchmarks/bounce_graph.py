@@ -0,0 +1,82 @@
+import sys
+import time
+
+import numpy as np
+
+from gym_peggle.sim import BatchSimulator, BounceGraph, FirstContactIndex, FreeFlightTable
+
+
+def board(seed):
+    rng = np.random.default_rng(seed)
+    return rng.integers(100, 1100, size=(30, 2)).astype(float), np.ones(30, dtype=bool)
+
+
+def main(boards):
+    simulator = BatchSimulator()
+    table = FreeFlightTable(simulator)
+    angles = table.angles
+    print(f"{boards} boards of 30 pegs, {len(angles)} grid angles each")
+
+    totals = np.zeros(10)
+    for seed in range(boards):
+        pegs, alive = board(seed)
+
+        start = time.perf_counter()
+        full, _ = simulator.scores(pegs, alive, angles)
+        sweep_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = FirstContactIndex(table, pegs, alive)
+        index_time = time.perf_counter() - start
+        graph = BounceGraph(index)
+        graph_time = time.perf_counter() - start - index_time
+        found_angles, first, second = graph.bounce_shots()
+        query_time = time.perf_counter() - start - index_time - graph_time
+
+        # Same bounce shots as the full sweep, and every real pair of consecutive bounces is a candidate and an edge
+        assert np.array_equal(found_angles, angles[full >= 2])
+        every = np.flatnonzero(index.first_peg >= 0)
+        real = graph.second_contacts(every)
+        assert graph.touches[every[real >= 0], real[real >= 0]].all()
+        assert graph.edges[index.first_peg[every[real >= 0]], real[real >= 0]].all()
+
+        # Targeted queries agree with the full result
+        targeted = target_time = 0
+        for target in range(0, 30, 5):
+            start = time.perf_counter()
+            target_angles, _, _ = graph.bounce_shots(target)
+            target_time += (time.perf_counter() - start) / 6
+            assert np.array_equal(target_angles, found_angles[second == target])
+            targeted += len(graph.candidates(target)) / len(every) / 6
+
+        totals += [graph.edges.sum() / (30 * 29), len(graph.candidates()) / len(every), len(found_angles) / len(every),
+                   sweep_time, index_time, graph_time, query_time, target_time,
+                   len(list(graph.pairs())), targeted]
+
+        # Removing pegs one at a time gives the same graph as building it on the smaller board
+        for peg in np.random.default_rng(seed).permutation(30)[:10]:
+            graph.remove_peg(peg)
+            alive[peg] = False
+        rebuilt = BounceGraph(FirstContactIndex(table, pegs, alive))
+        assert np.array_equal(graph.touches, rebuilt.touches) and np.array_equal(graph.edges, rebuilt.edges)
+        found_angles, _, _ = graph.bounce_shots()
+        full, _ = simulator.scores(pegs, alive, angles)
+        assert np.array_equal(found_angles, angles[full >= 2])
+
+    density, candidate, bounce, sweep_time, index_time, graph_time, query_time, target_time, pairs, targeted = totals / boards
+    print(f"Edge density {density:.0%}; {candidate:.0%} of the angles that touch a peg are simulated past the first "
+          f"bounce, {bounce:.0%} are bounce shots; {targeted:.0%} for a query with a given second peg")
+    print(f"Per board: full sweep {sweep_time * 1000:.1f}ms; first-contact index {index_time * 1000:.1f}ms, bounce graph "
+          f"{graph_time * 1000:.1f}ms, then every bounce shot in {query_time * 1000:.1f}ms "
+          f"({sweep_time / query_time:.1f}x the sweep) or those with a given second peg in {target_time * 1000:.1f}ms "
+          f"({sweep_time / target_time:.1f}x); {pairs:.0f} candidate (angle run, second peg) pairs")
+    print("Every simulated pair of consecutive bounces was a candidate, and incremental removal matched a rebuild")
+
+
+if __name__ == "__main__":
+    boards = 10
+
+    if len(sys.argv) > 1:
+        boards = int(sys.argv[1])
+
+    main(boards)
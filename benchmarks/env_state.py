@@ -0,0 +1,66 @@
+import sys
+import time
+
+import numpy as np
+
+from gym_peggle.envs import PeggleEnv, PegglePixelsEnv
+
+
+def played(env_class, seed, steps):
+    env = env_class()
+    env.reset(seed=seed)
+    rng = np.random.default_rng(seed)
+    for _ in range(steps):
+        env.step([rng.random() < 0.2, rng.integers(0, 314159)])
+    return env
+
+
+def clones_per_second(env, clones):
+    state = env.get_state()
+    clone = type(env)()
+    clone.reset(seed=0)
+    start = time.perf_counter()
+    for _ in range(clones):
+        env.get_state(state)
+        clone.set_state(state)
+    return clones / (time.perf_counter() - start)
+
+
+def main(games, steps):
+    for seed in range(games):
+        env = played(PegglePixelsEnv, seed, steps)
+        clone = PegglePixelsEnv()
+        clone.reset(seed=seed + 1)
+        clone.set_state(env.get_state())
+
+        # A restored pixels env draws the same frame, aim dots included, and keeps the whole frame stack
+        assert np.array_equal(clone.rasterizer.draw_game(clone.game), env.rasterizer.draw_game(env.game))
+        assert clone.game.aim_dots == env.game.aim_dots and len(env.game.aim_dots) > 0
+        stack = lambda pixels: pixels.frames[pixels.frame_index:pixels.frame_index + pixels.frame_stack]
+        assert np.array_equal(stack(clone), stack(env)) and clone.fill_stack == env.fill_stack
+        rng = np.random.default_rng(seed)
+        for _ in range(steps):
+            action = [rng.random() < 0.2, rng.integers(0, 314159)]
+            observation, reward, terminated, truncated, _ = env.step(action)
+            clone_observation, clone_reward, clone_terminated, clone_truncated, _ = clone.step(action)
+            assert np.array_equal(observation, clone_observation) and reward == clone_reward
+            assert (terminated, truncated) == (clone_terminated, clone_truncated)
+            if terminated:
+                break
+    print(f"{games} games: restored pixel envs stacked the same frames, aim dots included, for {steps} more steps")
+
+    for env_class in (PeggleEnv, PegglePixelsEnv):
+        rate = clones_per_second(played(env_class, 0, 5), 500)
+        print(f"{env_class.__name__:>16}: {rate:,.0f} get/set round trips per second")
+
+
+if __name__ == "__main__":
+    games = 5
+    steps = 20
+
+    if len(sys.argv) > 1:
+        games = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        steps = int(sys.argv[2])
+
+    main(games, steps)
@@ -0,0 +1,89 @@
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from gym_peggle.levels import compile_level
+from gym_peggle.sim import BatchSimulator, FirstContactIndex, FreeFlightTable
+
+
+def board(seed):
+    rng = np.random.default_rng(seed)
+    return rng.integers(100, 1100, size=(30, 2)).astype(float), np.ones(30, dtype=bool)
+
+
+def main(boards, shots):
+    simulator = BatchSimulator()
+    table = FreeFlightTable(simulator)
+    angles = table.angles
+    print(f"{boards} boards of 30 pegs, {len(angles)} grid angles, {shots} shots of 3 pegs each")
+
+    sweep_time = index_time = 0
+    for seed in range(boards):
+        pegs, alive = board(seed)
+        rng = np.random.default_rng(seed)
+
+        start = time.perf_counter()
+        index = FirstContactIndex(table, pegs, alive)
+        index_time += time.perf_counter() - start
+        for shot in range(shots + 1):
+            if shot > 0:    # Removing pegs updates the index in place, like a shot does
+                alive[rng.choice(np.flatnonzero(alive), 3, replace=False)] = False
+                start = time.perf_counter()
+                index.update_alive(alive)
+                index_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            pegs_hit, _ = simulator.scores(pegs, alive, angles)
+            sweep_time += time.perf_counter() - start
+            start = time.perf_counter()
+            index_hit, _ = index.scores()
+            index_time += time.perf_counter() - start
+
+            # Same pegs hit as the full sweep, and same first contacts; without pruning the ticks match too
+            # (pruning checks on a stride that starts at the first bounce, so it stops lanes on other ticks)
+            assert np.array_equal(index_hit, pegs_hit)
+            first_peg, first_tick = simulator.first_contacts(pegs, alive, angles)
+            assert np.array_equal(index.first_peg, first_peg) and np.array_equal(index.first_tick, first_tick)
+            assert np.array_equal(index.scores(prune=False)[1], simulator.scores(pegs, alive, angles, prune=False)[1])
+
+        # A peg coming back rebuilds the index
+        alive[:] = True
+        index.update_alive(alive)
+        assert np.array_equal(index.first_peg, simulator.first_contacts(pegs, alive, angles)[0])
+
+    sweeps = boards * (shots + 1)
+    print(f"BatchSimulator.scores {sweep_time / sweeps * 1000:.1f}ms per sweep, FirstContactIndex {index_time / sweeps * 1000:.1f}ms "
+          f"including its build and updates ({sweep_time / index_time:.2f}x)")
+    print("FirstContactIndex.scores equalled BatchSimulator.scores on every board, before and after removing pegs")
+
+    # A compiled level's tables match a sweep from the launch, and its index needs no path comparisons
+    with tempfile.TemporaryDirectory() as cache_dir:
+        level = compile_level("diamond", cache_dir)
+        pegs, alive = np.array(level.pegs), np.ones(len(level.pegs), dtype=bool)
+        first_peg, first_tick = simulator.first_contacts(pegs, alive, level.angles)
+        assert np.array_equal(level.first_peg, first_peg) and np.array_equal(level.first_tick, first_tick)
+        assert np.array_equal(level.scores, simulator.scores(pegs, alive, level.angles)[0])
+
+        start = time.perf_counter()
+        index = level.first_contact_index(table)
+        level_time = time.perf_counter() - start
+        start = time.perf_counter()
+        fresh = FirstContactIndex(table, pegs, alive)
+        fresh_time = time.perf_counter() - start
+        assert np.array_equal(index.first_peg, fresh.first_peg) and np.array_equal(index.scores()[0], level.scores)
+    print(f"Level {level.name!r}: tables match a sweep; its index loads in {level_time * 1000:.2f}ms "
+          f"instead of {fresh_time * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    boards = 5
+    shots = 4
+
+    if len(sys.argv) > 1:
+        boards = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        shots = int(sys.argv[2])
+
+    main(boards, shots)
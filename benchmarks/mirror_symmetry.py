@@ -0,0 +1,71 @@
+import sys
+
+import numpy as np
+
+from gym_peggle.sim import BatchSimulator, ShotOutcomeCache, canonical_board, mirror_angles, mirror_board
+
+# The perfect sweep, and the same angles mirrored about pi / 2, so a board and its mirror ask for the same shots
+ANGLES = np.arange(0, 3142) / 1000
+SYMMETRIC_ANGLES = np.concatenate([ANGLES, mirror_angles(ANGLES)])
+
+
+def random_board(num_pegs, width, rng):
+    pegs = rng.integers(100, width - 100, size=(num_pegs, 2)).astype(float)
+    alive = rng.random(num_pegs) < 0.8
+    return pegs, alive
+
+
+def main(boards):
+    simulator = BatchSimulator()
+    width = simulator.width
+    rng = np.random.default_rng(0)
+
+    # Properties of the canonical key: shared with the mirror image, mirrored flag flips, peg order counts
+    for _ in range(boards * 20):
+        pegs, alive = random_board(30, width, rng)
+        key, mirrored = canonical_board(pegs, alive, width)
+        mirror_key, mirror_mirrored = canonical_board(mirror_board(pegs, width), alive, width)
+        assert mirror_key == key and mirror_mirrored != mirrored
+        assert np.array_equal(mirror_board(mirror_board(pegs, width), width), pegs)
+        order = rng.permutation(len(pegs))
+        assert canonical_board(pegs[order], alive[order], width)[0] != key
+    print(f"canonical key properties hold on {boards * 20} random boards")
+
+    # The default cache is exact: every outcome it serves, for the board, a reordering of it and its mirror
+    # image, equals direct simulation of the board asked about
+    cache = ShotOutcomeCache(simulator)
+    for _ in range(boards):
+        pegs, alive = random_board(30, width, rng)
+        order = rng.permutation(len(pegs))
+        for board_pegs, board_alive in ((pegs, alive), (pegs[order], alive[order]), (mirror_board(pegs, width), alive)):
+            direct, _ = simulator.scores(board_pegs, board_alive, SYMMETRIC_ANGLES)
+            assert np.array_equal(cache.scores(board_pegs, board_alive, SYMMETRIC_ANGLES), direct)
+            assert np.array_equal(cache.scores(board_pegs, board_alive, SYMMETRIC_ANGLES), direct)
+            assert cache.last_trajectories == 0
+    print(f"default cache: {len(cache.boards)} boards, every outcome equal to direct simulation")
+
+    # Opt-in mirroring: outcomes on the mirror image against direct simulation; they differ only where rounding
+    # changes a bounce chain
+    cache = ShotOutcomeCache(simulator, mirror=True)
+    agree = 0
+    for _ in range(boards):
+        pegs, alive = random_board(30, width, rng)
+        mirrored = mirror_board(pegs, width)
+        direct, _ = simulator.scores(mirrored, alive, SYMMETRIC_ANGLES)
+        cache.scores(pegs, alive, SYMMETRIC_ANGLES)
+        cached = cache.scores(mirrored, alive, SYMMETRIC_ANGLES)
+        assert cache.last_trajectories == 0     # Everything came from the original board's entry
+        agree += np.mean(cached == direct)
+
+    print(f"mirror=True: mirrored outcomes equal to direct simulation on {agree / boards:.4f} of shots")
+    print(f"cache: {len(cache.boards)} boards, {cache.entries()} entries, hit rate {cache.hit_rate():.2f} "
+          f"(every mirrored board was a hit)")
+
+
+if __name__ == "__main__":
+    boards = 3
+
+    if len(sys.argv) > 1:
+        boards = int(sys.argv[1])
+
+    main(boards)
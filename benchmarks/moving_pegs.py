@@ -0,0 +1,102 @@
+import math
+import sys
+import time
+
+import numpy as np
+
+from gym_peggle.sim.moving import DynamicGrid, MovingPegGame, MovingPegs
+
+SIZE = 3000     # Board of the Peggle-Large preset, which fits 1,000 pegs
+
+
+def moving_board(seed):
+    # 1,000 pegs: 400 static, 300 on rails and 50 rotating clusters of 6
+    rng = np.random.default_rng(seed)
+    pegs = MovingPegs()
+    pegs.add_static(rng.uniform(200, SIZE - 200, size=(400, 2)))
+    for start in rng.uniform(300, SIZE - 300, size=(300, 2)):
+        pegs.add_rail(start, start + rng.uniform(-200, 200, size=2), rng.uniform(120, 600), rng.uniform())
+    for center in rng.uniform(300, SIZE - 300, size=(50, 2)):
+        pegs.add_cluster(center, 80, 6, rng.choice([-1, 1]) * rng.uniform(0.005, 0.03), rng.uniform(0, 2 * np.pi))
+    return pegs
+
+
+class NaiveGame(MovingPegGame):
+    # Recomputes every peg position and checks every peg each tick, the all-pairs baseline
+    def _tick(self, ball, time, positions, grid, alive):
+        positions[:] = self.motion.positions(time)
+        ball.update()
+        reach = self.peg_radius + ball.radius
+        for peg in range(len(positions)):
+            if alive[peg] and math.sqrt((positions[peg, 0] - ball.x) ** 2 + (positions[peg, 1] - ball.y) ** 2) < reach:
+                self._bounce(ball, positions[peg, 0], positions[peg, 1])
+                alive[peg] = False
+                return peg
+        return None
+
+
+class RebuildGame(MovingPegGame):
+    # Rebuilds the grid from scratch every tick instead of rebucketing
+    def _tick(self, ball, time, positions, grid, alive):
+        self.motion.positions(time, out=positions)
+        grid.__dict__.update(DynamicGrid(positions, grid.cell_size, self.width, self.height, alive).__dict__)
+        return super()._tick(ball, time, positions, grid, alive)
+
+
+def play(game_class, pegs, angles):
+    game = game_class(pegs, len(angles), angles[0], SIZE, SIZE)
+    start, ticks, trajectories = time.perf_counter(), 0, []
+    for angle in angles:
+        game.change_aim(angle)
+        preview = [list(dot) for dot in game.aim_dots]
+        start_tick = game.time
+        game.launch_ball()
+        path, bounces = [], 0
+        while game.ball.in_bounds():
+            if game.update():
+                bounces += 1
+            if bounces <= 2 and len(path) < len(preview):
+                path.append([game.ball.x, game.ball.y])
+        game.is_ball_moving = False
+        assert path == preview, "the aim preview must follow the real shot"
+        ticks += game.time - start_tick
+        trajectories.append(game.alive.copy())
+    # The preview's own ticks are part of the cost of a turn, so they stay in the timing
+    return time.perf_counter() - start, ticks, trajectories, game
+
+
+def main(boards, shots):
+    print(f"{boards} boards of 1,000 pegs (600 moving) on {SIZE}x{SIZE}, {shots} shots each with an aim preview")
+    totals = {}
+    rebucketed, ticks_simulated = 0, 0
+    for seed in range(boards):
+        pegs = moving_board(seed)
+        angles = np.random.default_rng(seed).uniform(0.3, np.pi - 0.3, size=shots)
+        results = {name: play(game_class, pegs, angles)
+                   for name, game_class in (("all-pairs", NaiveGame), ("grid rebuilt per tick", RebuildGame),
+                                            ("grid, incremental", MovingPegGame))}
+        reference = results["all-pairs"][2]
+        for name, (elapsed, ticks, alive, game) in results.items():
+            assert all(np.array_equal(a, b) for a, b in zip(alive, reference)), f"{name} removed different pegs"
+            seconds, total_ticks = totals.get(name, (0, 0))
+            totals[name] = (seconds + elapsed, total_ticks + ticks)
+        rebucketed += results["grid, incremental"][3].grid.rebucketed
+        ticks_simulated += results["grid, incremental"][3].time
+
+    print("Every version removed the same pegs, and every preview matched its shot")
+    baseline = totals["all-pairs"][0]
+    for name, (seconds, ticks) in totals.items():
+        print(f"{name:>22}: {seconds / ticks * 1e6:8.1f} us per shot tick  {baseline / seconds:6.1f}x")
+    print(f"Incremental grid moved {rebucketed / ticks_simulated:.2f} pegs between cells per tick (of 600 moving)")
+
+
+if __name__ == "__main__":
+    boards = 2
+    shots = 10
+
+    if len(sys.argv) > 1:
+        boards = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        shots = int(sys.argv[2])
+
+    main(boards, shots)
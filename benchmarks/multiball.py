@@ -0,0 +1,92 @@
+import sys
+import time
+
+import numpy as np
+
+from gym_peggle.sim.multiball import MultiBallGame
+from peggle_optimal_stop import Game
+
+BALL_COUNTS = [1, 10, 100, 1000]
+
+
+def random_pegs(num_pegs, seed):
+    return np.random.default_rng(seed).integers(100, 1100, size=(num_pegs, 2))
+
+
+def check_single_ball(num_pegs, shots):
+    # One ball at a time must play out exactly like the scalar game
+    rng = np.random.default_rng(0)
+    for seed in range(shots):
+        pegs = random_pegs(num_pegs, seed)
+        angle = rng.uniform(0, np.pi)
+        game = Game(0, pegs, 10, angle)
+        multiball = MultiBallGame.from_game(game)
+        game.launch_ball()
+        while game.ball.in_bounds():
+            game.update()
+        multiball.launch([angle])
+        multiball.run()
+        assert multiball.pegs_hit() == game.pegs_hit, (seed, angle)
+
+
+def check_shared_peg():
+    # Two identical balls reach the same peg on the same tick: it is removed once, credited to the first ball
+    multiball = MultiBallGame([[600, 200]])
+    multiball.launch([np.pi / 2, np.pi / 2])
+    multiball.run()
+    assert multiball.pegs_hit() == 1 and multiball.hit_by[0] == 0
+    assert multiball.ball_pegs_hit.tolist() == [1, 0]
+
+
+def tick_cost(num_pegs, balls, seeds):
+    elapsed, ticks = 0, 0
+    for seed in range(seeds):
+        multiball = MultiBallGame(random_pegs(num_pegs, seed))
+        multiball.launch(np.linspace(0.2, np.pi - 0.2, balls))
+        start = time.perf_counter()
+        # Only ticks with every ball still in flight, so the ball count is the same on every measured tick
+        while multiball.in_flight() == balls and multiball.ticks < 60:
+            multiball.update()
+        elapsed += time.perf_counter() - start
+        ticks += multiball.ticks
+    return elapsed / ticks
+
+
+def scalar_tick_cost(num_pegs, seeds):
+    elapsed, ticks = 0, 0
+    for seed in range(seeds):
+        game = Game(0, random_pegs(num_pegs, seed), 10, 1.0)
+        game.launch_ball()
+        start = time.perf_counter()
+        while game.ball.in_bounds():
+            game.update()
+            ticks += 1
+        elapsed += time.perf_counter() - start
+    return elapsed / ticks
+
+
+def main(num_pegs, seeds):
+    check_single_ball(num_pegs, 200)
+    check_shared_peg()
+    print("A single ball matched the scalar game on 200 shots; a shared peg went to the first ball")
+
+    scalar = scalar_tick_cost(num_pegs, seeds)
+    print(f"{num_pegs} pegs, scalar Game: {scalar * 1e6:.1f} us/tick")
+    single = None
+    print(f"{'balls':>6} {'us/tick':>8} {'vs 1 ball':>10} {'us/ball-tick':>13}")
+    for balls in BALL_COUNTS:
+        cost = tick_cost(num_pegs, balls, seeds)
+        single = cost if single is None else single
+        print(f"{balls:>6} {cost * 1e6:>8.1f} {cost / single:>9.1f}x {cost / balls * 1e6:>13.2f}")
+
+
+if __name__ == "__main__":
+    num_pegs = 30
+    seeds = 5
+
+    if len(sys.argv) > 1:
+        num_pegs = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        seeds = int(sys.argv[2])
+
+    main(num_pegs, seeds)
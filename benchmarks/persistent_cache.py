@@ -0,0 +1,79 @@
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import Process, Queue
+
+from gym_peggle.sim import BatchSimulator, PersistentShotCache
+from peggle_distributed import play
+
+
+def replay(path, mode, seeds, results=None):
+    # Plays the seeded games with a fresh cache object on the file, like a worker on the next night's run
+    simulator = BatchSimulator()
+    cache = PersistentShotCache(path, simulator)
+    start = time.perf_counter()
+    pegs_hit = [play({"mode": mode, "seed": seed, "board": ""}, simulator, cache)["pegs_hit"] for seed in seeds]
+    summary = (pegs_hit, time.perf_counter() - start, cache.misses, cache.disk_hits)
+    cache.close()
+    if results is not None:
+        results.put(summary)
+    return summary
+
+
+def main(mode, games, readers):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "shots.sqlite")
+    seeds = range(games)
+
+    cold_hits, cold_time, cold_simulated, _ = replay(path, mode, seeds)
+    warm_hits, warm_time, warm_simulated, warm_disk = replay(path, mode, seeds)
+    assert warm_hits == cold_hits
+    print(f"{games} '{mode}' games: cold {cold_time:.2f}s with {cold_simulated} shots simulated, "
+          f"warm {warm_time:.2f}s with {warm_simulated} simulated and {warm_disk} read from disk "
+          f"({cold_time / warm_time:.1f}x), same pegs hit")
+
+    # Readers replaying the stored games while a writer adds new boards
+    results = Queue()
+    processes = [Process(target=replay, args=(path, mode, seeds, results)) for _ in range(readers)]
+    processes.append(Process(target=replay, args=(path, mode, range(games, 2 * games), results)))
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    summaries = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    assert all(process.exitcode == 0 for process in processes)
+    assert sum(summary[0] == cold_hits for summary in summaries) >= readers
+    print(f"{readers} readers and 1 writer at once: {time.perf_counter() - start:.2f}s, every reader matched the cold run")
+
+    # Other physics constants never see these entries
+    other = PersistentShotCache(path, BatchSimulator(gravity=0.23))
+    play({"mode": mode, "seed": 0, "board": ""}, other.simulator, other)
+    assert other.disk_hits == 0
+    print(f"A cache with different gravity read {other.disk_hits} outcomes from the file")
+    other.close()
+
+    # Size bound: the oldest boards go first
+    bounded_path = os.path.join(directory, "bounded.sqlite")
+    bounded = PersistentShotCache(bounded_path, max_entries=20000)
+    for seed in seeds:
+        play({"mode": mode, "seed": seed, "board": ""}, bounded.simulator, bounded)
+    print(f"With max_entries=20000 the file holds {bounded.disk_entries()} outcomes after {bounded.misses} were written")
+    assert bounded.disk_entries() <= 20000 + 3142
+    bounded.close()
+
+
+if __name__ == "__main__":
+    mode = "perfect"
+    games = 3
+    readers = 3
+
+    if len(sys.argv) > 1:
+        mode = sys.argv[1]
+    if len(sys.argv) > 2:
+        games = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        readers = int(sys.argv[3])
+
+    main(mode, games, readers)
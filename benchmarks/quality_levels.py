@@ -0,0 +1,66 @@
+import sys
+import time
+
+import numpy as np
+
+from gym_peggle.sim import BatchSimulator
+
+ANGLES = np.arange(0, 3142) / 1000
+TIMESTEPS = [1, 2, 3, 4, 6, 8]
+
+
+def random_board(num_pegs, seed):
+    rng = np.random.default_rng(seed)
+    pegs = rng.integers(100, 1100, size=(num_pegs, 2)).astype(float)
+    return pegs, np.ones(num_pegs, dtype=bool)
+
+
+def ranks(values):
+    order = np.argsort(values, kind="stable")
+    result = np.empty(len(values))
+    result[order] = np.arange(len(values))
+    return result
+
+
+def main(boards, top_k):
+    exact = BatchSimulator()
+    print(f"{boards} boards, {len(ANGLES)} angles, top {top_k} verified exactly")
+    print(f"{'timestep':>8} {'ms/sweep':>9} {'speedup':>8} {'same score':>11} {'rank corr':>10} "
+          f"{'best':>6} {'top-1 regret':>13} {'two-stage regret':>17}")
+
+    results = {}
+    for timestep in TIMESTEPS:
+        simulator = exact.with_quality(timestep)
+        elapsed, same, correlation, best, regret, two_stage_regret = 0, 0, 0, 0, 0, 0
+        for seed in range(boards):
+            pegs, alive = random_board(30, seed)
+            exact_hits, _ = exact.scores(pegs, alive, ANGLES)
+
+            start = time.perf_counter()
+            coarse_hits, _ = simulator.scores(pegs, alive, ANGLES)
+            elapsed += time.perf_counter() - start
+
+            same += np.mean(coarse_hits == exact_hits)
+            correlation += np.corrcoef(ranks(coarse_hits), ranks(exact_hits))[0, 1]
+            best += exact_hits.max()
+            # Pegs lost by playing the coarse pick instead of the true best, then the same after verifying the top k
+            regret += exact_hits.max() - exact_hits[np.argmax(coarse_hits)]
+            candidates = np.argsort(-coarse_hits, kind="stable")[:top_k]
+            two_stage_regret += exact_hits.max() - exact_hits[candidates].max()
+
+        results[timestep] = elapsed / boards
+        print(f"{timestep:>8} {elapsed / boards * 1000:>9.1f} {results[1] / results[timestep]:>7.2f}x "
+              f"{same / boards:>11.3f} {correlation / boards:>10.3f} {best / boards:>6.1f} {regret / boards:>13.2f} "
+              f"{two_stage_regret / boards:>17.2f}")
+
+
+if __name__ == "__main__":
+    boards = 5
+    top_k = 16
+
+    if len(sys.argv) > 1:
+        boards = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        top_k = int(sys.argv[2])
+
+    main(boards, top_k)
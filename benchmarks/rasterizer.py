@@ -0,0 +1,71 @@
+import sys
+import time
+
+import numpy as np
+import pygame
+
+from gym_peggle.envs import PeggleEnv
+from gym_peggle.envs.rasterizer import Rasterizer
+
+TEXT_BOX = (40, 140)    # Rows and columns of the ball counter text, which only the pygame render draws
+
+
+def played(seed, steps, **kwargs):
+    env = PeggleEnv(render_mode="rgb_array", **kwargs)
+    env.reset(seed=seed)
+    rng = np.random.default_rng(seed)
+    for _ in range(steps):
+        env.step([rng.random() < 0.3, rng.integers(0, 314159)])
+    return env
+
+
+def main(boards, steps, frames):
+    pygame.init()   # rgb_array renders need pygame's font module for the ball counter
+    agreement = []
+    for seed in range(boards):
+        pygame_env = played(seed, steps)
+        raster_env = played(seed, steps, render_resolution=(pygame_env.height, pygame_env.width))
+        expected, drawn = pygame_env.render(), raster_env.render()
+        assert expected.shape == drawn.shape
+
+        # The same discs in the same colors at full resolution; edges differ by a pixel where the two round differently
+        outside_text = np.ones(expected.shape[:2], dtype=bool)
+        outside_text[:TEXT_BOX[0], :TEXT_BOX[1]] = False
+        lit = (expected.any(axis=2) | drawn.any(axis=2)) & outside_text
+        agreement.append(np.mean((expected == drawn).all(axis=2)[lit]))
+        for peg in pygame_env.game.pegs:
+            x, y = int(peg.getX()), int(peg.getY())
+            if x > 0 and y > 0 and not any(np.hypot(x - dot[0], y - dot[1]) < 5 for dot in pygame_env.game.aim_dots):
+                assert np.array_equal(expected[y, x], drawn[y, x])
+    assert min(agreement) > 0.9
+    print(f"{boards} boards after {steps} steps: rasterizer at full resolution matches render_mode='rgb_array' on "
+          f"{np.mean(agreement):.1%} of drawn pixels (worst {min(agreement):.1%}) and every peg center")
+
+    env = played(0, steps)
+    start = time.perf_counter()
+    for _ in range(frames // 10):
+        env.render()
+    pygame_rate = frames // 10 / (time.perf_counter() - start)
+    for resolution, grayscale in (((84, 84), True), ((84, 84), False)):
+        rasterizer = Rasterizer((env.width, env.height), resolution, grayscale)
+        start = time.perf_counter()
+        for _ in range(frames):
+            rasterizer.draw_game(env.game)
+        rate = frames / (time.perf_counter() - start)
+        print(f"Rasterizer {resolution[0]}x{resolution[1]} {'gray' if grayscale else 'RGB '}: {rate:,.0f} frames/s "
+              f"({rate / pygame_rate:.0f}x pygame rgb_array at {env.width}x{env.height}, {pygame_rate:,.0f} frames/s)")
+
+
+if __name__ == "__main__":
+    boards = 5
+    steps = 3
+    frames = 2000
+
+    if len(sys.argv) > 1:
+        boards = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        steps = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        frames = int(sys.argv[3])
+
+    main(boards, steps, frames)
@@ -0,0 +1,71 @@
+import sys
+import time
+
+import numpy as np
+
+from gym_peggle.sim import BatchSimulator
+from peggle_optimal_stop import Game
+
+ANGLES = np.arange(0, 3142) / 1000
+ALIVE_FRACTIONS = [1.0, 0.6, 0.3, 0.1]
+
+
+def scalar_sweep(game, angles, prune):
+    game.prune = prune
+    ticks_before = game.ticks_simulated
+    start = time.perf_counter()
+    scores = []
+    for angle in angles:
+        game.change_aim(angle, False)
+        scores.append(game.get_shot_score())
+    return np.array(scores), game.ticks_simulated - ticks_before, time.perf_counter() - start
+
+
+def main(boards, scalar_stride):
+    simulator = BatchSimulator()
+    scalar_angles = ANGLES[::scalar_stride]
+    print(f"{boards} boards of 30 pegs; scalar sweep of {len(scalar_angles)} angles, batched sweep of {len(ANGLES)}")
+    print(f"{'alive':>6} {'scalar ticks saved':>19} {'scalar speedup':>15} {'batch ticks saved':>18} {'batch speedup':>14}")
+
+    for fraction in ALIVE_FRACTIONS:
+        totals = np.zeros(8)
+        for seed in range(boards):
+            rng = np.random.default_rng(seed)
+            game = Game(0, rng.integers(100, 1100, size=(30, 2)), 10, np.pi / 2)
+            alive = rng.permutation(30) < round(30 * fraction)
+            game.restore((sum(1 << int(i) for i in np.flatnonzero(alive)),) + game.snapshot()[1:])
+
+            full_scores, full_ticks, full_time = scalar_sweep(game, scalar_angles, False)
+            pruned_scores, pruned_ticks, pruned_time = scalar_sweep(game, scalar_angles, True)
+            assert np.array_equal(full_scores, pruned_scores)
+
+            pegs, alive = BatchSimulator.board_arrays(game)
+            start = time.perf_counter()
+            batch_full, batch_full_ticks = simulator.scores(pegs, alive, ANGLES, prune=False)
+            batch_full_time = time.perf_counter() - start
+            start = time.perf_counter()
+            batch_pruned, batch_pruned_ticks = simulator.scores(pegs, alive, ANGLES)
+            batch_pruned_time = time.perf_counter() - start
+            assert np.array_equal(batch_full, batch_pruned)
+            # The scalar game checks on the batched simulator's stride, so it stops the same shots on the same ticks
+            assert pruned_ticks == batch_pruned_ticks[::scalar_stride].sum()
+
+            totals += (full_ticks, pruned_ticks, full_time, pruned_time,
+                       batch_full_ticks.sum(), batch_pruned_ticks.sum(), batch_full_time, batch_pruned_time)
+
+        print(f"{fraction:>6.0%} {1 - totals[1] / totals[0]:>19.1%} {totals[2] / totals[3]:>14.2f}x "
+              f"{1 - totals[5] / totals[4]:>18.1%} {totals[6] / totals[7]:>13.2f}x")
+    print("Scores were identical with and without pruning on every board, and the scalar and batched sweeps "
+          "pruned the same ticks")
+
+
+if __name__ == "__main__":
+    boards = 3
+    scalar_stride = 10
+
+    if len(sys.argv) > 1:
+        boards = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        scalar_stride = int(sys.argv[2])
+
+    main(boards, scalar_stride)
@@ -0,0 +1,53 @@
+import sys
+import time
+
+import numpy as np
+
+from gym_peggle.sim import BatchSimulator, RobustScorer
+
+ANGLES = np.arange(0, 3142) / 1000
+SAMPLE_COUNTS = [1, 4, 16, 64, 256]
+
+
+def random_board(num_pegs, seed):
+    rng = np.random.default_rng(seed)
+    pegs = rng.integers(100, 1100, size=(num_pegs, 2)).astype(float)
+    return pegs, np.ones(num_pegs, dtype=bool)
+
+
+def main(boards, angle_noise):
+    simulator = BatchSimulator()
+    print(f"{boards} boards, {len(ANGLES)} candidate angles, aim noise {angle_noise} rad")
+    print(f"{'K':>4} {'shots simulated':>16} {'per candidate':>14} {'ms/sweep':>9} "
+          f"{'exact pick E[hit]':>18} {'robust pick E[hit]':>19}")
+
+    for samples in SAMPLE_COUNTS:
+        robust = RobustScorer(simulator, samples, angle_noise=angle_noise)
+        trajectories, elapsed, exact_pick, robust_pick = 0, 0, 0, 0
+        for seed in range(boards):
+            pegs, alive = random_board(30, seed)
+            exact_hits, _ = simulator.scores(pegs, alive, ANGLES)
+
+            start = time.perf_counter()
+            mean, _ = robust.scores(pegs, alive, ANGLES)
+            elapsed += time.perf_counter() - start
+            trajectories += robust.last_trajectories
+
+            # Expected pegs hit under noise for the knife-edge best shot and for the most robust one
+            exact_pick += mean[np.argmax(exact_hits)]
+            robust_pick += mean.max()
+
+        print(f"{samples:>4} {trajectories / boards:>16.0f} {trajectories / boards / len(ANGLES):>14.2f} "
+              f"{elapsed / boards * 1000:>9.1f} {exact_pick / boards:>18.2f} {robust_pick / boards:>19.2f}")
+
+
+if __name__ == "__main__":
+    boards = 3
+    angle_noise = 0.005
+
+    if len(sys.argv) > 1:
+        boards = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        angle_noise = float(sys.argv[2])
+
+    main(boards, angle_noise)
@@ -0,0 +1,68 @@
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from gym_peggle.envs import PeggleEnv
+
+# Board side grows with sqrt(num_pegs) so peg density stays close to the Peggle-Large preset
+PEG_COUNTS = [30, 100, 300, 1000, 3000, 10000]
+PIXELS_PER_PEG = 9000
+
+
+def board_size(num_pegs):
+    return max(1200, int(np.sqrt(num_pegs * PIXELS_PER_PEG)) + 200)
+
+
+def measure(num_pegs, aim_steps, fire_steps):
+    size = board_size(num_pegs)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    env = PeggleEnv(width=size, height=size, num_pegs=num_pegs)
+    env.reset(seed=0)
+    reset_time = time.perf_counter() - start
+    env_memory = tracemalloc.get_traced_memory()[0]
+
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    for _ in range(aim_steps):
+        env.step([0, rng.integers(0, 314159)])
+    aim_time = (time.perf_counter() - start) / aim_steps
+
+    start = time.perf_counter()
+    for _ in range(fire_steps):
+        env.step([1, 0])
+    fire_time = (time.perf_counter() - start) / fire_steps
+
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    env.close()
+
+    return size, reset_time, aim_time, fire_time, env_memory, peak_memory
+
+
+def main(max_pegs, aim_steps, fire_steps):
+    print(f"{'pegs':>6} {'board':>11} {'reset ms':>10} {'aim ms':>10} {'fire ms':>10} {'env MB':>8} {'peak MB':>8}")
+    for num_pegs in PEG_COUNTS:
+        if num_pegs > max_pegs:
+            break
+        size, reset_time, aim_time, fire_time, env_memory, peak_memory = measure(num_pegs, aim_steps, fire_steps)
+        print(f"{num_pegs:>6} {f'{size}x{size}':>11} {reset_time * 1000:>10.1f} {aim_time * 1000:>10.1f} "
+              f"{fire_time * 1000:>10.1f} {env_memory / 2 ** 20:>8.2f} {peak_memory / 2 ** 20:>8.2f}")
+
+
+if __name__ == "__main__":
+    max_pegs = 1000
+    aim_steps = 10
+    fire_steps = 3
+
+    if len(sys.argv) > 1:
+        max_pegs = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        aim_steps = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        fire_steps = int(sys.argv[3])
+
+    main(max_pegs, aim_steps, fire_steps)
@@ -0,0 +1,80 @@
+import multiprocessing as mp
+import sys
+import time
+
+import numpy as np
+
+from gym_peggle.sim import BatchSimulator, SweepPool
+
+ANGLES = np.arange(0, 3142) / 1000
+
+
+def random_board(num_pegs, size, seed):
+    rng = np.random.default_rng(seed)
+    pegs = rng.integers(100, size - 100, size=(num_pegs, 2)).astype(float)
+    return pegs, np.ones(num_pegs, dtype=bool)
+
+
+class FailingSimulator(BatchSimulator):
+    # Raises on every sweep, to check that a failing worker surfaces in best_shot
+    def scores(self, pegs, alive, angles, velocities=None, prune=True):
+        raise ValueError("sweep failed")
+
+
+def check_failures(pegs, alive):
+    with SweepPool(2, FailingSimulator(), max_pegs=len(pegs)) as pool:
+        pool.update_board(pegs, alive)
+        for _ in range(2):  # The pool keeps answering after a failure
+            try:
+                pool.best_shot(ANGLES)
+            except RuntimeError as error:
+                assert "sweep failed" in str(error)
+            else:
+                raise AssertionError("a failing worker must raise from best_shot")
+    print("A failing simulator raised RuntimeError from best_shot instead of blocking")
+
+
+def main(num_pegs, calls):
+    size = max(1200, int(np.sqrt(num_pegs * 9000)) + 200)
+    simulator = BatchSimulator(width=size, height=size)
+    pegs, alive = random_board(num_pegs, size, 0)
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        pegs_hit, _ = simulator.scores(pegs, alive, ANGLES)
+    single = (time.perf_counter() - start) / calls
+    expected = (ANGLES[np.argmax(pegs_hit)], pegs_hit.max())
+    print(f"{num_pegs} pegs on {size}x{size}, {len(ANGLES)} angles")
+    print(f"{'in-process':>12}: {single * 1000:8.1f} ms/call")
+
+    worker_counts = sorted({1, 2, 4, mp.cpu_count()})
+    for num_workers in worker_counts:
+        with SweepPool(num_workers, simulator, max_pegs=num_pegs) as pool:
+            pool.update_board(pegs, alive)
+            assert pool.best_shot(ANGLES) == expected
+
+            start = time.perf_counter()
+            for _ in range(1000):
+                pool.update_board(pegs, alive)
+            update = (time.perf_counter() - start) / 1000
+
+            start = time.perf_counter()
+            for _ in range(calls):
+                pool.best_shot(ANGLES)
+            latency = (time.perf_counter() - start) / calls
+
+        print(f"{num_workers:>3} workers: {latency * 1000:8.1f} ms/call, speedup {single / latency:4.2f}x, "
+              f"board update {update * 1e6:6.1f} us")
+    check_failures(pegs, alive)
+
+
+if __name__ == "__main__":
+    num_pegs = 30
+    calls = 5
+
+    if len(sys.argv) > 1:
+        num_pegs = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        calls = int(sys.argv[2])
+
+    main(num_pegs, calls)
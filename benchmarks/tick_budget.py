@@ -0,0 +1,82 @@
+import sys
+
+import numpy as np
+
+import peggle_optimal_stop
+from gym_peggle.sim import BatchSimulator
+from peggle_optimal_stop import Budget, ShotScorer, Simulation
+
+MODES = ["default", "perfect", "optimal-stop", "two-stage", "robust"]
+
+
+class RecordingScorer(ShotScorer):
+    # Records the ticks spent before and after every scoring call of a shot
+    shots = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = []
+        RecordingScorer.shots.append(self)
+
+    def _record(self, method, *args):
+        before = self.ticks
+        result = method(*args)
+        self.calls.append((before, self.ticks))
+        return result
+
+    def scores(self, directions, simulator=None):
+        return self._record(super().scores, directions, simulator)
+
+    def best_shot(self, directions):
+        return self._record(super().best_shot, directions)
+
+    def robust_scores(self, directions, robust):
+        return self._record(super().robust_scores, directions, robust)
+
+
+def play(mode, seed, budget):
+    RecordingScorer.shots = []
+    np.random.seed(seed)
+    simulation = Simulation(False, simulator=BatchSimulator(), budget=budget)
+    pegs_hit = simulation.run(mode)
+    return pegs_hit, RecordingScorer.shots
+
+
+def main(max_ticks, games):
+    peggle_optimal_stop.ShotScorer = RecordingScorer   # Simulation.run makes one scorer per shot
+    print(f"max_ticks={max_ticks}, {games} games per mode")
+    print(f"{'mode':>13} {'ticks/shot':>11} {'unlimited':>10} {'worst shot':>11} {'largest call':>13} {'pegs hit':>9} {'unlimited':>10}")
+    for mode in MODES:
+        spent, unlimited_spent, worst, largest, hits, unlimited_hits = [], [], 0, 0, [], []
+        for seed in range(games):
+            pegs_hit, shots = play(mode, seed, Budget(max_ticks=max_ticks))
+            hits.append(pegs_hit)
+            for scorer in shots:
+                calls = [(before, after) for before, after in scorer.calls if after > before]
+                # Every call starts inside the budget, so a shot overshoots by at most the call that crossed it
+                assert all(before < max_ticks for before, _ in calls), f"{mode} scored shots after the budget was spent"
+                ticks = max((after for _, after in calls), default=0)   # scorer.ticks would include the aim dots of the shot fired
+                assert ticks <= max_ticks + max((after - before for before, after in calls), default=0)
+                spent.append(ticks)
+                worst = max(worst, ticks)
+                largest = max([largest] + [after - before for before, after in calls])
+
+            pegs_hit, shots = play(mode, seed, Budget())
+            unlimited_hits.append(pegs_hit)
+            unlimited_spent.extend(max((after for _, after in scorer.calls), default=0) for scorer in shots)
+
+        print(f"{mode:>13} {np.mean(spent):>11,.0f} {np.mean(unlimited_spent):>10,.0f} {worst:>11,} {largest:>13,} "
+              f"{np.mean(hits):>9.1f} {np.mean(unlimited_hits):>10.1f}")
+    print("No shot started a scoring call after its tick budget was spent")
+
+
+if __name__ == "__main__":
+    max_ticks = 20000
+    games = 2
+
+    if len(sys.argv) > 1:
+        max_ticks = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        games = int(sys.argv[2])
+
+    main(max_ticks, games)
@@ -0,0 +1,170 @@
+import multiprocessing as mp
+import os
+import sys
+import time
+from functools import partial
+
+import gymnasium as gym
+import numpy as np
+
+import gym_peggle  # noqa: F401, registers the envs
+from gym_peggle.vec_env import SharedMemoryVecEnv
+
+try:
+    from stable_baselines3.common.vec_env import SubprocVecEnv
+except ImportError:
+    SubprocVecEnv = None
+
+
+def _pipe_worker(env_fn, pipe):
+    # The message loop of SB3's SubprocVecEnv: every step is a pickled action out and a pickled result back
+    env = env_fn()
+    while True:
+        command, data = pipe.recv()
+        if command == "step":
+            observation, reward, terminated, truncated, info = env.step(data)
+            if terminated or truncated:
+                info["terminal_observation"] = observation
+                observation, _ = env.reset()
+            pipe.send((observation, reward, terminated or truncated, info))
+        elif command == "reset":
+            pipe.send(env.reset(seed=data)[0])
+        else:
+            break
+
+
+class PipeVecEnv:
+    # Stand-in for SubprocVecEnv when stable-baselines3 is not installed
+    def __init__(self, env_fns):
+        self.num_envs = len(env_fns)
+        self.pipes, self.workers = [], []
+        for env_fn in env_fns:
+            parent, child = mp.Pipe()
+            worker = mp.Process(target=_pipe_worker, args=(env_fn, child), daemon=True)
+            worker.start()
+            self.pipes.append(parent)
+            self.workers.append(worker)
+
+    def seed(self, seed):
+        self.seeds = [seed + rank for rank in range(self.num_envs)]
+
+    def reset(self):
+        for pipe, seed in zip(self.pipes, self.seeds):
+            pipe.send(("reset", seed))
+        return np.stack([pipe.recv() for pipe in self.pipes])
+
+    def step(self, actions):
+        for pipe, action in zip(self.pipes, actions):
+            pipe.send(("step", action))
+        observations, rewards, dones, infos = zip(*[pipe.recv() for pipe in self.pipes])
+        return np.stack(observations), np.array(rewards), np.array(dones), list(infos)
+
+    def close(self):
+        for pipe in self.pipes:
+            pipe.send(("close", None))
+        for worker in self.workers:
+            worker.join()
+
+
+class TransportEnv(gym.Env):
+    # PeggleEnv's spaces and info with no game behind them, to time the transport alone
+    def __init__(self):
+        self.observation_space = gym.spaces.Discrete(3)
+        self.action_space = gym.spaces.MultiDiscrete([2, 314159])
+        self.steps = 0
+
+    def reset(self, seed=None, options=None):
+        super().reset(seed=seed)
+        self.steps = 0
+        return 0, {"total_miss": False, "pegs_hit": 0}
+
+    def step(self, action):
+        self.steps += 1
+        return self.steps % 3, float(action[0]), self.steps % 100 == 0, False, {"total_miss": False, "pegs_hit": self.steps}
+
+
+class FailingEnv(TransportEnv):
+    # Raises on its 5th step, leaves pegs_hit out of every other info, and with crash=True kills its process instead
+    def __init__(self, crash=False):
+        super().__init__()
+        self.crash = crash
+
+    def step(self, action):
+        observation, reward, terminated, truncated, info = super().step(action)
+        if self.steps == 5:
+            if self.crash:
+                os._exit(3)
+            raise ValueError("step 5 failed")
+        if self.steps % 2 == 0:
+            del info["pegs_hit"]
+        return observation, reward, terminated, truncated, info
+
+
+def check_failures():
+    # A worker whose env raises, or whose process dies, surfaces in the parent instead of blocking step_wait
+    for crash, expected in ((False, RuntimeError), (True, EOFError)):
+        vec_env = SharedMemoryVecEnv([TransportEnv, partial(FailingEnv, crash)])
+        vec_env.reset()
+        actions = np.zeros((2, 2), dtype=np.int64)
+        for step in range(1, 5):
+            _, _, _, infos = vec_env.step(actions)
+            assert ("pegs_hit" in infos[1]) == (step % 2 == 1), "a missing info key must not repeat the last value"
+        start = time.perf_counter()
+        try:
+            vec_env.step(actions)
+        except expected as error:
+            assert crash or "step 5 failed" in str(error)
+        else:
+            raise AssertionError(f"a failing worker must raise {expected.__name__}")
+        print(f"{'Crashed' if crash else 'Raising'} worker: {expected.__name__} after {time.perf_counter() - start:.2f}s")
+        vec_env.close()
+
+
+def random_actions(num_envs, steps, fire_fraction, seed):
+    rng = np.random.default_rng(seed)
+    return np.stack([rng.random((steps, num_envs)) < fire_fraction, rng.integers(0, 314159, size=(steps, num_envs))], axis=2)
+
+
+def run(vec_env, actions):
+    vec_env.seed(0)
+    vec_env.reset()
+    trace = []
+    start = time.perf_counter()
+    for step_actions in actions:
+        observations, rewards, dones, infos = vec_env.step(step_actions)
+        trace.append((observations.tolist(), rewards.tolist(), dones.tolist(), [info["pegs_hit"] for info in infos]))
+    elapsed = time.perf_counter() - start
+    vec_env.close()
+    return len(actions) * actions.shape[1] / elapsed, trace
+
+
+def main(num_envs, steps):
+    baseline_name, baseline = ("SubprocVecEnv", SubprocVecEnv) if SubprocVecEnv is not None else ("pipe baseline", PipeVecEnv)
+    if SubprocVecEnv is None:
+        print("stable-baselines3 is not installed, comparing against a pipe-per-env baseline with SubprocVecEnv's protocol")
+
+    print(f"{num_envs} envs, {steps} steps each ({steps * 20} for transport only)")
+    print(f"{'actions':>14} {baseline_name + ' steps/s':>24} {'shared memory steps/s':>22} {'speedup':>8}")
+    for label, env_fn, fire_fraction, env_steps in (("transport only", TransportEnv, 0.1, steps * 20),
+                                                    ("aim only", partial(gym.make, "Peggle"), 0.0, steps),
+                                                    ("10% fire", partial(gym.make, "Peggle"), 0.1, steps)):
+        env_fns = [env_fn] * num_envs
+        actions = random_actions(num_envs, env_steps, fire_fraction, 0)
+        pipe_rate, pipe_trace = run(baseline(env_fns), actions)
+        shared_rate, shared_trace = run(SharedMemoryVecEnv(env_fns), actions)
+        assert shared_trace == pipe_trace, "both vector envs must produce the same episodes"
+        print(f"{label:>14} {pipe_rate:>24,.0f} {shared_rate:>22,.0f} {shared_rate / pipe_rate:>7.2f}x")
+    print("Observations, rewards, dones and pegs_hit were identical step for step")
+    check_failures()
+
+
+if __name__ == "__main__":
+    num_envs = 4
+    steps = 500
+
+    if len(sys.argv) > 1:
+        num_envs = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        steps = int(sys.argv[2])
+
+    main(num_envs, steps)
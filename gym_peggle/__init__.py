@@ -4,3 +4,21 @@ register(
     id="Peggle",
     entry_point="gym_peggle.envs:PeggleEnv",
 )
+
+register(
+    id="Peggle-Pixels",
+    entry_point="gym_peggle.envs:PegglePixelsEnv",
+)
+
+# Larger boards for scaling tests. Peg density is kept close to a 1,000 peg board on 3000x3000.
+register(
+    id="Peggle-Large",
+    entry_point="gym_peggle.envs:PeggleEnv",
+    kwargs={"width": 3000, "height": 3000, "num_pegs": 1000},
+)
+
+register(
+    id="Peggle-Huge",
+    entry_point="gym_peggle.envs:PeggleEnv",
+    kwargs={"width": 9000, "height": 9000, "num_pegs": 10000},
+)
@@ -1 +1,2 @@
 from gym_peggle.envs.peggle import PeggleEnv
+from gym_peggle.envs.peggle_pixels import PegglePixelsEnv
@@ -3,6 +3,11 @@ from gymnasium.spaces import Discrete, MultiDiscrete
 import pygame
 import numpy as np
 import math
+import time
+
+from gym_peggle.envs.rasterizer import Rasterizer
+from gym_peggle.envs.state import pack_state, unpack_state, unpack_rng, state_nbytes
+from gym_peggle.tracing import instant, span, traced
 
 # Constants
 WIDTH, HEIGHT = 1200, 1200
@@ -12,15 +17,18 @@ LAUNCH_VELOCITY = 12
 PEG_RADIUS = 20
 BALL_X_START = WIDTH // 2
 BALL_Y_START = 30
+RESTITUTION = 1.9       # Peg bounces keep 90% of the normal velocity
+WALL_DAMPING = 0.7
+REMOVED_PEG = -50       # Removed pegs are moved to (REMOVED_PEG, REMOVED_PEG)
 
 # Dummy Game class
 class DummyGame:
-    def __init__(self, pegs, direction):
+    def __init__(self, pegs, direction, width=WIDTH, height=HEIGHT, ball_radius=BALL_RADIUS):
         self.running = True
-        self.ball = Ball(BALL_X_START, BALL_Y_START)
+        self.ball = Ball(width // 2, BALL_Y_START, ball_radius, width, height)
         self.pegs = []
         for peg in pegs:
-            self.pegs.append(Peg(peg.getX(), peg.getY()))
+            self.pegs.append(Peg(peg.getX(), peg.getY(), peg.getRadius()))
         self.is_ball_moving = False
         self.launch_direction = direction
         self.pegs_in_trajectory = 0
@@ -54,8 +62,8 @@ class DummyGame:
 
         # Reflect the ball's velocity
         dot_product = self.ball.vx * nx + self.ball.vy * ny
-        self.ball.vx -= 1.9 * dot_product * nx
-        self.ball.vy -= 1.9 * dot_product * ny
+        self.ball.vx -= RESTITUTION * dot_product * nx
+        self.ball.vy -= RESTITUTION * dot_product * ny
         
         # Move the ball outside the peg to prevent sticking
         overlap = self.ball.radius + peg.radius - math.sqrt((self.ball.x - peg.x) ** 2 + (self.ball.y - peg.y) ** 2)
@@ -63,17 +71,21 @@ class DummyGame:
         self.ball.y += ny * overlap
         
         # Remove the peg
-        peg.setCoords(-50, -50) #TODO
+        peg.setCoords(REMOVED_PEG, REMOVED_PEG)
 
 
 # Ball class
 class Ball:
-    def __init__(self, x, y):
+    def __init__(self, x, y, radius=BALL_RADIUS, width=WIDTH, height=HEIGHT):
         self.x = x
         self.y = y
+        self.start_x = x
+        self.start_y = y
         self.vx = 0
         self.vy = 0
-        self.radius = BALL_RADIUS
+        self.radius = radius
+        self.width = width      # Board size, for the side walls and the bottom edge
+        self.height = height
 
     def update(self):
         self.x += self.vx
@@ -81,19 +93,19 @@ class Ball:
         self.vy += GRAVITY  # Gravity
 
         # Bounce off the sides
-        if self.x > WIDTH - self.radius:
-            self.x = WIDTH - self.radius
-            self.vx *= -0.7 
+        if self.x > self.width - self.radius:
+            self.x = self.width - self.radius
+            self.vx *= -WALL_DAMPING
         if self.x < 0 + self.radius:
             self.x = 0 + self.radius
-            self.vx *= -0.7
+            self.vx *= -WALL_DAMPING
 
     def in_bounds(self):
-        return self.y < HEIGHT
+        return self.y < self.height
     
     def reset(self):
-        self.x = BALL_X_START
-        self.y = BALL_Y_START
+        self.x = self.start_x
+        self.y = self.start_y
     
     def getX(self):
         return self.x
@@ -106,10 +118,10 @@ class Ball:
 
 # Peg class
 class Peg:
-    def __init__(self, x, y):
+    def __init__(self, x, y, radius=PEG_RADIUS):
         self.x = x
         self.y = y
-        self.radius = PEG_RADIUS
+        self.radius = radius
 
     def is_colliding(self, ball):
         distance = math.sqrt((self.x - ball.x) ** 2 + (self.y - ball.y) ** 2)
@@ -134,20 +146,24 @@ class Peg:
 
 # Game class
 class Game:
-    def __init__(self, pegs_hit, pegs, balls, direction):
+    def __init__(self, pegs_hit, pegs, balls, direction, width=WIDTH, height=HEIGHT, peg_radius=PEG_RADIUS, ball_radius=BALL_RADIUS):
         self.balls = balls
         self.pegs_hit = pegs_hit
         self.running = True
-        self.ball = Ball(BALL_X_START, BALL_Y_START)
+        self.width = width
+        self.height = height
+        self.ball = Ball(width // 2, BALL_Y_START, ball_radius, width, height)
         self.pegs = []
         if len(pegs) > 0:
             for i in range(len(pegs)):
-                self.pegs.append(Peg(pegs[i][0], pegs[i][1]))
+                self.pegs.append(Peg(pegs[i][0], pegs[i][1], peg_radius))
+        self.peg_coords = np.array(pegs, dtype=float).reshape(-1, 2)     # Original peg positions, kept for get_state
         self.is_ball_moving = False
         self.launch_direction = direction
         self.pegs_in_trajectory = 0
         self.aim_dots = self.get_aim_dots()
 
+    @traced("launch_ball")
     def launch_ball(self):
         self.ball.reset()
         self.balls -= 1
@@ -157,6 +173,7 @@ class Game:
         self.ball.vy = y_dir * LAUNCH_VELOCITY
         self.is_ball_moving = True
 
+    @traced("change_aim")
     def change_aim(self, direction):
         self.launch_direction = direction
         self.aim_dots = self.get_aim_dots()
@@ -182,8 +199,8 @@ class Game:
 
         # Reflect the ball's velocity
         dot_product = self.ball.vx * nx + self.ball.vy * ny
-        self.ball.vx -= 1.9 * dot_product * nx
-        self.ball.vy -= 1.9 * dot_product * ny
+        self.ball.vx -= RESTITUTION * dot_product * nx
+        self.ball.vy -= RESTITUTION * dot_product * ny
         
         # Move the ball outside the peg to prevent sticking
         overlap = self.ball.radius + peg.radius - math.sqrt((self.ball.x - peg.x) ** 2 + (self.ball.y - peg.y) ** 2)
@@ -191,22 +208,24 @@ class Game:
         self.ball.y += ny * overlap
         
         # Remove the peg
-        peg.setCoords(-50, -50) #TODO
+        peg.setCoords(REMOVED_PEG, REMOVED_PEG)
         self.pegs_hit += 1
 
+    @traced("get_num_remaining_pegs")
     def get_num_remaining_pegs(self):
         num_remaining_pegs = len(self.pegs)
         for peg in self.pegs:
-            if peg.getX() == -50 and peg.getY() == -50: #TODO
+            if peg.getX() == REMOVED_PEG and peg.getY() == REMOVED_PEG:
                 num_remaining_pegs -= 1
         return num_remaining_pegs
 
+    @traced("get_aim_dots")
     def get_aim_dots(self):     # Runs the current shot on a copy of the game state to see where the ball will go
         aim_dots = []
 
         num_peg_bounces = 0
 
-        dummy_game = DummyGame(self.pegs, self.launch_direction)
+        dummy_game = DummyGame(self.pegs, self.launch_direction, self.width, self.height, self.ball.radius)
 
         dummy_game.launch_ball()
 
@@ -228,13 +247,25 @@ class PeggleEnv(gym.Env):
 
     metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 10}
 
-    def __init__(self, render_mode=None):
-        self.window_size = WIDTH
+    def __init__(self, render_mode=None, render_resolution=None, width=WIDTH, height=HEIGHT, num_pegs=30,
+                 peg_radius=PEG_RADIUS, ball_radius=BALL_RADIUS, num_balls=10, event_sink=None, balls_per_shot=1,
+                 multiball_spread=0.05):
+        self.width = width
+        self.height = height
+        self.window_size = (width, height)
+
+        self.num_pegs = num_pegs
+        self.peg_radius = peg_radius
+        self.ball_radius = ball_radius
+        self.num_balls = num_balls
 
-        self.num_pegs = 30
+        # Multiball: with balls_per_shot above 1, a fire launches that many balls at once (using up one ball),
+        # fanned out multiball_spread radians apart around the aim direction
+        self.balls_per_shot = balls_per_shot
+        self.multiball_spread = multiball_spread
+        self.multiball = None   # gym_peggle.sim.multiball.MultiBallGame of the shot in flight
 
-        temp_pegs = self.np_random.integers(100, WIDTH - 100, size=(self.num_pegs, 2), dtype=int)
-        self.game = Game(0, temp_pegs, 10, np.pi/2)
+        self.game = self._new_game()
 
         self.total_miss = False
 
@@ -273,6 +304,23 @@ class PeggleEnv(gym.Env):
         self.window = None
         self.clock = None
 
+        # With a render_resolution such as (84, 84), rgb_array frames are drawn by the NumPy rasterizer
+        # at that size instead of through a full-resolution pygame Surface.
+        self.rasterizer = None
+        if render_resolution is not None:
+            self.rasterizer = Rasterizer((self.width, self.height), render_resolution)
+
+        # Optional gym_peggle.events.EventSink that gets a "env_shot" event per fire and an "episode" event per episode
+        self.event_sink = event_sink
+        self.episode_steps = 0
+        self.episode_reward = 0
+        self.episode_start = time.perf_counter()
+        self.episodes = 0
+
+    def _new_game(self):
+        temp_pegs = self.np_random.integers([100, 100], [self.width - 100, self.height - 100], size=(self.num_pegs, 2), dtype=int)
+        return Game(0, temp_pegs, self.num_balls, np.pi/2, self.width, self.height, self.peg_radius, self.ball_radius)
+
     def _get_obs(self):
         # temp_pegs = np.zeros((self.num_pegs, 2), dtype=int)
 
@@ -287,14 +335,89 @@ class PeggleEnv(gym.Env):
             "pegs_hit": self.game.pegs_hit
         }
 
+    @property
+    def state_nbytes(self):
+        return state_nbytes(len(self.game.pegs))
+
+    def get_state(self, out=None):
+        # Writes the game state in the fixed layout of gym_peggle/envs/state.py into `out`, which can be any
+        # writable buffer of at least state_nbytes bytes (bytearray, memoryview, shared memory, ...)
+        if out is None:
+            out = bytearray(self.state_nbytes)
+        game = self.game
+        ball = game.ball
+        alive = [not (peg.getX() == REMOVED_PEG and peg.getY() == REMOVED_PEG) for peg in game.pegs]
+        return pack_state(out, self.total_miss, game.balls, game.pegs_hit, game.pegs_in_trajectory, game.launch_direction,
+                          (ball.x, ball.y, ball.vx, ball.vy), self.np_random, game.peg_coords, alive)
+
+    def set_state(self, buffer):
+        state = unpack_state(buffer)
+        pegs = state["pegs"]
+
+        if self.game is None or len(self.game.pegs) != len(pegs):
+            self.game = Game(0, pegs, self.num_balls, np.pi/2, self.width, self.height, self.peg_radius, self.ball_radius)
+        game = self.game
+        game.peg_coords = np.array(pegs)    # Copied, the buffer may be reused by the caller
+        for i, peg in enumerate(game.pegs):
+            if state["alive"][i]:
+                peg.setCoords(game.peg_coords[i, 0], game.peg_coords[i, 1])
+            else:
+                peg.setCoords(REMOVED_PEG, REMOVED_PEG)
+
+        game.balls = state["balls"]
+        game.pegs_hit = state["pegs_hit"]
+        game.launch_direction = state["launch_direction"]
+        game.ball.x, game.ball.y, game.ball.vx, game.ball.vy = (np.float64(value) for value in state["ball"])
+        self.total_miss = state["total_miss"]
+        unpack_rng(self.np_random, *state["rng"])
+
+        # The aim dots only matter for drawing, so clones that never draw skip re-simulating them
+        if self.render_mode is None and self.rasterizer is None:
+            game.aim_dots = []
+            game.pegs_in_trajectory = state["pegs_in_trajectory"]
+        else:
+            game.aim_dots = game.get_aim_dots()
+
+    def __getstate__(self):
+        # Pickling and deepcopy go through get_state instead of copying Peg objects and pygame handles
+        state = self.__dict__.copy()
+        state["game"] = bytes(self.get_state())
+        state["window"] = None
+        state["clock"] = None
+        state["event_sink"] = None
+        return state
+
+    def __setstate__(self, state):
+        game_state = state.pop("game")
+        self.__dict__.update(state)
+        self.game = None
+        self.set_state(game_state)
+
+    def _level_game(self, level):
+        from gym_peggle.levels import load_level     # Imported here, gym_peggle.levels imports this module
+
+        level = load_level(level)
+        if (level.width, level.height, level.peg_radius, level.ball_radius) != (self.width, self.height, self.peg_radius, self.ball_radius):
+            raise ValueError(f"Level {level.name!r} is {level.width}x{level.height} with peg radius {level.peg_radius} and "
+                             f"ball radius {level.ball_radius}; make the env with the same width, height and radii")
+        return Game(0, np.array(level.pegs), level.balls, np.pi/2, self.width, self.height, self.peg_radius, self.ball_radius)
+
     def reset(self, seed=None, options=None):
         # We need the following line to seed self.np_random
         super().reset(seed=seed)
 
-        temp_pegs = self.np_random.integers(100, WIDTH - 100, size=(self.num_pegs, 2), dtype=int)
-        self.game = Game(0, temp_pegs, 10, np.pi/2)
+        # options={"level": ...} plays a level (name in levels/, JSON path, source dict or CompiledLevel) instead of a random board
+        if options is not None and options.get("level") is not None:
+            self.game = self._level_game(options["level"])
+        else:
+            self.game = self._new_game()
 
         self.total_miss = False
+        self.episode_steps = 0
+        self.episode_reward = 0
+        self.episode_start = time.perf_counter()
+        self.episodes += 1
+        instant("reset", episode=self.episodes)     # Marks where each episode starts in a trace
 
         observation = self._get_obs()
         info = self._get_info()
@@ -304,7 +427,10 @@ class PeggleEnv(gym.Env):
 
         return observation, info
 
+    @traced("step")
     def step(self, action):
+        step_start = time.perf_counter()
+
         if len(action) == 1:
             action_type, aiming_discrete = action[0]
         else:
@@ -357,10 +483,14 @@ class PeggleEnv(gym.Env):
                 reward += 3
                 # print(f"Went for a bounce shot. +3")
 
-            while self.game.ball.in_bounds():
-                self.game.update()
-                if self.render_mode == "human":
-                    self._render_frame()
+            with span("fire_loop"):
+                if self.balls_per_shot > 1:
+                    self._fire_multiball()
+                else:
+                    while self.game.ball.in_bounds():
+                        self.game.update()
+                        if self.render_mode == "human":
+                            self._render_frame()
 
             num_pegs_post_launch = self.game.get_num_remaining_pegs()
 
@@ -371,10 +501,20 @@ class PeggleEnv(gym.Env):
 
             self.game.change_aim(self.game.launch_direction)     # Keep launch direction the same, but update aim dots and pegs_in_trajectory
 
+            if self.event_sink is not None:
+                self.event_sink.emit("env_shot", angle=self.game.launch_direction, pegs_hit=pegs_hit, reward=reward,
+                                     total_miss=self.total_miss, balls=self.game.balls, seconds=time.perf_counter() - step_start)
+
         # An episode is done if the agent runs out of balls or hits all pegs
         terminated = False
-        if (self.game.balls == 0 or self.game.pegs_hit == self.num_pegs):
+        if (self.game.balls == 0 or self.game.pegs_hit == len(self.game.pegs)):
             terminated = True
+
+        self.episode_steps += 1
+        self.episode_reward += reward
+        if terminated and self.event_sink is not None:
+            self.event_sink.emit("episode", pegs_hit=self.game.pegs_hit, steps=self.episode_steps, reward=self.episode_reward,
+                                 seconds=time.perf_counter() - self.episode_start)
         
         observation = self._get_obs()
         info = self._get_info()
@@ -382,19 +522,36 @@ class PeggleEnv(gym.Env):
         return observation, reward, terminated, False, info
 
 
+    def _fire_multiball(self):
+        from gym_peggle.sim.multiball import MultiBallGame     # Imported here, gym_peggle.sim imports this module
+
+        offsets = self.multiball_spread * (np.arange(self.balls_per_shot) - (self.balls_per_shot - 1) / 2)
+        self.multiball = MultiBallGame.from_game(self.game)
+        self.multiball.launch(self.game.launch_direction + offsets)
+        while self.multiball.in_flight():
+            for peg in self.multiball.update():
+                self.game.pegs[peg].setCoords(REMOVED_PEG, REMOVED_PEG)
+                self.game.pegs_hit += 1
+            if self.render_mode == "human":
+                self._render_frame()
+        self.multiball = None
+
     def render(self):
         if self.render_mode == "rgb_array":
+            if self.rasterizer is not None:
+                return self.rasterizer.draw_game(self.game).copy()
             return self._render_frame()
 
+    @traced("_render_frame")
     def _render_frame(self):
         if self.window is None and self.render_mode == "human":
             pygame.init()
             pygame.display.init()
-            self.window = pygame.display.set_mode((self.window_size, self.window_size))
+            self.window = pygame.display.set_mode(self.window_size)
         if self.clock is None and self.render_mode == "human":
             self.clock = pygame.time.Clock()
 
-        canvas = pygame.Surface((self.window_size, self.window_size))
+        canvas = pygame.Surface(self.window_size)
         canvas.fill((0, 0, 0))
 
         # First we draw the ball
@@ -402,12 +559,16 @@ class PeggleEnv(gym.Env):
         ballY = int(self.game.ball.getY())
         ballRadius = int(self.game.ball.getRadius())
         
-        pygame.draw.circle(
-            canvas,
-            (255, 255, 255),
-            (ballX, ballY),
-            ballRadius
-        )
+        if self.multiball is None:
+            pygame.draw.circle(
+                canvas,
+                (255, 255, 255),
+                (ballX, ballY),
+                ballRadius
+            )
+        else:
+            for ballX, ballY in zip(self.multiball.x.astype(int), self.multiball.y.astype(int)):
+                pygame.draw.circle(canvas, (255, 255, 255), (int(ballX), int(ballY)), ballRadius)
 
         # Now we draw the pegs
         for peg in self.game.pegs:
@@ -424,7 +585,7 @@ class PeggleEnv(gym.Env):
 
         # Finally, the aim dots
         for point in self.game.aim_dots:
-            if 0 < point[0] and point[0] < WIDTH and point[1] < HEIGHT:
+            if 0 < point[0] and point[0] < self.width and point[1] < self.height:
                 pygame.draw.circle(canvas, (200, 200, 200), point, 3)
 
         # Show number of balls
@@ -0,0 +1,67 @@
+from gymnasium.spaces import Box
+import numpy as np
+
+from gym_peggle.envs.peggle import PeggleEnv
+from gym_peggle.envs.rasterizer import Rasterizer
+
+
+# PeggleEnv with a stack of the last `frame_stack` downscaled frames as the observation.
+# Every frame is written twice into a buffer of 2 * frame_stack frames, so the latest stack is always
+# one contiguous slice and observations are returned without copying. The returned array is a view
+# that the next step() overwrites; copy it if you need to keep it.
+# get_state appends the frame stack to the PeggleEnv state: fill_stack as one byte, padded to 8 bytes,
+# then the current stack oldest first as uint8[frame_stack, *shape].
+class PegglePixelsEnv(PeggleEnv):
+    def __init__(self, render_mode=None, resolution=(84, 84), frame_stack=4, grayscale=True, **kwargs):
+        super().__init__(render_mode=render_mode, **kwargs)
+
+        self.rasterizer = Rasterizer((self.width, self.height), resolution, grayscale)
+        self.frame_stack = frame_stack
+        self.frames = np.zeros((2 * frame_stack,) + self.rasterizer.shape, dtype=np.uint8)
+        self.frame_index = 0
+        self.fill_stack = True
+
+        self.observation_space = Box(low=0, high=255, shape=(frame_stack,) + self.rasterizer.shape, dtype=np.uint8)
+
+    def _get_obs(self):
+        slot = self.frame_index
+        frame = self.rasterizer.draw_game(self.game, out=self.frames[slot])
+        if self.fill_stack:
+            self.frames[:] = frame      # A fresh episode starts with every slot showing the first frame
+            self.fill_stack = False
+        else:
+            self.frames[slot + self.frame_stack] = frame
+        self.frame_index = (slot + 1) % self.frame_stack
+        return self.frames[slot + 1:slot + 1 + self.frame_stack]
+
+    @property
+    def state_nbytes(self):
+        return PeggleEnv.state_nbytes.fget(self) + 8 + self.frame_stack * self.frames[0].nbytes
+
+    def _stack_view(self, buffer, offset):
+        return np.frombuffer(buffer, dtype=np.uint8, count=8 + self.frame_stack * self.frames[0].nbytes, offset=offset)
+
+    def get_state(self, out=None):
+        if out is None:
+            out = bytearray(self.state_nbytes)
+        offset = PeggleEnv.state_nbytes.fget(self)
+        super().get_state(out)
+        view = self._stack_view(out, offset)
+        view[0] = self.fill_stack
+        stack = self.frames[self.frame_index:self.frame_index + self.frame_stack]
+        view[8:].reshape(stack.shape)[:] = stack
+        return out
+
+    def set_state(self, buffer):
+        super().set_state(buffer)
+        view = self._stack_view(buffer, PeggleEnv.state_nbytes.fget(self))
+        self.fill_stack = bool(view[0])
+        # Restored at frame_index 0 with both halves of the ring holding the stack, as _get_obs keeps them
+        stack = view[8:].reshape((self.frame_stack,) + self.rasterizer.shape)
+        self.frames[:self.frame_stack] = stack
+        self.frames[self.frame_stack:] = stack
+        self.frame_index = 0
+
+    def reset(self, seed=None, options=None):
+        self.fill_stack = True
+        return super().reset(seed=seed, options=options)
@@ -0,0 +1,69 @@
+import numpy as np
+
+BALL_COLOR = (255, 255, 255)
+PEG_COLOR = (255, 0, 0)
+AIM_DOT_COLOR = (200, 200, 200)
+AIM_DOT_RADIUS = 3
+
+
+# Draws the same scene as PeggleEnv._render_frame (minus the ball counter text) straight into a
+# NumPy buffer at a downscaled resolution, without going through pygame.
+class Rasterizer:
+    def __init__(self, world_size, resolution=(84, 84), grayscale=False):
+        self.height, self.width = resolution
+        self.scale_x = self.width / world_size[0]
+        self.scale_y = self.height / world_size[1]
+        self.grayscale = grayscale
+
+        if grayscale:
+            self.shape = (self.height, self.width)
+        else:
+            self.shape = (self.height, self.width, 3)
+        self.frame = np.zeros(self.shape, dtype=np.uint8)
+
+        self.ball_color = self._color(BALL_COLOR)
+        self.peg_color = self._color(PEG_COLOR)
+        self.aim_dot_color = self._color(AIM_DOT_COLOR)
+
+        self.stamps = {}
+
+    def _color(self, rgb):
+        if self.grayscale:
+            return np.uint8(round(0.299 * rgb[0] + 0.587 * rgb[1] + 0.114 * rgb[2]))
+        return np.array(rgb, dtype=np.uint8)
+
+    def _stamp(self, radius):   # Pixel offsets covered by a disc of the given world radius, cached per radius
+        if radius not in self.stamps:
+            rx = radius * self.scale_x
+            ry = radius * self.scale_y
+            dy, dx = np.mgrid[-int(np.ceil(ry)):int(np.ceil(ry)) + 1, -int(np.ceil(rx)):int(np.ceil(rx)) + 1]
+            inside = (dx / max(rx, 1e-9)) ** 2 + (dy / max(ry, 1e-9)) ** 2 <= 1
+            inside[dy.shape[0] // 2, dx.shape[1] // 2] = True     # Always cover the center pixel
+            self.stamps[radius] = (dy[inside], dx[inside])
+        return self.stamps[radius]
+
+    def _draw_discs(self, out, centers, radius, color):
+        if len(centers) == 0:
+            return
+        dy, dx = self._stamp(radius)
+        rows = np.floor(centers[:, 1] * self.scale_y).astype(np.intp)[:, None] + dy
+        cols = np.floor(centers[:, 0] * self.scale_x).astype(np.intp)[:, None] + dx
+        visible = (rows >= 0) & (rows < self.height) & (cols >= 0) & (cols < self.width)
+        out[rows[visible], cols[visible]] = color
+
+    def draw(self, pegs, ball, aim_dots, ball_radius, peg_radius, out=None):
+        if out is None:
+            out = self.frame
+        out.fill(0)
+
+        # Same draw order as _render_frame: ball, pegs, then aim dots
+        self._draw_discs(out, np.asarray([ball], dtype=float), ball_radius, self.ball_color)
+        self._draw_discs(out, np.asarray(pegs, dtype=float).reshape(-1, 2), peg_radius, self.peg_color)
+        self._draw_discs(out, np.asarray(aim_dots, dtype=float).reshape(-1, 2), AIM_DOT_RADIUS, self.aim_dot_color)
+        return out
+
+    def draw_game(self, game, out=None):
+        pegs = [(peg.getX(), peg.getY()) for peg in game.pegs]
+        ball = (game.ball.getX(), game.ball.getY())
+        peg_radius = game.pegs[0].getRadius() if len(game.pegs) > 0 else 0
+        return self.draw(pegs, ball, game.aim_dots, game.ball.getRadius(), peg_radius, out)
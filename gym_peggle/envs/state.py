@@ -0,0 +1,83 @@
+import struct
+
+import numpy as np
+
+# Fixed binary layout of a PeggleEnv state, all little-endian:
+#   header  (see HEADER below, padded to a multiple of 8 bytes)
+#   pegs    float64[num_pegs, 2], original peg positions
+#   alive   uint8[ceil(num_pegs / 8)], np.packbits of the alive mask
+# The RNG is stored as the raw PCG64 state, which is what gymnasium seeds environments with.
+MAGIC = b"PGST"
+VERSION = 1
+
+HEADER = struct.Struct(
+    "<4sH"      # magic, version
+    "B"         # total_miss
+    "x"         # padding
+    "I"         # num_pegs
+    "i"         # balls
+    "i"         # pegs_hit
+    "i"         # pegs_in_trajectory
+    "d"         # launch_direction
+    "4d"        # ball x, y, vx, vy
+    "4Q"        # PCG64 state (high, low) and increment (high, low)
+    "I"         # has_uint32
+    "I"         # uinteger
+)
+HEADER_NBYTES = (HEADER.size + 7) // 8 * 8
+
+MASK_64 = (1 << 64) - 1
+
+
+def state_nbytes(num_pegs):
+    return HEADER_NBYTES + 16 * num_pegs + (num_pegs + 7) // 8
+
+
+def pack_rng(rng):
+    state = rng.bit_generator.state
+    if state["bit_generator"] != "PCG64":
+        raise ValueError(f"Only PCG64 generators can be saved, got {state['bit_generator']}")
+    pcg = state["state"]
+    return (pcg["state"] >> 64, pcg["state"] & MASK_64, pcg["inc"] >> 64, pcg["inc"] & MASK_64,
+            state["has_uint32"], state["uinteger"])
+
+
+def unpack_rng(rng, state_high, state_low, inc_high, inc_low, has_uint32, uinteger):
+    rng.bit_generator.state = {
+        "bit_generator": "PCG64",
+        "state": {"state": (state_high << 64) | state_low, "inc": (inc_high << 64) | inc_low},
+        "has_uint32": has_uint32,
+        "uinteger": uinteger,
+    }
+
+
+def pack_state(out, total_miss, balls, pegs_hit, pegs_in_trajectory, launch_direction, ball, rng, pegs, alive):
+    num_pegs = len(pegs)
+    HEADER.pack_into(out, 0, MAGIC, VERSION, total_miss, num_pegs, balls, pegs_hit, pegs_in_trajectory,
+                     launch_direction, *ball, *pack_rng(rng))
+    np.frombuffer(out, dtype="<f8", count=2 * num_pegs, offset=HEADER_NBYTES).reshape(num_pegs, 2)[:] = pegs
+    alive_offset = HEADER_NBYTES + 16 * num_pegs
+    np.frombuffer(out, dtype=np.uint8, count=(num_pegs + 7) // 8, offset=alive_offset)[:] = np.packbits(alive)
+    return out
+
+
+def unpack_state(buffer):
+    # Returns the header fields plus read-only views of the pegs and alive bits; nothing is copied
+    fields = HEADER.unpack_from(buffer, 0)
+    magic, version, total_miss, num_pegs = fields[:4]
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a version {VERSION} Peggle state")
+
+    pegs = np.frombuffer(buffer, dtype="<f8", count=2 * num_pegs, offset=HEADER_NBYTES).reshape(num_pegs, 2)
+    alive_bits = np.frombuffer(buffer, dtype=np.uint8, count=(num_pegs + 7) // 8, offset=HEADER_NBYTES + 16 * num_pegs)
+    return {
+        "total_miss": bool(total_miss),
+        "balls": fields[4],
+        "pegs_hit": fields[5],
+        "pegs_in_trajectory": fields[6],
+        "launch_direction": fields[7],
+        "ball": fields[8:12],
+        "rng": fields[12:18],
+        "pegs": pegs,
+        "alive": np.unpackbits(alive_bits, count=num_pegs).view(bool),
+    }
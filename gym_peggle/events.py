@@ -0,0 +1,108 @@
+import json
+import sys
+import threading
+import time
+
+import numpy as np
+
+
+def _to_json(value):   # NumPy scalars and arrays show up in events from the simulators
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+# Buffered JSONL writer for shot, game and run events. Events are encoded as they are emitted and written
+# in batches of `batch_size` lines with a single write call. With `flush_interval` set, a background thread
+# also flushes every `flush_interval` seconds, so a quiet run still reaches the file.
+class EventSink:
+    def __init__(self, path, batch_size=1000, flush_interval=None):
+        self.file = open(path, "ab")
+        self.batch_size = batch_size
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.flusher = None
+        if flush_interval is not None:
+            self.flusher = threading.Thread(target=self._flush_periodically, args=(flush_interval,), daemon=True)
+            self.flusher.start()
+
+    def emit(self, event_type, **fields):
+        fields["type"] = event_type
+        fields["time"] = time.time()
+        line = json.dumps(fields, default=_to_json).encode() + b"\n"
+        with self.lock:
+            self.buffer.append(line)
+            if len(self.buffer) >= self.batch_size:
+                self._write()
+
+    def _write(self):
+        if self.buffer:
+            self.file.write(b"".join(self.buffer))
+            self.buffer = []
+
+    def flush(self):
+        with self.lock:
+            self._write()
+            self.file.flush()
+
+    def _flush_periodically(self, interval):
+        while not self.closed.wait(interval):
+            self.flush()
+
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        if self.flusher is not None:
+            self.flusher.join()
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Running count, total, min and max of every numeric field, grouped by event type and mode.
+# Reads one line at a time, so memory stays constant however large the logs are.
+def summarize(paths):
+    groups = {}
+    for path in paths:
+        with open(path, "rb") as file:
+            for line in file:
+                event = json.loads(line)
+                key = (event.get("type"), event.get("mode"))
+                group = groups.setdefault(key, {"count": 0, "fields": {}})
+                group["count"] += 1
+                for name, value in event.items():
+                    if name == "time" or not isinstance(value, (int, float)):     # Booleans count as 0/1, so their mean is a rate
+                        continue
+                    stats = group["fields"].get(name)
+                    if stats is None:
+                        group["fields"][name] = [1, value, value, value]
+                    else:
+                        stats[0] += 1
+                        stats[1] += value
+                        stats[2] = min(stats[2], value)
+                        stats[3] = max(stats[3], value)
+    return groups
+
+
+def print_summary(groups):
+    for (event_type, mode), group in sorted(groups.items(), key=lambda item: (str(item[0][0]), str(item[0][1]))):
+        title = event_type if mode is None else f"{event_type} ({mode})"
+        print(f"{title}: {group['count']} events")
+        for name, (count, total, low, high) in sorted(group["fields"].items()):
+            print(f"    {name:>20}: mean {total / count:12.4f}  min {low:12.4f}  max {high:12.4f}  total {total:14.4f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m gym_peggle.events <events.jsonl> [more.jsonl ...]")
+        sys.exit(1)
+    print_summary(summarize(sys.argv[1:]))
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+
+from gym_peggle.envs.peggle import (WIDTH, HEIGHT, PEG_RADIUS, BALL_RADIUS, GRAVITY, LAUNCH_VELOCITY, BALL_Y_START,
+                                    RESTITUTION, WALL_DAMPING)
+from gym_peggle.sim.batch import BatchSimulator
+from gym_peggle.sim.freeflight import CACHE_DIR, DEFAULT_ANGLES, FirstContactIndex, FreeFlightTable
+
+FORMAT_VERSION = 2
+LEVEL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "levels")
+ARRAYS = ("pegs", "angles", "first_peg", "first_tick", "scores")
+
+# Source format (JSON):
+#   {"name": "diamond", "balls": 10, "pegs": [[x, y], ...]}
+# plus optional "width", "height", "peg_radius" and "ball_radius", which default to the game's constants.
+
+
+def load_source(source):
+    # A source dict from a dict, a path to a JSON file, or the name of a file in levels/
+    if isinstance(source, dict):
+        level = dict(source)
+    else:
+        path = source if os.path.exists(source) else os.path.join(LEVEL_DIR, f"{source}.json")
+        with open(path) as file:
+            level = json.load(file)
+        level.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+
+    level.setdefault("width", WIDTH)
+    level.setdefault("height", HEIGHT)
+    level.setdefault("balls", 10)
+    level.setdefault("peg_radius", PEG_RADIUS)
+    level.setdefault("ball_radius", BALL_RADIUS)
+    pegs = np.asarray(level.get("pegs", []), dtype=float).reshape(-1, 2)
+    inside = ((pegs[:, 0] >= 0) & (pegs[:, 0] <= level["width"]) & (pegs[:, 1] >= 0) & (pegs[:, 1] <= level["height"]))
+    if not inside.all():
+        raise ValueError(f"Level {level.get('name')!r} has pegs outside its {level['width']}x{level['height']} board")
+    level["pegs"] = pegs.tolist()
+    return level
+
+
+def content_hash(level, angles):
+    # Everything a compiled artifact depends on: the level (board size and radii included), the angle grid,
+    # every physics constant the simulator reads and the format. The ball starts at width // 2, from the level.
+    physics = (GRAVITY, LAUNCH_VELOCITY, BALL_Y_START, RESTITUTION, WALL_DAMPING, FORMAT_VERSION)
+    digest = hashlib.sha256(json.dumps(level, sort_keys=True).encode())
+    digest.update(repr(physics).encode())
+    digest.update(np.asarray(angles, dtype=float).tobytes())
+    return digest.hexdigest()[:16]
+
+
+# A level compiled for instant loading. The arrays are memory-mapped from the artifact directory:
+#   pegs        float64 (num_pegs, 2)
+#   angles, first_peg, first_tick, scores: first contact and pegs hit for every angle on the full board
+class CompiledLevel:
+    def __init__(self, path, meta):
+        self.path = path
+        self.key = meta["key"]
+        self.name = meta["name"]
+        self.width = meta["width"]
+        self.height = meta["height"]
+        self.balls = meta["balls"]
+        self.peg_radius = meta["peg_radius"]
+        self.ball_radius = meta["ball_radius"]
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+
+    def simulator(self, **kwargs):
+        return BatchSimulator(width=self.width, height=self.height, ball_radius=self.ball_radius,
+                              peg_radius=self.peg_radius, **kwargs)
+
+    def first_contact_index(self, table):
+        # FirstContactIndex of the full board from the stored first contacts, without comparing any paths
+        if not np.array_equal(table.angles, self.angles):
+            raise ValueError(f"Level {self.name!r} was compiled for another angle grid than the table's")
+        return FirstContactIndex(table, self.pegs, np.ones(len(self.pegs), dtype=bool), self.peg_radius,
+                                 contacts=(self.first_peg, self.first_tick))
+
+    def best_opening_shot(self):
+        # (angle, pegs hit) of the best first shot, ties to the lowest angle like the perfect strategy
+        best = int(np.argmax(self.scores))
+        return float(self.angles[best]), int(self.scores[best])
+
+
+def _build(level, angles):
+    pegs = np.asarray(level["pegs"], dtype=float).reshape(-1, 2)
+
+    simulator = BatchSimulator(width=level["width"], height=level["height"], ball_radius=level["ball_radius"],
+                               peg_radius=level["peg_radius"])
+    index = FirstContactIndex(FreeFlightTable(simulator, angles), pegs, np.ones(len(pegs), dtype=bool))
+    scores, _ = index.scores()
+
+    arrays = {"pegs": pegs, "angles": np.asarray(angles, dtype=float),
+              "first_peg": index.first_peg.astype(np.int64), "first_tick": index.first_tick.astype(np.int64),
+              "scores": scores.astype(np.int64)}
+    return arrays
+
+
+def compile_level(source, cache_dir=CACHE_DIR, angles=DEFAULT_ANGLES):
+    # Loads the artifact for a level source, compiling it first if its content hash has no artifact yet
+    level = load_source(source)
+    key = content_hash(level, angles)
+    path = os.path.join(cache_dir, f"level-{key}")
+
+    meta_path = os.path.join(path, "meta.json")
+    if os.path.exists(meta_path):
+        with open(meta_path) as file:
+            meta = json.load(file)
+        if meta.get("key") == key and meta.get("version") == FORMAT_VERSION:
+            return CompiledLevel(path, meta)
+        shutil.rmtree(path)     # Left over from another format version
+
+    arrays = _build(level, angles)
+    meta = {"key": key, "version": FORMAT_VERSION, "name": level.get("name", key), "width": level["width"],
+            "height": level["height"], "balls": level["balls"], "peg_radius": level["peg_radius"],
+            "ball_radius": level["ball_radius"]}
+
+    # Written to a temporary directory and renamed, so a reader never sees a half-written artifact
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(temp_path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(temp_path, f"{name}.npy"), array)
+    with open(os.path.join(temp_path, "meta.json"), "w") as file:
+        json.dump(meta, file)
+    try:
+        os.replace(temp_path, path)
+    except OSError:
+        shutil.rmtree(temp_path)    # Another process compiled the same level first
+    return CompiledLevel(path, meta)
+
+
+def load_level(level, cache_dir=CACHE_DIR):
+    # A CompiledLevel from a CompiledLevel, a source dict, a JSON path or a level name
+    if isinstance(level, CompiledLevel):
+        return level
+    return compile_level(level, cache_dir)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m gym_peggle.levels <level.json | name> [...]")
+        sys.exit(1)
+    for source in sys.argv[1:]:
+        compiled = compile_level(source)
+        angle, pegs_hit = compiled.best_opening_shot()
+        print(f"{compiled.name}: {len(compiled.pegs)} pegs, {compiled.width}x{compiled.height}, {compiled.balls} balls, "
+              f"best opening shot {angle:.3f} hits {pegs_hit} -> {compiled.path}")
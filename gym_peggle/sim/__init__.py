@@ -0,0 +1,9 @@
+from gym_peggle.sim.batch import BatchSimulator
+from gym_peggle.sim.pool import SweepPool
+from gym_peggle.sim.freeflight import FreeFlightTable, FirstContactIndex
+from gym_peggle.sim.robust import RobustScorer
+from gym_peggle.sim.symmetry import ShotOutcomeCache, canonical_board, mirror_board, mirror_angles
+from gym_peggle.sim.multiball import MultiBallGame
+from gym_peggle.sim.moving import DynamicGrid, MovingPegGame, MovingPegs
+from gym_peggle.sim.persistent import PersistentShotCache
+from gym_peggle.sim.bounce_graph import BounceGraph
@@ -0,0 +1,207 @@
+import copy
+
+import numpy as np
+
+from gym_peggle.envs.peggle import (
+    WIDTH,
+    HEIGHT,
+    GRAVITY,
+    BALL_RADIUS,
+    LAUNCH_VELOCITY,
+    PEG_RADIUS,
+    BALL_Y_START,
+    RESTITUTION,
+    WALL_DAMPING,
+    REMOVED_PEG,
+)
+from gym_peggle.sim.reachability import ReachabilityBounds
+
+PRUNE_INTERVAL = 8  # Steps between reachability checks; checking every step costs more than it saves
+
+# Ticks per simulator step. Above 1, a step advances the ball that many ticks of free flight at once and
+# only checks walls and pegs at the end, so fast balls can pass through pegs and walls are hit late.
+QUALITY_LEVELS = {"exact": 1, "fast": 2, "coarse": 4}
+
+
+# Simulates many launch angles at once with NumPy, one array lane per angle. Each tick does the
+# same float64 operations in the same order as Ball.update and Game.update, so a lane follows the
+# same path the scalar game would. Only a timestep of 1 is exact; larger ones are cheaper
+# approximations for ranking shots.
+class BatchSimulator:
+    def __init__(self, width=WIDTH, height=HEIGHT, ball_radius=BALL_RADIUS, peg_radius=PEG_RADIUS,
+                 gravity=GRAVITY, launch_velocity=LAUNCH_VELOCITY, start=None, chunk_size=1 << 20, timestep=1):
+        self.width = width
+        self.height = height
+        self.ball_radius = ball_radius
+        self.peg_radius = peg_radius
+        self.gravity = gravity
+        self.launch_velocity = launch_velocity
+        self.start = (width // 2, BALL_Y_START) if start is None else start
+        self.chunk_size = chunk_size    # Upper bound on angles * pegs handled per tick, to cap memory
+        self.timestep = timestep        # Ticks per step, see QUALITY_LEVELS
+
+    @classmethod
+    def from_game(cls, game, **kwargs):
+        ball = game.ball
+        peg_radius = game.pegs[0].getRadius() if len(game.pegs) > 0 else PEG_RADIUS
+        return cls(
+            width=getattr(game, "width", WIDTH),
+            height=getattr(game, "height", HEIGHT),
+            ball_radius=ball.getRadius(),
+            peg_radius=peg_radius,
+            start=(getattr(ball, "start_x", WIDTH // 2), getattr(ball, "start_y", BALL_Y_START)),
+            **kwargs,
+        )
+
+    def with_quality(self, quality):
+        # Copy of this simulator at a QUALITY_LEVELS name or a timestep in ticks
+        simulator = copy.copy(self)
+        simulator.timestep = QUALITY_LEVELS[quality] if isinstance(quality, str) else int(quality)
+        return simulator
+
+    @staticmethod
+    def board_arrays(game):     # (pegs, alive) arrays for a Game whose removed pegs sit at (REMOVED_PEG, REMOVED_PEG)
+        pegs = np.array([(peg.getX(), peg.getY()) for peg in game.pegs], dtype=float).reshape(-1, 2)
+        alive = ~((pegs[:, 0] == REMOVED_PEG) & (pegs[:, 1] == REMOVED_PEG))
+        return pegs, alive
+
+    def launch(self, angles, velocities=None):
+        angles = np.asarray(angles, dtype=float)
+        speed = self.launch_velocity if velocities is None else np.asarray(velocities, dtype=float)
+        x = np.full(angles.shape, self.start[0], dtype=float)
+        y = np.full(angles.shape, self.start[1], dtype=float)
+        vx = np.cos(angles) * speed
+        vy = np.sin(angles) * speed
+        return x, y, vx, vy
+
+    def move(self, x, y, vx, vy):   # Ball.update for every lane, in place
+        if self.timestep == 1:
+            x += vx
+            y += vy
+            vy += self.gravity
+        else:
+            # `timestep` ticks of free flight in closed form
+            steps = self.timestep
+            x += vx * steps
+            y += vy * steps + self.gravity * (steps * (steps - 1) / 2)
+            vy += self.gravity * steps
+
+        right = x > self.width - self.ball_radius
+        x[right] = self.width - self.ball_radius
+        vx[right] *= -WALL_DAMPING
+        left = x < 0 + self.ball_radius
+        x[left] = 0 + self.ball_radius
+        vx[left] *= -WALL_DAMPING
+
+    def first_colliding(self, x, y, peg_x, peg_y):
+        # Index into peg_x/peg_y of the first peg each lane collides with, or -1. Matches the scan order of Game.update.
+        distance = np.sqrt((peg_x[None, :] - x[:, None]) ** 2 + (peg_y[None, :] - y[:, None]) ** 2)
+        colliding = distance < (self.peg_radius + self.ball_radius)
+        first = np.argmax(colliding, axis=1)
+        return np.where(colliding[np.arange(len(x)), first], first, -1)
+
+    def first_contacts(self, pegs, alive, angles):
+        # For every angle, the index of the first peg the ball touches and the tick it happens on (-1, -1 if it hits nothing)
+        pegs = np.asarray(pegs, dtype=float).reshape(-1, 2)
+        angles = np.asarray(angles, dtype=float)
+        contact_peg = np.full(angles.shape, -1, dtype=np.intp)
+        contact_tick = np.full(angles.shape, -1, dtype=np.intp)
+
+        alive_index = np.flatnonzero(alive)
+        if len(alive_index) == 0 or len(angles) == 0:
+            return contact_peg, contact_tick
+        peg_x = pegs[alive_index, 0]
+        peg_y = pegs[alive_index, 1]
+
+        step = max(1, self.chunk_size // len(alive_index))
+        for begin in range(0, len(angles), step):
+            lanes = np.arange(begin, min(begin + step, len(angles)))
+            x, y, vx, vy = self.launch(angles[lanes])
+            tick = self.timestep - 1
+            while len(lanes) > 0:
+                self.move(x, y, vx, vy)
+                hit = self.first_colliding(x, y, peg_x, peg_y)
+                touched = hit >= 0
+                contact_peg[lanes[touched]] = alive_index[hit[touched]]
+                contact_tick[lanes[touched]] = tick
+
+                flying = ~touched & (y < self.height)
+                lanes, x, y, vx, vy = lanes[flying], x[flying], y[flying], vx[flying], vy[flying]
+                tick += self.timestep
+
+        return contact_peg, contact_tick
+
+    def bounce(self, x, y, vx, vy, peg_x, peg_y):    # Game.handle_collision for every lane, in place
+        nx = x - peg_x
+        ny = y - peg_y
+        norm = np.sqrt(nx ** 2 + ny ** 2)
+        nx /= norm
+        ny /= norm
+
+        dot_product = vx * nx + vy * ny
+        vx -= RESTITUTION * dot_product * nx
+        vy -= RESTITUTION * dot_product * ny
+
+        overlap = self.ball_radius + self.peg_radius - np.sqrt((x - peg_x) ** 2 + (y - peg_y) ** 2)
+        x += nx * overlap
+        y += ny * overlap
+
+    def reachability(self, pegs, alive):
+        return ReachabilityBounds(pegs, alive, self.width, self.peg_radius + self.ball_radius, self.gravity)
+
+    def scores(self, pegs, alive, angles, velocities=None, prune=True):
+        # Pegs hit by each shot until the ball leaves the board (what get_shot_score returns), and the
+        # ticks simulated for each shot (a multiple of the timestep). Every lane removes the pegs it hits
+        # from its own copy of the board. With prune, a lane stops once it cannot reach any peg; scores are unchanged.
+        pegs = np.asarray(pegs, dtype=float).reshape(-1, 2)
+        angles = np.asarray(angles, dtype=float)
+        pegs_hit = np.zeros(angles.shape, dtype=np.intp)
+        ticks = np.zeros(angles.shape, dtype=np.intp)
+
+        alive_index = np.flatnonzero(alive)
+        if len(angles) == 0:
+            return pegs_hit, ticks
+        peg_x = pegs[alive_index, 0]
+        peg_y = pegs[alive_index, 1]
+        bounds = self.reachability(pegs, alive) if prune else None
+        if velocities is not None:
+            velocities = np.broadcast_to(np.asarray(velocities, dtype=float), angles.shape)
+
+        step = max(1, self.chunk_size // max(1, len(alive_index)))
+        for begin in range(0, len(angles), step):
+            lanes = np.arange(begin, min(begin + step, len(angles)))
+            x, y, vx, vy = self.launch(angles[lanes], None if velocities is None else velocities[lanes])
+            lane_alive = np.ones((len(lanes), len(alive_index)), dtype=bool)
+            self.advance(peg_x, peg_y, lanes, x, y, vx, vy, lane_alive, pegs_hit, ticks, bounds)
+
+        return pegs_hit, ticks
+
+    def advance(self, peg_x, peg_y, lanes, x, y, vx, vy, lane_alive, pegs_hit, ticks, bounds=None):
+        # Runs the given lanes until every ball has left the board, adding to pegs_hit and ticks (indexed by lane).
+        # lane_alive[i, j] says whether peg j of peg_x/peg_y is still on lane i's board. With ReachabilityBounds
+        # for the board, lanes also stop once they cannot reach a peg (pegs a lane removed still count, which is safe).
+        step = 0
+        while len(lanes) > 0:
+            self.move(x, y, vx, vy)
+            ticks[lanes] += self.timestep
+
+            if len(peg_x) > 0:
+                distance = np.sqrt((peg_x[None, :] - x[:, None]) ** 2 + (peg_y[None, :] - y[:, None]) ** 2)
+                colliding = (distance < (self.peg_radius + self.ball_radius)) & lane_alive
+                first = np.argmax(colliding, axis=1)
+                touched = np.flatnonzero(colliding[np.arange(len(lanes)), first])
+                if len(touched) > 0:
+                    hit = first[touched]
+                    bx, by, bvx, bvy = x[touched], y[touched], vx[touched], vy[touched]
+                    self.bounce(bx, by, bvx, bvy, peg_x[hit], peg_y[hit])
+                    x[touched], y[touched], vx[touched], vy[touched] = bx, by, bvx, bvy
+                    lane_alive[touched, hit] = False
+                    pegs_hit[lanes[touched]] += 1
+
+            flying = y < self.height
+            step += 1
+            if bounds is not None and step % PRUNE_INTERVAL == 0:
+                flying &= ~bounds.hopeless_lanes(x, y, vx, vy)
+            if not flying.all():
+                lanes, x, y, vx, vy = lanes[flying], x[flying], y[flying], vx[flying], vy[flying]
+                lane_alive = lane_alive[flying]
@@ -0,0 +1,169 @@
+import numpy as np
+
+from gym_peggle.envs.peggle import WALL_DAMPING
+from gym_peggle.sim.freeflight import FirstContactIndex
+
+MARGIN = 1.0    # Pixels of slack on every bound, so float rounding never drops a real bounce
+
+
+# Directed graph over the pegs of a board: edge a -> b says some grid shot whose first contact is peg a may touch
+# peg b next. It is built from the exact states the FirstContactIndex gives right after each first bounce, so
+# only outgoing velocities the board can actually produce off a count. Edges are necessary conditions: every
+# real (first, second) pair of a grid shot is an edge, and candidates are verified by simulation.
+#
+# Between the first bounce and the next peg the ball is in free flight, which is a parabola in ticks between
+# wall hits (the discrete positions lie on it exactly, with vy shifted by g / 2). A peg can only be touched
+# during the ticks the ball is within reach of it horizontally, and only if the ball's height over those ticks
+# comes within reach of it too. touches[angle, peg] holds that test for every grid angle.
+class BounceGraph:
+    def __init__(self, index):
+        self.index = index
+        self.simulator = index.simulator
+        self.pegs = index.pegs
+        self.reach = index.peg_radius + self.simulator.ball_radius
+        self.touches = np.zeros((len(index.table.angles), len(self.pegs)), dtype=bool)
+        self._compute(np.flatnonzero(index.first_peg >= 0))
+        self._update_edges()
+
+    @classmethod
+    def from_game(cls, table, game):
+        return cls(FirstContactIndex.from_game(table, game))
+
+    @property
+    def alive(self):
+        return self.index.alive
+
+    def _first_bounce(self, angle_indices):
+        # State of the ball right after its first bounce, for grid angles that touch a peg
+        first = self.index.first_peg[angle_indices]
+        tick = self.index.first_tick[angle_indices]
+        x, y, vx, vy = (np.array(self.index.table.states[i][angle_indices, tick]) for i in range(4))
+        self.simulator.bounce(x, y, vx, vy, self.pegs[first, 0], self.pegs[first, 1])
+        return first, x, y, vx, vy
+
+    def _compute(self, angle_indices):
+        self.touches[angle_indices] = False
+        if len(angle_indices) == 0:
+            return
+        first, x, y, vx, vy = self._first_bounce(angle_indices)
+
+        sim = self.simulator
+        gravity = sim.gravity
+        left_wall, right_wall = sim.ball_radius, sim.width - sim.ball_radius
+        peg_x, peg_y = self.pegs[:, 0], self.pegs[:, 1]
+        reach = self.reach + MARGIN
+        touches = np.zeros((len(angle_indices), len(self.pegs)), dtype=bool)
+        lanes = np.arange(len(angle_indices))
+        while len(lanes) > 0:
+            # One free-flight segment per lane: y(n) = y + b n + g n^2 / 2 and x(n) = x + vx n, until the ball
+            # leaves the bottom (one tick of slack) or passes a wall
+            b = vy - gravity / 2
+            exit_tick = (-b + np.sqrt(b ** 2 + 2 * gravity * np.maximum(sim.height - y, 0))) / gravity + 1
+            with np.errstate(divide="ignore", invalid="ignore"):
+                wall_tick = np.where(vx > 0, np.floor((right_wall - x) / vx) + 1,
+                                     np.where(vx < 0, np.floor((left_wall - x) / vx) + 1, np.inf))
+            end = np.minimum(exit_tick, wall_tick)
+
+            # Ticks within reach of each peg horizontally, clipped to the segment
+            moving = vx != 0
+            speed = np.where(moving, vx, 1)[:, None]
+            low = (peg_x[None, :] - x[:, None] - np.sign(speed) * reach) / speed
+            high = (peg_x[None, :] - x[:, None] + np.sign(speed) * reach) / speed
+            still = ~moving[:, None] & (np.abs(peg_x[None, :] - x[:, None]) <= reach)
+            low = np.where(moving[:, None], np.maximum(low, 0), np.where(still, 0, np.inf))
+            high = np.where(moving[:, None], np.minimum(high, end[:, None]), np.where(still, end[:, None], -np.inf))
+            inside = low <= high
+
+            # Height range over those ticks: the parabola is convex, so its lowest y is at the apex or an end
+            low, high = np.where(inside, low, 0), np.where(inside, high, 0)
+            apex = np.clip((-b / gravity)[:, None], low, high)
+            height = lambda n: y[:, None] + b[:, None] * n + gravity * n ** 2 / 2
+            top, bottom = height(apex), np.maximum(height(low), height(high))
+            touches[lanes] |= inside & (top <= peg_y[None, :] + reach) & (bottom >= peg_y[None, :] - reach)
+
+            # Lanes that reach a wall first continue from it with vx damped and reversed, like Ball.update
+            walled = wall_tick < exit_tick - 1
+            n = wall_tick[walled]
+            lanes, b, vx, vy, y = lanes[walled], b[walled], vx[walled], vy[walled], y[walled]
+            x = np.where(vx > 0, right_wall, left_wall)
+            y = y + b * n + gravity * n ** 2 / 2
+            vy = vy + gravity * n
+            vx = -WALL_DAMPING * vx
+
+        touches[np.arange(len(angle_indices)), first] = False
+        touches &= self.alive[None, :]
+        self.touches[angle_indices] = touches
+
+    def _update_edges(self):
+        hits = np.flatnonzero(self.index.first_peg >= 0)
+        self.edges = np.zeros((len(self.pegs), len(self.pegs)), dtype=bool)
+        np.logical_or.at(self.edges, self.index.first_peg[hits], self.touches[hits])
+
+    def remove_peg(self, peg):
+        # Removes the peg from the FirstContactIndex too. Only the angles that touched it first get a new first
+        # bounce; every other angle only loses the peg as a candidate.
+        stale = np.flatnonzero(self.index.first_peg == peg)
+        self.index.remove_peg(peg)
+        self.touches[:, peg] = False
+        self._compute(stale[self.index.first_peg[stale] >= 0])
+        self.touches[stale[self.index.first_peg[stale] < 0]] = False
+        self._update_edges()
+
+    def update_alive(self, alive):
+        for peg in np.flatnonzero(self.alive & ~np.asarray(alive, dtype=bool)):
+            self.remove_peg(peg)
+
+    def successors(self, peg):
+        return np.flatnonzero(self.edges[peg])
+
+    def predecessors(self, peg):
+        return np.flatnonzero(self.edges[:, peg])
+
+    def pairs(self):
+        # Candidate (first angle, last angle, (first peg, second peg)) for every run of grid angles with the same
+        # first contact and every peg some angle of the run may touch second
+        first_peg = self.index.first_peg
+        change = np.flatnonzero(np.diff(first_peg)) + 1
+        for begin, end in zip(np.r_[0, change], np.r_[change, len(first_peg)]):
+            if first_peg[begin] < 0:
+                continue
+            for second in np.flatnonzero(self.touches[begin:end].any(axis=0)).tolist():
+                yield float(self.index.table.angles[begin]), float(self.index.table.angles[end - 1]), (int(first_peg[begin]), second)
+
+    def candidates(self, target=None):
+        # Grid angle indices that may touch a second peg (or `target` second)
+        if target is None:
+            return np.flatnonzero(self.touches.any(axis=1))
+        return np.flatnonzero(self.touches[:, target])
+
+    def second_contacts(self, angle_indices):
+        # Second peg each grid angle touches, or -1, by simulating from the first bounce to the second contact
+        angle_indices = np.asarray(angle_indices)
+        second = np.full(len(angle_indices), -1, dtype=np.intp)
+        if len(angle_indices) == 0:
+            return second
+        first, x, y, vx, vy = self._first_bounce(angle_indices)
+
+        alive_index = np.flatnonzero(self.alive)
+        peg_x, peg_y = self.pegs[alive_index, 0], self.pegs[alive_index, 1]
+        lanes = np.arange(len(angle_indices))
+        while len(lanes) > 0:
+            self.simulator.move(x, y, vx, vy)
+            distance = np.sqrt((peg_x[None, :] - x[:, None]) ** 2 + (peg_y[None, :] - y[:, None]) ** 2)
+            colliding = (distance < self.reach) & (alive_index[None, :] != first[lanes, None])
+            hit = np.argmax(colliding, axis=1)
+            touched = colliding[np.arange(len(lanes)), hit]
+            second[lanes[touched]] = alive_index[hit[touched]]
+
+            flying = ~touched & (y < self.simulator.height)
+            lanes, x, y, vx, vy = lanes[flying], x[flying], y[flying], vx[flying], vy[flying]
+        return second
+
+    def bounce_shots(self, target=None):
+        # (angles, first pegs, second pegs) of every grid shot that touches two pegs (the second being
+        # `target` if given), simulating only the candidate angles
+        candidates = self.candidates(target)
+        second = self.second_contacts(candidates)
+        found = second >= 0 if target is None else second == target
+        angles = candidates[found]
+        return self.index.table.angles[angles], self.index.first_peg[angles], second[found]
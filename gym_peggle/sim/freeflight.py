@@ -0,0 +1,209 @@
+import hashlib
+import os
+
+import numpy as np
+
+from gym_peggle.envs.peggle import WALL_DAMPING
+from gym_peggle.sim.batch import BatchSimulator
+
+DEFAULT_ANGLES = np.arange(0, 3142) / 1000      # The grid the perfect strategy sweeps
+CACHE_DIR = os.environ.get("GYM_PEGGLE_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "gym_peggle"))
+
+
+# The path of a ball launched at every angle of a grid onto an empty board, tick by tick, until it drops
+# out of the bottom. It depends only on the physics, so it is built once per configuration and cached on
+# disk. states[:, a, t] is (x, y, vx, vy) after tick t, bit-identical to what Ball.update produces.
+class FreeFlightTable:
+    def __init__(self, simulator=None, angles=DEFAULT_ANGLES, cache_dir=CACHE_DIR):
+        self.simulator = BatchSimulator() if simulator is None else simulator
+        if self.simulator.timestep != 1:
+            raise ValueError("FreeFlightTable needs an exact (timestep 1) simulator")
+        self.angles = np.asarray(angles, dtype=float)
+        self.key = self.physics_key()
+
+        path = None if cache_dir is None else os.path.join(cache_dir, f"freeflight-{self.key}")
+        if path is not None and os.path.exists(path + ".states.npy") and os.path.exists(path + ".lengths.npy"):
+            self.states = np.load(path + ".states.npy", mmap_mode="r")
+            self.lengths = np.load(path + ".lengths.npy")
+        else:
+            self.states, self.lengths = self.build()
+            if path is not None:
+                self.save(path)
+
+        # Bounding box of every path, used to skip pegs a path never comes near
+        valid = np.arange(self.states.shape[2])[None, :] < self.lengths[:, None]
+        x = np.where(valid, self.states[0], np.nan)
+        y = np.where(valid, self.states[1], np.nan)
+        self.bounds = np.stack([np.nanmin(x, axis=1), np.nanmax(x, axis=1), np.nanmin(y, axis=1), np.nanmax(y, axis=1)])
+
+    def physics_key(self):
+        sim = self.simulator
+        config = repr((sim.width, sim.height, sim.ball_radius, sim.gravity, sim.launch_velocity, tuple(sim.start), WALL_DAMPING))
+        digest = hashlib.sha256(config.encode())
+        digest.update(self.angles.tobytes())
+        return digest.hexdigest()[:16]
+
+    def build(self):
+        x, y, vx, vy = self.simulator.launch(self.angles)
+        lengths = np.zeros(len(self.angles), dtype=np.intp)
+        ticks = []
+        while (lengths == 0).any():
+            self.simulator.move(x, y, vx, vy)
+            ticks.append(np.stack([x, y, vx, vy]))
+            lengths[(lengths == 0) & (y >= self.simulator.height)] = len(ticks)
+        return np.stack(ticks, axis=2), lengths
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        for suffix, array in ((".states.npy", self.states), (".lengths.npy", self.lengths)):
+            temp_path = f"{path}.{os.getpid()}.tmp.npy"
+            np.save(temp_path, array)
+            os.replace(temp_path, path + suffix)    # Concurrent builders never see a half-written file
+
+    def grid_indices(self, angles):
+        # Indices of `angles` on the table's grid, or None if any of them is not a grid angle
+        angles = np.asarray(angles, dtype=float)
+        indices = np.minimum(np.searchsorted(self.angles, angles), len(self.angles) - 1)
+        if not np.array_equal(self.angles[indices], angles):
+            return None
+        return indices
+
+    def angle_indices(self, angles):
+        indices = self.grid_indices(angles)
+        if indices is None:
+            raise ValueError("Angles must be on the table's angle grid")
+        return indices
+
+
+# First peg contact for every angle of a FreeFlightTable on one board. Until the first contact the ball is
+# in free flight, so each angle's first contact comes from comparing its stored path against the pegs, and
+# the angle grid splits into runs (intervals) in which the same peg is hit first. Scoring a shot starts the
+# simulation at that first bounce instead of at the launch.
+class FirstContactIndex:
+    def __init__(self, table, pegs, alive, peg_radius=None, pair_chunk=1 << 16, contacts=None):
+        self.table = table
+        self.simulator = table.simulator
+        self.pegs = np.array(pegs, dtype=float).reshape(-1, 2)
+        self.alive = np.array(alive, dtype=bool)
+        self.peg_radius = self.simulator.peg_radius if peg_radius is None else peg_radius
+        self.pair_chunk = pair_chunk    # Angle-peg pairs compared against the stored paths at once
+
+        if contacts is not None:    # (first_peg, first_tick) already known for this board, e.g. from a compiled level
+            self.first_peg = np.array(contacts[0], dtype=np.intp)
+            self.first_tick = np.array(contacts[1], dtype=np.intp)
+        else:
+            self.first_peg = np.full(len(table.angles), -1, dtype=np.intp)
+            self.first_tick = np.full(len(table.angles), -1, dtype=np.intp)
+            self._compute(np.arange(len(table.angles)))
+
+    @classmethod
+    def from_game(cls, table, game):
+        pegs, alive = BatchSimulator.board_arrays(game)
+        return cls(table, pegs, alive)
+
+    def _compute(self, angle_indices):
+        self.first_peg[angle_indices] = -1
+        self.first_tick[angle_indices] = -1
+        alive_index = np.flatnonzero(self.alive)
+        if len(alive_index) == 0 or len(angle_indices) == 0:
+            return
+
+        reach = self.peg_radius + self.simulator.ball_radius
+        peg_x = self.pegs[alive_index, 0]
+        peg_y = self.pegs[alive_index, 1]
+        bounds = self.table.bounds[:, angle_indices]
+        near = ((peg_x[None, :] > bounds[0][:, None] - reach) & (peg_x[None, :] < bounds[1][:, None] + reach)
+                & (peg_y[None, :] > bounds[2][:, None] - reach) & (peg_y[None, :] < bounds[3][:, None] + reach))
+        pair_angle, pair_peg = np.nonzero(near)
+        if len(pair_angle) == 0:
+            return
+
+        states = self.table.states
+        steps = np.arange(states.shape[2])
+        contact_angle, contact_peg, contact_tick = [], [], []
+        for begin in range(0, len(pair_angle), self.pair_chunk):
+            angles = angle_indices[pair_angle[begin:begin + self.pair_chunk]]
+            pegs = pair_peg[begin:begin + self.pair_chunk]
+            distance = np.sqrt((peg_x[pegs][:, None] - states[0][angles]) ** 2 + (peg_y[pegs][:, None] - states[1][angles]) ** 2)
+            touching = (distance < reach) & (steps[None, :] < self.table.lengths[angles][:, None])
+            tick = np.argmax(touching, axis=1)
+            touched = touching[np.arange(len(tick)), tick]
+            contact_angle.append(angles[touched])
+            contact_peg.append(alive_index[pegs[touched]])
+            contact_tick.append(tick[touched])
+
+        contact_angle = np.concatenate(contact_angle)
+        if len(contact_angle) == 0:
+            return
+        contact_peg = np.concatenate(contact_peg)
+        contact_tick = np.concatenate(contact_tick)
+        # Earliest tick wins, and on the same tick the lowest peg index, like the scan in Game.update
+        order = np.lexsort((contact_peg, contact_tick, contact_angle))
+        first = order[np.r_[True, contact_angle[order][1:] != contact_angle[order][:-1]]]
+        self.first_peg[contact_angle[first]] = contact_peg[first]
+        self.first_tick[contact_angle[first]] = contact_tick[first]
+
+    def remove_peg(self, peg):
+        # Only the angles that touched this peg first can change; every other angle's free flight is unaffected
+        self.alive[peg] = False
+        self._compute(np.flatnonzero(self.first_peg == peg))
+
+    def update_alive(self, alive):
+        alive = np.asarray(alive, dtype=bool)
+        if (alive & ~self.alive).any():     # A peg came back (e.g. a restored snapshot), which can change any angle
+            self.alive = alive.copy()
+            self._compute(np.arange(len(self.table.angles)))
+            return
+        for peg in np.flatnonzero(self.alive & ~alive):
+            self.remove_peg(peg)
+
+    def lookup(self, angles):
+        # (first peg, tick) for angles on the table grid; -1 where the shot touches nothing
+        indices = self.table.angle_indices(np.asarray(angles, dtype=float))
+        return self.first_peg[indices], self.first_tick[indices]
+
+    def segments(self):
+        # Runs of consecutive grid angles with the same first contact, as (first angle, last angle, peg) arrays
+        change = np.flatnonzero(np.diff(self.first_peg)) + 1
+        begin = np.r_[0, change]
+        end = np.r_[change, len(self.first_peg)] - 1
+        hits = self.first_peg[begin] >= 0
+        return self.table.angles[begin[hits]], self.table.angles[end[hits]], self.first_peg[begin[hits]]
+
+    def intervals(self, peg):
+        low, high, pegs = self.segments()
+        return list(zip(low[pegs == peg].tolist(), high[pegs == peg].tolist()))
+
+    def scores(self, angle_indices=None, prune=True):
+        # Same result as BatchSimulator.scores for the grid angles, with the simulation starting at the first bounce
+        if angle_indices is None:
+            angle_indices = np.arange(len(self.table.angles))
+        angle_indices = np.asarray(angle_indices)
+        pegs_hit = np.zeros(len(angle_indices), dtype=np.intp)
+        ticks = self.table.lengths[angle_indices].copy()
+
+        alive_index = np.flatnonzero(self.alive)
+        peg_x = self.pegs[alive_index, 0]
+        peg_y = self.pegs[alive_index, 1]
+        contacts = np.flatnonzero(self.first_peg[angle_indices] >= 0)
+        bounds = self.simulator.reachability(self.pegs, self.alive) if prune else None
+
+        step = max(1, self.simulator.chunk_size // max(1, len(alive_index)))
+        for begin in range(0, len(contacts), step):
+            lanes = contacts[begin:begin + step]
+            angles = angle_indices[lanes]
+            tick = self.first_tick[angles]
+            x, y, vx, vy = (np.array(self.table.states[i][angles, tick]) for i in range(4))
+
+            column = np.searchsorted(alive_index, self.first_peg[angles])
+            self.simulator.bounce(x, y, vx, vy, peg_x[column], peg_y[column])
+            lane_alive = np.ones((len(lanes), len(alive_index)), dtype=bool)
+            lane_alive[np.arange(len(lanes)), column] = False
+            pegs_hit[lanes] = 1
+            ticks[lanes] = tick + 1
+
+            flying = y < self.simulator.height
+            self.simulator.advance(peg_x, peg_y, lanes[flying], x[flying], y[flying], vx[flying], vy[flying],
+                                   lane_alive[flying], pegs_hit, ticks, bounds)
+
+        return pegs_hit, ticks
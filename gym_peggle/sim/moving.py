@@ -0,0 +1,251 @@
+import math
+
+import numpy as np
+
+from gym_peggle.envs.peggle import (
+    WIDTH,
+    HEIGHT,
+    BALL_RADIUS,
+    LAUNCH_VELOCITY,
+    PEG_RADIUS,
+    BALL_Y_START,
+    RESTITUTION,
+    Ball,
+)
+
+
+# Peg motion as a function of game time in ticks, so any simulation that starts at the same tick sees the
+# pegs in the same places. Every peg is its anchor, plus a point sliding back and forth along a rail, plus a
+# point circling the anchor:
+#   position(t) = anchor + rail * triangle(t / rail_period + phase) + orbit_radius * (cos, sin)(orbit_speed * t + orbit_phase)
+# where triangle goes 0 -> 1 -> 0 once per period. Static pegs have neither; a rotating cluster is pegs
+# sharing an anchor and orbit speed at different orbit phases.
+class MovingPegs:
+    def __init__(self):
+        self.anchor = np.zeros((0, 2))
+        self.rail = np.zeros((0, 2))
+        self.rail_period = np.zeros(0)      # Ticks for a full back-and-forth, 0 for no rail
+        self.rail_phase = np.zeros(0)
+        self.orbit_radius = np.zeros(0)
+        self.orbit_speed = np.zeros(0)      # Radians per tick
+        self.orbit_phase = np.zeros(0)
+        self._index()
+
+    def __len__(self):
+        return len(self.anchor)
+
+    def _add(self, anchor, rail=(0, 0), rail_period=0, rail_phase=0, orbit_radius=0, orbit_speed=0, orbit_phase=0):
+        anchor = np.asarray(anchor, dtype=float).reshape(-1, 2)
+        count = len(anchor)
+        first = len(self.anchor)
+        self.anchor = np.concatenate([self.anchor, anchor])
+        self.rail = np.concatenate([self.rail, np.broadcast_to(np.asarray(rail, dtype=float), (count, 2))])
+        for name, value in (("rail_period", rail_period), ("rail_phase", rail_phase), ("orbit_radius", orbit_radius),
+                            ("orbit_speed", orbit_speed), ("orbit_phase", orbit_phase)):
+            setattr(self, name, np.concatenate([getattr(self, name), np.broadcast_to(np.asarray(value, dtype=float), count)]))
+        self._index()
+        return np.arange(first, first + count)
+
+    def _index(self):
+        # Parameters of the moving pegs gathered once, so pegs are added rarely and moved cheaply
+        self.moving = np.flatnonzero((self.rail_period > 0) | ((self.orbit_radius > 0) & (self.orbit_speed != 0)))
+        period = self.rail_period[self.moving]
+        self._rail_rate = np.where(period > 0, 1 / np.where(period > 0, period, 1), 0)
+        self._rail_phase = self.rail_phase[self.moving]
+        self._rail_x, self._rail_y = self.rail[self.moving, 0], self.rail[self.moving, 1]
+        self._anchor_x, self._anchor_y = self.anchor[self.moving, 0], self.anchor[self.moving, 1]
+        self._orbit_speed = self.orbit_speed[self.moving]
+        self._orbit_phase = self.orbit_phase[self.moving]
+        self._orbit_radius = self.orbit_radius[self.moving]
+
+    def add_static(self, points):
+        return self._add(points)
+
+    def add_rail(self, start, end, period, phase=0):
+        # A peg sliding from start to end and back every `period` ticks; phase in [0, 1) staggers pegs on one rail
+        start = np.asarray(start, dtype=float)
+        return self._add(start, np.asarray(end, dtype=float) - start, period, phase)
+
+    def add_cluster(self, center, radius, count, speed, phase=0):
+        # `count` pegs spaced evenly on a circle around center, turning `speed` radians per tick
+        phases = phase + 2 * np.pi * np.arange(count) / count
+        return self._add(np.repeat(np.asarray(center, dtype=float).reshape(1, 2), count, axis=0),
+                         orbit_radius=radius, orbit_speed=speed, orbit_phase=phases)
+
+    def positions(self, time, out=None):
+        # (num_pegs, 2) positions at a tick; with `out` from an earlier call only the moving pegs are written
+        if out is None:
+            out = self.anchor.copy()
+        if len(self.moving) > 0:
+            triangle = 1 - np.abs(2 * ((time * self._rail_rate + self._rail_phase) % 1) - 1)
+            angle = self._orbit_speed * time + self._orbit_phase
+            out[self.moving, 0] = self._anchor_x + self._rail_x * triangle + self._orbit_radius * np.cos(angle)
+            out[self.moving, 1] = self._anchor_y + self._rail_y * triangle + self._orbit_radius * np.sin(angle)
+        return out
+
+
+# Uniform grid over peg centers for finding the pegs a ball may touch. Cells are at least as wide as the
+# touching distance, so the 3x3 cells around the ball hold every candidate. update() moves only the pegs
+# whose cell changed since the last call into their new bucket; pegs moving a pixel or two per tick cross
+# a cell boundary rarely, so most ticks touch no buckets at all.
+class DynamicGrid:
+    def __init__(self, positions, cell_size, width, height, alive=None):
+        self.cell_size = cell_size
+        self.columns = max(1, math.ceil(width / cell_size))
+        self.rows = max(1, math.ceil(height / cell_size))
+        self.cells = self.cell_of(positions)
+        if alive is not None:
+            self.cells[~np.asarray(alive, dtype=bool)] = -1     # -1: not in the grid
+        self.buckets = {}
+        for peg, cell in enumerate(self.cells.tolist()):
+            if cell >= 0:
+                self.buckets.setdefault(cell, set()).add(peg)
+        self.rebucketed = 0     # Pegs moved between buckets so far
+
+    def copy(self):
+        grid = object.__new__(DynamicGrid)
+        grid.__dict__.update(self.__dict__)
+        grid.cells = self.cells.copy()
+        grid.buckets = {cell: set(pegs) for cell, pegs in self.buckets.items()}
+        return grid
+
+    def cell_of(self, positions):
+        # Cells are clipped to the board, which keeps neighbouring pegs in neighbouring cells
+        column = np.minimum(np.maximum(positions[:, 0] // self.cell_size, 0), self.columns - 1)
+        row = np.minimum(np.maximum(positions[:, 1] // self.cell_size, 0), self.rows - 1)
+        return (row * self.columns + column).astype(np.intp)
+
+    def update(self, positions, pegs=None):
+        # Rebuckets the given pegs (all pegs by default) whose cell changed
+        pegs = np.arange(len(self.cells)) if pegs is None else pegs
+        old = self.cells[pegs]
+        new = self.cell_of(positions[pegs])
+        changed = np.flatnonzero((new != old) & (old >= 0))
+        for peg, old_cell, new_cell in zip(pegs[changed].tolist(), old[changed].tolist(), new[changed].tolist()):
+            self.buckets[old_cell].discard(peg)
+            self.buckets.setdefault(new_cell, set()).add(peg)
+            self.cells[peg] = new_cell
+        self.rebucketed += len(changed)
+
+    def remove(self, peg):
+        if self.cells[peg] >= 0:
+            self.buckets[int(self.cells[peg])].discard(peg)
+            self.cells[peg] = -1
+
+    def near(self, x, y):
+        column = min(max(int(x // self.cell_size), 0), self.columns - 1)
+        row = min(max(int(y // self.cell_size), 0), self.rows - 1)
+        found = []
+        for cell_row in range(max(0, row - 1), min(self.rows, row + 2)):
+            for cell_column in range(max(0, column - 1), min(self.columns, column + 2)):
+                pegs = self.buckets.get(cell_row * self.columns + cell_column)
+                if pegs:
+                    found.extend(pegs)
+        return found
+
+
+# The single-ball game on a board of MovingPegs. The clock (`time`, in ticks) only runs while a ball is
+# in flight, and the aim preview simulates from the current time on a copy of the grid, so it sees the
+# pegs exactly where the real shot will. Collisions work like Game.update: the lowest-index touching peg
+# bounces the ball (as if it were standing still) and is removed.
+class MovingPegGame:
+    def __init__(self, pegs, balls, direction, width=WIDTH, height=HEIGHT, peg_radius=PEG_RADIUS, ball_radius=BALL_RADIUS,
+                 time=0):
+        self.motion = pegs
+        self.balls = balls
+        self.pegs_hit = 0
+        self.width = width
+        self.height = height
+        self.peg_radius = peg_radius
+        self.ball = Ball(width // 2, BALL_Y_START, ball_radius, width, height)
+        self.time = time
+        self.alive = np.ones(len(pegs), dtype=bool)
+        self.positions = pegs.positions(time)
+        self.grid = DynamicGrid(self.positions, 2 * (peg_radius + ball_radius), width, height)
+        self.is_ball_moving = False
+        self.launch_direction = direction
+        self.pegs_in_trajectory = 0
+        self.aim_dots = self.get_aim_dots()
+
+    def launch_ball(self):
+        self.ball.reset()
+        self.balls -= 1
+        self.ball.vx = np.cos(self.launch_direction) * LAUNCH_VELOCITY
+        self.ball.vy = np.sin(self.launch_direction) * LAUNCH_VELOCITY
+        self.is_ball_moving = True
+
+    def change_aim(self, direction):
+        self.launch_direction = direction
+        self.aim_dots = self.get_aim_dots()
+
+    def update(self):           # Returns whether the ball bounced off a peg in this tick
+        if self.is_ball_moving:
+            self.time += 1
+            return self._tick(self.ball, self.time, self.positions, self.grid, self.alive) is not None
+        return False
+
+    def _tick(self, ball, time, positions, grid, alive):
+        # Moves the pegs to `time` and the ball one tick; returns the peg the ball bounced off, or None
+        self.motion.positions(time, out=positions)
+        grid.update(positions, self.motion.moving)
+        ball.update()
+
+        reach = self.peg_radius + ball.radius
+        touching = [peg for peg in grid.near(ball.x, ball.y)
+                    if math.sqrt((positions[peg, 0] - ball.x) ** 2 + (positions[peg, 1] - ball.y) ** 2) < reach]
+        if not touching:
+            return None
+        peg = min(touching)
+        self._bounce(ball, positions[peg, 0], positions[peg, 1])
+        alive[peg] = False
+        grid.remove(peg)
+        return peg
+
+    def _bounce(self, ball, peg_x, peg_y):    # Game.handle_collision with the peg at (peg_x, peg_y)
+        nx = ball.x - peg_x
+        ny = ball.y - peg_y
+        norm = math.sqrt(nx ** 2 + ny ** 2)
+        nx /= norm
+        ny /= norm
+
+        dot_product = ball.vx * nx + ball.vy * ny
+        ball.vx -= RESTITUTION * dot_product * nx
+        ball.vy -= RESTITUTION * dot_product * ny
+
+        overlap = ball.radius + self.peg_radius - math.sqrt((ball.x - peg_x) ** 2 + (ball.y - peg_y) ** 2)
+        ball.x += nx * overlap
+        ball.y += ny * overlap
+
+    def run_shot(self):
+        # Launches at the current aim and plays the shot out; returns the pegs hit
+        self.launch_ball()
+        pegs_hit = 0
+        while self.ball.in_bounds():
+            if self.update():
+                pegs_hit += 1
+        self.pegs_hit += pegs_hit
+        self.is_ball_moving = False
+        return pegs_hit
+
+    def get_num_remaining_pegs(self):
+        return int(self.alive.sum())
+
+    def get_aim_dots(self, max_bounces=2):
+        # Preview of the current shot (like Game.get_aim_dots) on copies of the board, starting at the current time
+        time = self.time
+        positions = self.positions.copy()
+        grid = self.grid.copy()
+        alive = self.alive.copy()
+        ball = Ball(self.width // 2, BALL_Y_START, self.ball.radius, self.width, self.height)
+        ball.vx = np.cos(self.launch_direction) * LAUNCH_VELOCITY
+        ball.vy = np.sin(self.launch_direction) * LAUNCH_VELOCITY
+
+        aim_dots = []
+        bounces = 0
+        while ball.in_bounds() and bounces < max_bounces:
+            time += 1
+            if self._tick(ball, time, positions, grid, alive) is not None:
+                bounces += 1
+            aim_dots.append([ball.x, ball.y])
+        self.pegs_in_trajectory = bounces
+        return aim_dots
@@ -0,0 +1,86 @@
+import numpy as np
+
+from gym_peggle.sim.batch import BatchSimulator
+
+
+# Many balls in flight at once on one shared board, stored as arrays and stepped together. Each tick every
+# ball moves (Ball.update) and then bounces off the first peg it touches (Game.update), checked against the
+# pegs that were on the board at the start of the tick. A peg touched by several balls in the same tick
+# bounces all of them and is removed once, credited to the ball launched first. With a single ball this is
+# the scalar game exactly.
+class MultiBallGame:
+    def __init__(self, pegs, alive=None, simulator=None):
+        self.simulator = BatchSimulator() if simulator is None else simulator
+        self.pegs = np.array(pegs, dtype=float).reshape(-1, 2)
+        self.alive = np.ones(len(self.pegs), dtype=bool) if alive is None else np.array(alive, dtype=bool)
+        self.hit_by = np.full(len(self.pegs), -1, dtype=np.intp)   # Ball that removed each peg, -1 while on the board
+        self.ticks = 0
+
+        # Balls in flight, in launch order. A ball's id is its launch index and never changes.
+        self.ball_ids = np.zeros(0, dtype=np.intp)
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        self.vx = np.zeros(0)
+        self.vy = np.zeros(0)
+        self.ball_pegs_hit = np.zeros(0, dtype=np.intp)     # Pegs credited to each ball id, including balls that have left
+
+    @classmethod
+    def from_game(cls, game, **kwargs):
+        pegs, alive = BatchSimulator.board_arrays(game)
+        return cls(pegs, alive, BatchSimulator.from_game(game, **kwargs))
+
+    def launch(self, angles, velocities=None):
+        # Adds a ball at the launch point per angle and returns their ids
+        x, y, vx, vy = self.simulator.launch(np.atleast_1d(angles), velocities)
+        ids = np.arange(len(self.ball_pegs_hit), len(self.ball_pegs_hit) + len(x))
+        self.ball_ids = np.concatenate([self.ball_ids, ids])
+        self.x = np.concatenate([self.x, x])
+        self.y = np.concatenate([self.y, y])
+        self.vx = np.concatenate([self.vx, vx])
+        self.vy = np.concatenate([self.vy, vy])
+        self.ball_pegs_hit = np.concatenate([self.ball_pegs_hit, np.zeros(len(x), dtype=np.intp)])
+        return ids
+
+    def in_flight(self):
+        return len(self.x)
+
+    def update(self):
+        # Advances every ball one tick and returns the indices of the pegs removed on it
+        if len(self.x) == 0:
+            return np.zeros(0, dtype=np.intp)
+        self.simulator.move(self.x, self.y, self.vx, self.vy)
+        self.ticks += 1
+
+        removed = np.zeros(0, dtype=np.intp)
+        alive_index = np.flatnonzero(self.alive)
+        if len(alive_index) > 0:
+            hit = self.simulator.first_colliding(self.x, self.y, self.pegs[alive_index, 0], self.pegs[alive_index, 1])
+            touched = np.flatnonzero(hit >= 0)
+            if len(touched) > 0:
+                pegs = alive_index[hit[touched]]
+                bx, by, bvx, bvy = self.x[touched], self.y[touched], self.vx[touched], self.vy[touched]
+                self.simulator.bounce(bx, by, bvx, bvy, self.pegs[pegs, 0], self.pegs[pegs, 1])
+                self.x[touched], self.y[touched], self.vx[touched], self.vy[touched] = bx, by, bvx, bvy
+
+                # Balls are in launch order, so the first ball touching a peg is the one launched first
+                removed, first = np.unique(pegs, return_index=True)
+                credited = self.ball_ids[touched[first]]
+                self.alive[removed] = False
+                self.hit_by[removed] = credited
+                np.add.at(self.ball_pegs_hit, credited, 1)
+
+        flying = self.y < self.simulator.height
+        if not flying.all():
+            self.ball_ids, self.x, self.y = self.ball_ids[flying], self.x[flying], self.y[flying]
+            self.vx, self.vy = self.vx[flying], self.vy[flying]
+        return removed
+
+    def run(self):
+        # Updates until every ball has left the board; returns the number of pegs removed
+        removed = 0
+        while len(self.x) > 0:
+            removed += len(self.update())
+        return removed
+
+    def pegs_hit(self):
+        return int((self.hit_by >= 0).sum())
@@ -0,0 +1,108 @@
+import hashlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from gym_peggle.envs.peggle import RESTITUTION, WALL_DAMPING
+from gym_peggle.sim.symmetry import ANGLE_KEY_RESOLUTION, ShotOutcomeCache
+
+CACHE_VERSION = 2   # Bump when the meaning of a stored outcome changes
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS boards (
+    id INTEGER PRIMARY KEY,             -- Insertion order; the oldest boards are evicted first
+    key TEXT NOT NULL UNIQUE            -- Physics key, then the board digest
+);
+CREATE TABLE IF NOT EXISTS outcomes (
+    board INTEGER NOT NULL REFERENCES boards (id),
+    angle INTEGER NOT NULL,             -- angle_keys() of the angle, in the canonical frame
+    pegs_hit INTEGER NOT NULL,
+    PRIMARY KEY (board, angle)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (name, value) VALUES ('entries', 0);
+"""
+
+
+def physics_key(simulator):
+    # Everything an outcome depends on besides the board and the angle, so a change to any of them starts a fresh key space
+    config = (CACHE_VERSION, simulator.width, simulator.height, simulator.ball_radius, simulator.peg_radius,
+              simulator.gravity, simulator.launch_velocity, tuple(simulator.start), simulator.timestep,
+              RESTITUTION, WALL_DAMPING, ANGLE_KEY_RESOLUTION)
+    return hashlib.sha256(repr(config).encode()).hexdigest()[:16]
+
+
+# ShotOutcomeCache backed by a SQLite file in WAL mode, so outcomes survive the process and are shared by every
+# process that opens the same file. Reads never take the write lock, so any number of workers can look up
+# boards at once; the shots a call had to simulate are appended in one write transaction, and SQLite lets
+# one writer in at a time. Boards are keyed by physics_key() plus the board digest, so entries
+# written under other physics constants are never served (they age out through eviction). Once the file
+# holds more than max_entries outcomes, the oldest boards are evicted whole. Eviction is first in, first out
+# by when a board was first written, on purpose: tracking the last hit would turn every read into a write
+# and take the write lock on every lookup, and boards from old physics keys or finished runs age out anyway.
+class PersistentShotCache(ShotOutcomeCache):
+    def __init__(self, path, simulator=None, max_entries=10_000_000, max_boards=64, mirror=False):
+        super().__init__(simulator, max_boards, mirror)
+        self.path = path
+        self.max_entries = max_entries
+        # Mirrored outcomes are not exact, so they never share keys with exact ones
+        self.physics = physics_key(self.simulator) + (":mirror" if self.mirror else "")
+        self.disk_hits = 0      # Outcomes found in the file rather than in memory
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def _fetch(self, key, outcomes, keys):
+        with self.lock:
+            rows = self.connection.execute("SELECT angle, pegs_hit FROM outcomes JOIN boards ON boards.id = outcomes.board "
+                                           "WHERE boards.key = ?", (f"{self.physics}:{key}",)).fetchall()
+        outcomes.update(rows)
+        wanted = set(keys.tolist())
+        self.disk_hits += sum(1 for angle, _ in rows if angle in wanted)
+
+    def _save(self, key, keys, pegs_hit):
+        with self.transaction() as db:
+            db.execute("INSERT OR IGNORE INTO boards (key) VALUES (?)", (f"{self.physics}:{key}",))
+            board = db.execute("SELECT id FROM boards WHERE key = ?", (f"{self.physics}:{key}",)).fetchone()[0]
+            before = db.total_changes
+            db.executemany("INSERT OR IGNORE INTO outcomes (board, angle, pegs_hit) VALUES (?, ?, ?)",
+                           zip([board] * len(keys), keys.tolist(), np.asarray(pegs_hit).tolist()))
+            entries = self._add_entries(db, db.total_changes - before)
+            while entries > self.max_entries:
+                oldest = db.execute("SELECT MIN(id) FROM boards").fetchone()[0]
+                if oldest is None or oldest == board:
+                    break
+                removed = db.execute("DELETE FROM outcomes WHERE board = ?", (oldest,)).rowcount
+                db.execute("DELETE FROM boards WHERE id = ?", (oldest,))
+                entries = self._add_entries(db, -removed)
+
+    @staticmethod
+    def _add_entries(db, count):
+        # UPDATE then SELECT in the caller's transaction rather than UPDATE ... RETURNING, which needs SQLite 3.35
+        db.execute("UPDATE meta SET value = value + ? WHERE name = 'entries'", (count,))
+        return db.execute("SELECT value FROM meta WHERE name = 'entries'").fetchone()[0]
+
+    def disk_entries(self):
+        with self.lock:
+            return self.connection.execute("SELECT value FROM meta WHERE name = 'entries'").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
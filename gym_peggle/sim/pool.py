@@ -0,0 +1,173 @@
+import multiprocessing as mp
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from gym_peggle.sim.batch import BatchSimulator
+
+# Control block layout (float64): number of pegs, number of angles, command
+NUM_PEGS, NUM_ANGLES, COMMAND = range(3)
+SWEEP, STOP = 0, 1
+# Result row layout (float64): best pegs hit, its angle index, ticks simulated, failed
+BEST, INDEX, TICKS, FAILED = range(4)
+POLL_SECONDS = 1.0  # How often best_shot checks that the workers are still alive while it waits
+
+
+def _attach(name, shape, dtype):
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _worker(rank, num_workers, names, max_pegs, max_angles, simulator, start, done, errors):
+    blocks = []
+    block, pegs = _attach(names[0], (max_pegs, 2), np.float64)
+    blocks.append(block)
+    block, alive = _attach(names[1], (max_pegs,), np.bool_)
+    blocks.append(block)
+    block, angles = _attach(names[2], (max_angles,), np.float64)
+    blocks.append(block)
+    block, control = _attach(names[3], (3,), np.float64)
+    blocks.append(block)
+    block, results = _attach(names[4], (num_workers, 4), np.float64)
+    blocks.append(block)
+
+    while True:
+        start.acquire()
+        if control[COMMAND] == STOP:
+            break
+
+        try:
+            num_pegs = int(control[NUM_PEGS])
+            # Strided slices, so every worker gets a similar mix of short and long trajectories
+            mine = np.arange(rank, int(control[NUM_ANGLES]), num_workers)
+            if len(mine) == 0:
+                results[rank] = (-1, 0, 0, 0)
+            else:
+                pegs_hit, ticks = simulator.scores(pegs[:num_pegs], alive[:num_pegs], angles[mine])
+                best = np.argmax(pegs_hit)
+                results[rank] = (pegs_hit[best], mine[best], ticks.sum(), 0)
+        except Exception:
+            # Report instead of dying, so best_shot is never left waiting for this worker
+            results[rank] = (-1, 0, 0, 1)
+            errors.send(traceback.format_exc())
+        finally:
+            done.release()
+
+    del pegs, alive, angles, control, results
+    for block in blocks:
+        block.close()
+
+
+# A persistent pool of processes that sweep launch angles for one shared board.
+# The pegs, alive mask and angle grid live in shared memory, so updating the board is a memcpy into
+# the shared arrays and nothing is pickled per call. Each call splits the angles across the workers
+# and reduces their answers to the best angle.
+class SweepPool:
+    def __init__(self, num_workers=None, simulator=None, max_pegs=4096, max_angles=1 << 16):
+        self.num_workers = num_workers or mp.cpu_count()
+        self.simulator = BatchSimulator() if simulator is None else simulator
+        self.max_pegs = max_pegs
+        self.max_angles = max_angles
+
+        self.blocks = []
+        self.pegs = self._create((max_pegs, 2), np.float64)
+        self.alive = self._create((max_pegs,), np.bool_)
+        self.angles = self._create((max_angles,), np.float64)
+        self.control = self._create((3,), np.float64)
+        self.results = self._create((self.num_workers, 4), np.float64)
+        self.last_ticks = 0     # Physics ticks the last best_shot call simulated across all workers
+        names = [block.name for block in self.blocks]
+
+        self.start_signals = [mp.Semaphore(0) for _ in range(self.num_workers)]
+        self.done_signal = mp.Semaphore(0)
+        self.workers = []
+        self.errors = []    # One pipe per worker, carrying the traceback when a sweep raises
+        for rank in range(self.num_workers):
+            receiver, sender = mp.Pipe(duplex=False)
+            worker = mp.Process(
+                target=_worker,
+                args=(rank, self.num_workers, names, max_pegs, max_angles, self.simulator,
+                      self.start_signals[rank], self.done_signal, sender),
+                daemon=True,
+            )
+            worker.start()
+            sender.close()
+            self.errors.append(receiver)
+            self.workers.append(worker)
+
+    def _create(self, shape, dtype):
+        block = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize))
+        self.blocks.append(block)
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        array.fill(0)
+        return array
+
+    def update_board(self, pegs, alive):
+        num_pegs = len(pegs)
+        if num_pegs > self.max_pegs:
+            raise ValueError(f"Board has {num_pegs} pegs but the pool was created with max_pegs={self.max_pegs}")
+        self.pegs[:num_pegs] = pegs
+        self.alive[:num_pegs] = alive
+        self.control[NUM_PEGS] = num_pegs
+
+    def update_game(self, game):
+        self.update_board(*BatchSimulator.board_arrays(game))
+
+    def best_shot(self, angles):
+        # (angle, pegs hit) of the best shot. Ties go to the earliest angle in `angles`, like the perfect strategy.
+        num_angles = len(angles)
+        if num_angles > self.max_angles:
+            raise ValueError(f"{num_angles} angles requested but the pool was created with max_angles={self.max_angles}")
+        self.angles[:num_angles] = angles
+        self.control[NUM_ANGLES] = num_angles
+        self.control[COMMAND] = SWEEP
+
+        for start in self.start_signals:
+            start.release()
+        self._wait()
+
+        self.last_ticks = int(self.results[:, TICKS].sum())
+        best_hit, best_index = -1, 0
+        for pegs_hit, index, _, _ in self.results:
+            if pegs_hit > best_hit or (pegs_hit == best_hit and index < best_index):
+                best_hit, best_index = pegs_hit, index
+        return float(self.angles[int(best_index)]), int(max(best_hit, 0))
+
+    def _wait(self):
+        # Waits for every worker to finish the sweep. Raises EOFError if a worker process has died, and
+        # RuntimeError with the worker's traceback if its sweep raised.
+        for _ in range(self.num_workers):
+            while not self.done_signal.acquire(timeout=POLL_SECONDS):
+                for rank, worker in enumerate(self.workers):
+                    if not worker.is_alive():
+                        raise EOFError(f"Sweep worker {rank} exited with code {worker.exitcode}")
+
+        failed = np.flatnonzero(self.results[:, FAILED])
+        if len(failed) > 0:
+            errors = "".join(f"Sweep worker {rank} raised:\n{self.errors[rank].recv()}" for rank in failed.tolist())
+            self.results[:, FAILED] = 0
+            raise RuntimeError(errors)
+
+    def close(self):
+        if not self.workers:
+            return
+        self.control[COMMAND] = STOP
+        for start in self.start_signals:
+            start.release()
+        for worker in self.workers:
+            worker.join()
+        for receiver in self.errors:
+            receiver.close()
+        self.workers = []
+
+        del self.pegs, self.alive, self.angles, self.control, self.results
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,92 @@
+import math
+
+import numpy as np
+
+MARGIN = 1.0    # Pixels of slack on every bound, so float rounding never prunes a shot that could still hit
+
+
+def ticks_until_below(y, vy, gravity, limit):
+    # Upper bound on the ticks before a ball at (y, vy) passes below `limit` (Ball.update: y += vy, then vy += gravity).
+    # Works on scalars and arrays; vy must be >= 0.
+    b = vy - gravity / 2
+    return (-b + np.sqrt(b * b + 2 * gravity * np.maximum(limit - y, 0))) / gravity + 1
+
+
+# Bounds on where the pegs still on the board are, for ending a shot once it cannot hit anything else.
+# The board is cut into columns of ball-center x, and each column keeps the lowest (largest y) alive peg
+# a ball in that column could touch. A falling ball (vy >= 0) only moves down, and within the ticks it
+# takes to drop below the lowest peg it can only move |vx| per tick sideways (walls only slow it), so once
+# it is below the lowest peg of every column in that range, no further bounce is possible.
+class ReachabilityBounds:
+    def __init__(self, pegs, alive, width, reach, gravity, column_width=None):
+        self.pegs = np.array(pegs, dtype=float).reshape(-1, 2)
+        self.alive = np.array(alive, dtype=bool)
+        self.reach = reach              # Peg radius + ball radius
+        self.gravity = gravity
+        self.column_width = 2 * reach if column_width is None else column_width
+        self.num_columns = max(1, math.ceil(width / self.column_width))
+
+        # Columns each peg can be touched from
+        first = np.floor((self.pegs[:, 0] - reach) / self.column_width).astype(np.intp)
+        last = np.floor((self.pegs[:, 0] + reach) / self.column_width).astype(np.intp)
+        self.peg_columns = np.stack([np.clip(first, 0, self.num_columns - 1), np.clip(last, 0, self.num_columns - 1)], axis=1)
+        self.column_pegs = [[] for _ in range(self.num_columns)]
+        for peg, (begin, end) in enumerate(self.peg_columns):
+            for column in range(begin, end + 1):
+                self.column_pegs[column].append(peg)
+        self.column_pegs = [np.array(pegs, dtype=np.intp) for pegs in self.column_pegs]
+
+        self.lowest = np.full(self.num_columns, -np.inf)
+        self._update_columns(0, self.num_columns - 1)
+
+    def _update_columns(self, begin, end):
+        for column in range(begin, end + 1):
+            pegs = self.column_pegs[column]
+            pegs = pegs[self.alive[pegs]]
+            self.lowest[column] = self.pegs[pegs, 1].max() if len(pegs) > 0 else -np.inf
+        self.lowest_peg = self.lowest.max()
+        self.lowest_list = self.lowest.tolist()     # The scalar check slices a list, which is faster than NumPy for a few columns
+
+        # Sparse table for range maximum queries over the columns, used by the batched check
+        levels = [self.lowest]
+        while 2 ** len(levels) <= self.num_columns:
+            previous, step = levels[-1], 2 ** (len(levels) - 1)
+            levels.append(np.maximum(previous, np.r_[previous[step:], np.full(step, -np.inf)]))
+        self.levels = np.stack(levels)
+
+    def set_alive(self, peg, alive):
+        if self.alive[peg] != alive:
+            self.alive[peg] = alive
+            self._update_columns(*self.peg_columns[peg])
+
+    def remove_peg(self, peg):
+        self.set_alive(peg, False)
+
+    def update_alive(self, alive):
+        for peg in np.flatnonzero(self.alive != np.asarray(alive, dtype=bool)):
+            self.set_alive(peg, not self.alive[peg])
+
+    def hopeless(self, x, y, vx, vy):
+        # True once a single ball can no longer hit any alive peg
+        if vy < 0:
+            return False
+        limit = self.lowest_peg + self.reach + MARGIN
+        if y > limit:
+            return True
+        # ticks_until_below with math instead of NumPy, which is several times slower on Python floats
+        b = vy - self.gravity / 2
+        span = abs(vx) * ((-b + math.sqrt(b * b + 2 * self.gravity * (limit - y))) / self.gravity + 1) + MARGIN
+        begin = max(0, int((x - span) // self.column_width))
+        end = min(self.num_columns - 1, int((x + span) // self.column_width))
+        return y - self.reach - MARGIN > max(self.lowest_list[begin:end + 1])
+
+    def hopeless_lanes(self, x, y, vx, vy):
+        # hopeless() for arrays of balls
+        limit = self.lowest_peg + self.reach + MARGIN
+        falling = vy >= 0
+        span = np.abs(vx) * ticks_until_below(y, np.maximum(vy, 0), self.gravity, limit) + MARGIN
+        begin = np.clip(((x - span) // self.column_width).astype(np.intp), 0, self.num_columns - 1)
+        end = np.clip(((x + span) // self.column_width).astype(np.intp), 0, self.num_columns - 1)
+        level = np.floor(np.log2(end - begin + 1)).astype(np.intp)
+        lowest = np.maximum(self.levels[level, begin], self.levels[level, end - 2 ** level + 1])
+        return falling & ((y > limit) | (y - self.reach - MARGIN > lowest))
@@ -0,0 +1,47 @@
+import numpy as np
+
+from gym_peggle.sim.batch import BatchSimulator
+
+
+# Expected pegs hit, and its variance, when the launch angle and speed are jittered. Every candidate is
+# scored under the same K perturbations (common random numbers), and perturbed shots are snapped to a
+# lattice of angles and speeds. Neighbouring candidates then share most of their perturbed shots, and each
+# distinct shot is simulated once per call, so the cost is bounded by the lattice points covered rather
+# than by candidates * K.
+class RobustScorer:
+    def __init__(self, simulator=None, samples=32, angle_noise=0.005, velocity_noise=0.02,
+                 angle_resolution=0.001, velocity_resolution=0.05, seed=0):
+        self.simulator = BatchSimulator() if simulator is None else simulator
+        self.samples = samples
+        self.angle_noise = angle_noise              # Standard deviation of the aim error, in radians
+        self.velocity_noise = velocity_noise        # Standard deviation of the launch speed error, relative
+        self.angle_resolution = angle_resolution
+        self.velocity_resolution = velocity_resolution
+
+        # Perturbations in lattice steps, drawn once so every call and candidate sees the same ones
+        rng = np.random.default_rng(seed)
+        self.angle_offsets = np.rint(rng.normal(0, angle_noise, samples) / angle_resolution).astype(np.int64)
+        speed = self.simulator.launch_velocity * (1 + rng.normal(0, velocity_noise, samples))
+        self.velocity_steps = np.rint(speed / velocity_resolution).astype(np.int64)
+
+        self.last_trajectories = 0      # Distinct shots the last call to scores simulated
+        self.last_ticks = 0
+
+    def scores(self, pegs, alive, angles):
+        # (mean, variance) of pegs hit for each candidate angle, candidates snapped to the angle lattice
+        steps = np.rint(np.asarray(angles, dtype=float) / self.angle_resolution).astype(np.int64)
+        shot_angles = steps[:, None] + self.angle_offsets[None, :]
+        shot_velocities = np.broadcast_to(self.velocity_steps[None, :], shot_angles.shape)
+
+        shots = np.stack([shot_angles.ravel(), shot_velocities.ravel()], axis=1)
+        unique_shots, inverse = np.unique(shots, axis=0, return_inverse=True)
+        pegs_hit, ticks = self.simulator.scores(pegs, alive, unique_shots[:, 0] * self.angle_resolution,
+                                                unique_shots[:, 1] * self.velocity_resolution)
+        self.last_trajectories = len(unique_shots)
+        self.last_ticks = int(ticks.sum()) // self.simulator.timestep
+
+        samples = pegs_hit[inverse.reshape(shot_angles.shape)]
+        return samples.mean(axis=1), samples.var(axis=1)
+
+    def scores_game(self, game, angles):
+        return self.scores(*BatchSimulator.board_arrays(game), angles)
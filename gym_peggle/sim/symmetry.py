@@ -0,0 +1,125 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from gym_peggle.sim.batch import BatchSimulator
+
+ANGLE_KEY_RESOLUTION = 1e-9     # Cached angles closer than this share an entry; well above the rounding in pi - angle
+
+
+# The ball starts at width // 2 and the walls are symmetric, so a board mirrored across x = width / 2 and
+# shot at pi - angle plays out like the original. Boards and their mirror images share one canonical key,
+# and shots on the mirror image are stored at the mirrored angle. The two agree up to float rounding
+# (pi - angle and width - x are rounded), which changes the outcome of a small fraction of long bounce chains,
+# so sharing outcomes between them is opt-in.
+def mirror_board(pegs, width):
+    mirrored = np.array(pegs, dtype=float).reshape(-1, 2)
+    mirrored[:, 0] = width - mirrored[:, 0]
+    return mirrored
+
+
+def mirror_angles(angles):
+    return np.pi - np.asarray(angles, dtype=float)
+
+
+def angle_keys(angles):
+    return np.rint(np.asarray(angles, dtype=float) / ANGLE_KEY_RESOLUTION).astype(np.int64)
+
+
+def board_digest(pegs, alive, width):
+    # Hash of the pegs still on the board, in list order: Game.update gives a tick's contact to the first
+    # touching peg in the list, so the same pegs in another order can play out differently
+    pegs = np.asarray(pegs, dtype=float).reshape(-1, 2)[np.asarray(alive, dtype=bool)]
+    digest = hashlib.sha256(repr(float(width)).encode())
+    digest.update(np.ascontiguousarray(pegs, dtype="<f8").tobytes())
+    return digest.hexdigest()
+
+
+def canonical_board(pegs, alive, width):
+    # (key, mirrored): a board and its mirror image (same peg order) get the same key, and mirrored says which
+    # one this is
+    digest = board_digest(pegs, alive, width)
+    mirror_digest = board_digest(mirror_board(pegs, width), alive, width)
+    if mirror_digest < digest:
+        return mirror_digest, True
+    return digest, False
+
+
+# In-memory cache of pegs hit per (board, angle), keyed by the board's pegs in list order, so every cached
+# outcome is exactly what the simulator gives for that board. With mirror=True a board and its mirror image
+# share one entry through canonical_board, which saves half the simulation on symmetric workloads but serves
+# the mirror image's outcome, off on a small fraction of long bounce chains. Up to max_boards boards are kept,
+# least recently used first out.
+class ShotOutcomeCache:
+    def __init__(self, simulator=None, max_boards=64, mirror=False):
+        self.simulator = BatchSimulator() if simulator is None else simulator
+        self.max_boards = max_boards
+        # Only when the launch point is on the mirror axis
+        self.mirror = mirror and 2 * self.simulator.start[0] == self.simulator.width
+        self.boards = OrderedDict()     # Canonical key -> {angle key in the canonical frame: pegs hit}
+        self.hits = 0
+        self.misses = 0
+        self.last_trajectories = 0      # Shots the last call to scores simulated
+        self.last_ticks = 0
+
+    def _entry(self, pegs, alive, angles):
+        # The board's key, its outcomes dict and the keys of `angles` in it
+        if self.mirror:
+            key, mirrored = canonical_board(pegs, alive, self.simulator.width)
+        else:
+            key, mirrored = board_digest(pegs, alive, self.simulator.width), False
+        keys = angle_keys(mirror_angles(angles) if mirrored else angles)
+
+        outcomes = self.boards.get(key)
+        if outcomes is None:
+            outcomes = self.boards[key] = {}
+            if len(self.boards) > self.max_boards:
+                self.boards.popitem(last=False)
+        else:
+            self.boards.move_to_end(key)
+        return key, outcomes, keys
+
+    def _fetch(self, key, outcomes, keys):
+        # Hook for a backing store: adds whatever it has for these angle keys to outcomes
+        pass
+
+    def _save(self, key, keys, pegs_hit):
+        # Hook for a backing store: keeps outcomes that were just simulated or stored
+        pass
+
+    def store(self, pegs, alive, angles, pegs_hit):
+        # Adds precomputed outcomes, e.g. the angle table of a compiled level
+        key, outcomes, keys = self._entry(pegs, alive, np.asarray(angles, dtype=float))
+        pegs_hit = np.asarray(pegs_hit)
+        outcomes.update(zip(keys.tolist(), pegs_hit.tolist()))
+        self._save(key, keys, pegs_hit)
+
+    def scores(self, pegs, alive, angles):
+        angles = np.asarray(angles, dtype=float)
+        key, outcomes, keys = self._entry(pegs, alive, angles)
+
+        pegs_hit = np.array([outcomes.get(angle, -1) for angle in keys.tolist()], dtype=np.intp)
+        missing = np.flatnonzero(pegs_hit < 0)
+        if len(missing) > 0:
+            self._fetch(key, outcomes, keys[missing])
+            pegs_hit[missing] = [outcomes.get(angle, -1) for angle in keys[missing].tolist()]
+            missing = np.flatnonzero(pegs_hit < 0)
+        self.hits += len(angles) - len(missing)
+        self.misses += len(missing)
+        self.last_trajectories = len(missing)
+        self.last_ticks = 0
+        if len(missing) > 0:
+            simulated, ticks = self.simulator.scores(pegs, alive, angles[missing])
+            pegs_hit[missing] = simulated
+            outcomes.update(zip(keys[missing].tolist(), simulated.tolist()))
+            self._save(key, keys[missing], simulated)
+            self.last_ticks = int(ticks.sum()) // self.simulator.timestep
+        return pegs_hit
+
+    def entries(self):
+        return sum(len(outcomes) for outcomes in self.boards.values())
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0
@@ -0,0 +1,117 @@
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Opt-in span tracing. Nothing is recorded until enable() is called (or PEGGLE_TRACE=<path> is set, which
+# enables tracing at import and writes the trace to <path> at exit). Spans go into a fixed-size ring buffer,
+# so a long run keeps only its most recent spans, and export() writes them as Chrome trace JSON for
+# chrome://tracing or https://ui.perfetto.dev.
+_tracer = None
+
+
+class Tracer:
+    def __init__(self, capacity=1 << 16):
+        self.capacity = capacity
+        self.spans = [None] * capacity      # (name, start ns, end ns or None for an instant, thread id, args)
+        self.count = 0                      # Spans ever recorded; the newest is at (count - 1) % capacity
+        self.pid = os.getpid()
+
+    def record(self, name, start, end, args=None):
+        self.spans[self.count % self.capacity] = (name, start, end, threading.get_ident(), args)
+        self.count += 1
+
+    def recorded(self):     # Spans still in the buffer, oldest first
+        if self.count <= self.capacity:
+            return self.spans[:self.count]
+        split = self.count % self.capacity
+        return self.spans[split:] + self.spans[:split]
+
+    def clear(self):
+        self.spans = [None] * self.capacity
+        self.count = 0
+
+    def to_chrome(self):
+        events = []
+        threads = set()
+        for name, start, end, thread, args in self.recorded():
+            threads.add(thread)
+            if end is None:     # Instant event, scoped to its thread
+                event = {"name": name, "ph": "i", "s": "t", "ts": start / 1000, "pid": self.pid, "tid": thread}
+            else:
+                event = {"name": name, "ph": "X", "ts": start / 1000, "dur": (end - start) / 1000, "pid": self.pid, "tid": thread}
+            if args:
+                event["args"] = args
+            events.append(event)
+        for thread in threads:
+            events.append({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": thread,
+                           "args": {"name": "main" if thread == threading.main_thread().ident else str(thread)}})
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "otherData": {"dropped_spans": max(0, self.count - self.capacity)}}
+
+    def export(self, path):
+        with open(path, "w") as file:
+            json.dump(self.to_chrome(), file)
+
+
+def enable(capacity=1 << 16):
+    global _tracer
+    _tracer = Tracer(capacity)
+    return _tracer
+
+
+def disable():
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def get_tracer():
+    return _tracer
+
+
+@contextmanager
+def span(name, **args):
+    tracer = _tracer
+    if tracer is None:
+        yield
+        return
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        tracer.record(name, start, time.perf_counter_ns(), args or None)
+
+
+def traced(name=None):
+    # Decorator that records a span per call while tracing is enabled; costs one global lookup otherwise
+    def decorate(function):
+        span_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return function(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                tracer.record(span_name, start, time.perf_counter_ns())
+        return wrapper
+    return decorate
+
+
+def instant(name, **args):
+    # A point in time rather than a span, e.g. to mark where an episode starts
+    tracer = _tracer
+    if tracer is not None:
+        tracer.record(name, time.perf_counter_ns(), None, args or None)
+
+
+if os.environ.get("PEGGLE_TRACE"):
+    enable()
+    atexit.register(lambda: _tracer is not None and _tracer.export(os.environ["PEGGLE_TRACE"]))
@@ -0,0 +1,297 @@
+import multiprocessing as mp
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+try:
+    from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+except ImportError:     # stable-baselines3 is optional; without it this is a standalone vector env with the same interface
+    VecEnv = object
+
+STEP, RESET, CALL, CLOSE = range(4)
+POLL_SECONDS = 1.0  # How often a waiting parent checks that its workers are still alive
+
+# Info fields copied back from every step, with their types. These are what PeggleEnv._get_info returns.
+INFO_FIELDS = {"total_miss": np.bool_, "pegs_hit": np.int64}
+
+
+def _arrays(num_envs, observation_space, action_space, info_fields):
+    # (name, shape, dtype) of every shared array, in the order they are created and attached
+    return [
+        ("actions", (num_envs,) + action_space.shape, action_space.dtype),
+        ("observations", (num_envs,) + observation_space.shape, observation_space.dtype),
+        ("terminal_observations", (num_envs,) + observation_space.shape, observation_space.dtype),
+        ("rewards", (num_envs,), np.float64),
+        ("terminated", (num_envs,), np.bool_),
+        ("truncated", (num_envs,), np.bool_),
+        ("commands", (num_envs,), np.int64),
+        ("seeds", (num_envs,), np.int64),   # Seed for the next reset, -1 for none
+        ("failed", (num_envs,), np.bool_),  # Set when the last command raised; the traceback follows on the pipe
+        ("info_present", (num_envs, len(info_fields)), np.bool_),
+    ] + [(f"info_{name}", (num_envs,), dtype) for name, dtype in info_fields.items()]
+
+
+def _attach(name, shape, dtype):
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _write_info(shared, rank, info, info_fields):
+    # Fields missing from this info are marked absent rather than left holding the previous value
+    for column, name in enumerate(info_fields):
+        present = name in info
+        shared["info_present"][rank, column] = present
+        if present:
+            shared[f"info_{name}"][rank] = info[name]
+
+
+def _worker(rank, env_fn, names, layout, info_fields, start, done, pipe):
+    env = env_fn()
+    blocks, shared = [], {}
+    for block_name, (name, shape, dtype) in zip(names, layout):
+        block, shared[name] = _attach(block_name, shape, dtype)
+        blocks.append(block)
+
+    while True:
+        start.acquire()
+        command = shared["commands"][rank]
+        if command == CLOSE:
+            break
+
+        try:
+            if command == STEP:
+                action = shared["actions"][rank]
+                action = action.item() if action.ndim == 0 else action.copy()
+                observation, reward, terminated, truncated, info = env.step(action)
+                shared["rewards"][rank] = reward
+                shared["terminated"][rank] = terminated
+                shared["truncated"][rank] = truncated
+                _write_info(shared, rank, info, info_fields)
+                if terminated or truncated:     # Reset right away like SB3's SubprocVecEnv, keeping the last observation
+                    shared["terminal_observations"][rank] = observation
+                    observation, _ = env.reset()
+                shared["observations"][rank] = observation
+            elif command == RESET:
+                seed = int(shared["seeds"][rank])
+                observation, info = env.reset(seed=None if seed < 0 else seed)
+                shared["observations"][rank] = observation
+                _write_info(shared, rank, info, info_fields)
+            elif command == CALL:   # Rare calls (get_attr, env_method, ...) go through the pipe
+                method, args, kwargs = pipe.recv()
+                try:
+                    pipe.send((True, method(env, *args, **kwargs)))
+                except Exception as error:
+                    pipe.send((False, error))
+        except Exception:
+            # Report instead of dying, so the parent is never left waiting for this worker
+            shared["failed"][rank] = True
+            pipe.send(traceback.format_exc())
+        finally:
+            done.release()
+
+    env.close()
+    del shared
+    for block in blocks:
+        block.close()
+
+
+# A vector env of PeggleEnv (or any env with fixed-shape spaces) in worker processes. Actions, observations,
+# rewards, done flags and the INFO_FIELDS live in preallocated shared-memory arrays, and a step is one
+# semaphore release per worker plus one acquire per worker, with nothing pickled. It has the VecEnv
+# interface of stable-baselines3 (and subclasses its VecEnv when that is installed), including auto-reset
+# with info["terminal_observation"]. Pass env_fns that can be pickled when the start method is not fork.
+class SharedMemoryVecEnv(VecEnv):
+    def __init__(self, env_fns, info_fields=None, start_method=None):
+        self.info_fields = dict(INFO_FIELDS if info_fields is None else info_fields)
+        probe = env_fns[0]()
+        observation_space, action_space = probe.observation_space, probe.action_space
+        self.render_mode = getattr(probe, "render_mode", None)
+        probe.close()
+
+        self.num_envs = len(env_fns)
+        if VecEnv is not object:
+            super().__init__(self.num_envs, observation_space, action_space)
+        self.observation_space = observation_space
+        self.action_space = action_space
+        self._seeds = [None] * self.num_envs
+
+        self.layout = _arrays(self.num_envs, observation_space, action_space, self.info_fields)
+        self.blocks, self.shared = [], {}
+        for name, shape, dtype in self.layout:
+            block = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize))
+            self.blocks.append(block)
+            self.shared[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+            self.shared[name].fill(0)
+        names = [block.name for block in self.blocks]
+
+        context = mp.get_context(start_method)
+        self.start_signals = [context.Semaphore(0) for _ in range(self.num_envs)]
+        self.done_signal = context.Semaphore(0)
+        self.pipes = []
+        self.workers = []
+        for rank, env_fn in enumerate(env_fns):
+            parent, child = context.Pipe()
+            worker = context.Process(target=_worker, daemon=True,
+                                     args=(rank, env_fn, names, self.layout, self.info_fields,
+                                           self.start_signals[rank], self.done_signal, child))
+            worker.start()
+            child.close()
+            self.pipes.append(parent)
+            self.workers.append(worker)
+        self.waiting = False
+
+    def _run(self, command, indices=None):
+        indices = range(self.num_envs) if indices is None else indices
+        for rank in indices:
+            self.shared["commands"][rank] = command
+            self.start_signals[rank].release()
+        self._wait(len(indices))
+
+    def _wait(self, count):
+        # Waits for `count` workers to finish their command. Raises EOFError if a worker process has died, like
+        # SB3's SubprocVecEnv, and RuntimeError with the worker's traceback if its env raised.
+        for _ in range(count):
+            while not self.done_signal.acquire(timeout=POLL_SECONDS):
+                for rank, worker in enumerate(self.workers):
+                    if not worker.is_alive():
+                        self.waiting = False
+                        raise EOFError(f"Worker {rank} exited with code {worker.exitcode}")
+        self.waiting = False
+
+        failed = np.flatnonzero(self.shared["failed"])
+        if len(failed) > 0:
+            errors = [(rank, self.pipes[rank].recv()) for rank in failed.tolist()]
+            self.shared["failed"][:] = False
+            raise RuntimeError("".join(f"Worker {rank} raised:\n{error}" for rank, error in errors))
+
+    def _infos(self):
+        present = self.shared["info_present"]
+        fields = {name: self.shared[f"info_{name}"].tolist() for name in self.info_fields}
+        return [{name: values[rank] for column, (name, values) in enumerate(fields.items()) if present[rank, column]}
+                for rank in range(self.num_envs)]
+
+    def seed(self, seed=None):
+        # Seeds used by the next reset, like SB3's VecEnv.seed
+        if seed is None:
+            self._seeds = [None] * self.num_envs
+        else:
+            self._seeds = [seed + rank for rank in range(self.num_envs)]
+        return self._seeds
+
+    def reset(self):
+        self.shared["seeds"][:] = [-1 if seed is None else seed for seed in self._seeds]
+        self._run(RESET)
+        self._seeds = [None] * self.num_envs
+        self.reset_infos = self._infos()
+        return self.shared["observations"].copy()
+
+    def step_async(self, actions):
+        self.shared["actions"][:] = np.asarray(actions).reshape(self.shared["actions"].shape)
+        for rank in range(self.num_envs):
+            self.shared["commands"][rank] = STEP
+            self.start_signals[rank].release()
+        self.waiting = True
+
+    def step_wait(self):
+        self._wait(self.num_envs)
+
+        terminated, truncated = self.shared["terminated"], self.shared["truncated"]
+        dones = terminated | truncated
+        infos = self._infos()
+        for rank in np.flatnonzero(dones):
+            infos[rank]["terminal_observation"] = self.shared["terminal_observations"][rank].copy()
+            infos[rank]["TimeLimit.truncated"] = bool(truncated[rank] and not terminated[rank])
+        return self.shared["observations"].copy(), self.shared["rewards"].copy(), dones, infos
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def _call(self, method, indices, *args, **kwargs):
+        indices = self._indices(indices)
+        for rank in indices:
+            self.pipes[rank].send((method, args, kwargs))
+        self._run(CALL, indices)
+        results = []
+        for rank in indices:
+            ok, value = self.pipes[rank].recv()
+            if not ok:
+                raise value
+            results.append(value)
+        return results
+
+    def _indices(self, indices):
+        if indices is None:
+            return list(range(self.num_envs))
+        if isinstance(indices, int):
+            return [indices]
+        return list(indices)
+
+    def get_attr(self, attr_name, indices=None):
+        return self._call(_get_attr, indices, attr_name)
+
+    def set_attr(self, attr_name, value, indices=None):
+        self._call(_set_attr, indices, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return self._call(_env_method, indices, method_name, *method_args, **method_kwargs)
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return self._call(_is_wrapped, indices, wrapper_class)
+
+    def get_images(self):
+        return self._call(_render, None)
+
+    def close(self):
+        if not self.workers:
+            return
+        if self.waiting:
+            try:
+                self.step_wait()
+            except (EOFError, RuntimeError):
+                pass
+        for rank in range(self.num_envs):
+            self.shared["commands"][rank] = CLOSE
+            self.start_signals[rank].release()
+        for worker in self.workers:
+            worker.join()
+        for pipe in self.pipes:
+            pipe.close()
+        self.workers = []
+
+        self.shared = {}
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Module-level, so they can be sent to workers started with spawn. Attributes the wrappers do not have are looked up on the base env.
+def _get_attr(env, name):
+    return getattr(env.unwrapped if not hasattr(env, name) else env, name)
+
+
+def _set_attr(env, name, value):
+    setattr(env.unwrapped if not hasattr(env, name) else env, name, value)
+
+
+def _env_method(env, name, *args, **kwargs):
+    return getattr(env.unwrapped if not hasattr(env, name) else env, name)(*args, **kwargs)
+
+
+def _is_wrapped(env, wrapper_class):
+    while env is not None:
+        if isinstance(env, wrapper_class):
+            return True
+        env = getattr(env, "env", None)
+    return False
+
+
+def _render(env):
+    return env.render()
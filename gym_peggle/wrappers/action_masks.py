@@ -0,0 +1,53 @@
+import numpy as np
+
+from gym_peggle.sim.batch import BatchSimulator
+from gym_peggle.sim.freeflight import FirstContactIndex, FreeFlightTable
+from gym_peggle.wrappers.discrete_actions import DiscreteActions
+
+
+# DiscreteActions plus an action_masks() method for maskable PPO.
+# An aim action is valid if its angle reaches some peg, and a fire action is valid if the current aim does.
+# First contacts come from a FirstContactIndex over the action angles: their free-flight paths are built once
+# (and cached on disk), so a new board is a lookup against the stored paths. After a shot only the angles
+# whose first contact was removed are looked up again, because removing pegs can't create a contact for an
+# angle that had none.
+class MaskedDiscreteActions(DiscreteActions):
+    def __init__(self, env, disc_to_cont):
+        super().__init__(env, disc_to_cont)
+
+        table = np.asarray(disc_to_cont).reshape(len(disc_to_cont), -1)
+        self.is_fire = table[:, 0] == 1
+        self.aim_angles, self.angle_of_action = np.unique(table[:, -1] / 100000, return_inverse=True)
+
+        self.table = None
+        self.index = None
+
+    @property
+    def first_contact(self):    # First peg each aim angle touches, or -1
+        return self.index.first_peg
+
+    def reset(self, **kwargs):
+        observation, info = self.env.reset(**kwargs)
+        game = self.env.unwrapped.game
+        if self.table is None:
+            self.table = FreeFlightTable(BatchSimulator.from_game(game), self.aim_angles)
+        self.index = FirstContactIndex.from_game(self.table, game)
+        return observation, info
+
+    def step(self, action):
+        observation, reward, terminated, truncated, info = super().step(action)
+        if self.is_fire[action]:
+            self.update_contacts()
+        return observation, reward, terminated, truncated, info
+
+    def update_contacts(self):
+        _, alive = BatchSimulator.board_arrays(self.env.unwrapped.game)
+        self.index.update_alive(alive)
+
+    def action_masks(self):
+        aim_hits = self.first_contact[self.angle_of_action] >= 0
+        fire_hits = self.env.unwrapped.game.pegs_in_trajectory > 0
+        mask = np.where(self.is_fire, fire_hits, aim_hits)
+        if not mask.any():
+            mask[:] = True      # Nothing can hit a peg; leave every action open rather than masking them all
+        return mask
@@ -0,0 +1,332 @@
+import json
+import os
+import secrets
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import AuthenticationError, Process
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from gym_peggle.sim import BatchSimulator, PersistentShotCache
+from peggle_optimal_stop import Simulation
+
+SHOT_CACHE = os.environ.get("PEGGLE_SHOT_CACHE")   # Path of a PersistentShotCache file shared by the workers on a machine
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    mode TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    board TEXT NOT NULL DEFAULT '',         -- JSON peg list, or '' for the board the seed generates
+    state TEXT NOT NULL DEFAULT 'pending',  -- pending, leased, done or failed
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    UNIQUE (mode, seed, board)
+);
+CREATE INDEX IF NOT EXISTS items_state ON items (state, lease_expires);
+CREATE TABLE IF NOT EXISTS results (
+    item_id INTEGER PRIMARY KEY REFERENCES items (id),
+    worker TEXT NOT NULL,
+    pegs_hit INTEGER NOT NULL,
+    total_misses INTEGER NOT NULL,
+    shots INTEGER NOT NULL,
+    angles_evaluated INTEGER NOT NULL,
+    ticks_simulated INTEGER NOT NULL,
+    seconds REAL NOT NULL
+);
+"""
+
+RESULT_FIELDS = ("pegs_hit", "total_misses", "shots", "angles_evaluated", "ticks_simulated", "seconds")
+
+
+def queue_key():
+    # Shared secret of serve() and its workers, from PEGGLE_QUEUE_KEY. There is no default: connections
+    # carry pickles, so anyone holding the key can run code on the other end.
+    key = os.environ.get("PEGGLE_QUEUE_KEY")
+    return key.encode() if key else None
+
+
+# Durable queue of (mode, seed, board) games in a SQLite file in WAL mode. Workers lease one item at a time
+# and renew the lease while they play it. An item whose lease runs out (its worker died) is handed out again,
+# up to max_attempts times. Adding an item twice and reporting a result twice are both no-ops, so the
+# coordinator and workers can be restarted at any point.
+class WorkQueue:
+    def __init__(self, path, lease_seconds=60, max_attempts=3):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()    # One connection shared by the threads of serve()
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")     # Take the write lock up front so two claims never race
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def add(self, modes, seeds, boards=("",)):
+        rows = [(mode, int(seed), board if isinstance(board, str) else json.dumps(board))
+                for mode in modes for seed in seeds for board in boards]
+        with self.transaction() as db:
+            before = db.total_changes
+            db.executemany("INSERT OR IGNORE INTO items (mode, seed, board) VALUES (?, ?, ?)", rows)
+            return db.total_changes - before
+
+    def claim(self, worker):
+        # The next pending or abandoned item, leased to `worker`, or None if there is nothing to hand out
+        now = time.time()
+        with self.transaction() as db:
+            db.execute("UPDATE items SET state = 'failed', error = 'lease expired' "
+                       "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?", (now, self.max_attempts))
+            row = db.execute("SELECT id, mode, seed, board FROM items "
+                             "WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?) "
+                             "ORDER BY id LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE items SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                       "WHERE id = ?", (worker, now + self.lease_seconds, row[0]))
+        return {"id": row[0], "mode": row[1], "seed": row[2], "board": row[3]}
+
+    def renew(self, item_id, worker):
+        # False once the lease has gone to another worker
+        with self.transaction() as db:
+            updated = db.execute("UPDATE items SET lease_expires = ? WHERE id = ? AND state = 'leased' AND worker = ?",
+                                 (time.time() + self.lease_seconds, item_id, worker)).rowcount
+        return updated == 1
+
+    def complete(self, item_id, worker, result):
+        # Stores the first result reported for an item; returns whether this one was it
+        with self.transaction() as db:
+            inserted = db.execute(
+                f"INSERT OR IGNORE INTO results (item_id, worker, {', '.join(RESULT_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (item_id, worker, *(result[field] for field in RESULT_FIELDS))).rowcount
+            db.execute("UPDATE items SET state = 'done', lease_expires = NULL, error = NULL WHERE id = ?", (item_id,))
+        return inserted == 1
+
+    def fail(self, item_id, worker, error):
+        with self.transaction() as db:
+            db.execute("UPDATE items SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                       "lease_expires = NULL, error = ? WHERE id = ? AND state = 'leased' AND worker = ?",
+                       (self.max_attempts, error, item_id, worker))
+
+    def unfinished(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM items WHERE state IN ('pending', 'leased')").fetchone()[0]
+
+    def counts(self):
+        with self.lock:
+            return dict(self.connection.execute("SELECT state, COUNT(*) FROM items GROUP BY state").fetchall())
+
+    def summary(self):
+        # Per mode: games, average pegs hit, total misses, pegs hit per million simulated ticks
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT mode, COUNT(*), AVG(pegs_hit), SUM(total_misses), SUM(pegs_hit), SUM(ticks_simulated) "
+                "FROM results JOIN items ON items.id = results.item_id GROUP BY mode ORDER BY mode").fetchall()
+        return [{"mode": mode, "games": games, "average_pegs_hit": average, "total_misses": misses,
+                 "pegs_per_million_ticks": pegs / ticks * 1e6 if ticks else None}
+                for mode, games, average, misses, pegs, ticks in rows]
+
+    def close(self):
+        self.connection.close()
+
+
+# The worker side of WorkQueue, forwarded over a socket to a coordinator running serve(), for workers on other hosts
+class RemoteQueue:
+    def __init__(self, address, authkey=None):
+        authkey = queue_key() if authkey is None else authkey
+        if authkey is None:
+            raise RuntimeError("Set PEGGLE_QUEUE_KEY to the key the coordinator was started with")
+        self.connection = Client(address, authkey=authkey)
+        self.lock = threading.Lock()    # The lease heartbeat shares the connection with the worker loop
+        self.lease_seconds = self._call("lease_seconds")
+
+    def _call(self, method, *args):
+        with self.lock:
+            self.connection.send((method, args))
+            ok, value = self.connection.recv()
+        if not ok:
+            raise RuntimeError(value)
+        return value
+
+    def claim(self, worker):
+        return self._call("claim", worker)
+
+    def renew(self, item_id, worker):
+        return self._call("renew", item_id, worker)
+
+    def complete(self, item_id, worker, result):
+        return self._call("complete", item_id, worker, result)
+
+    def fail(self, item_id, worker, error):
+        return self._call("fail", item_id, worker, error)
+
+    def unfinished(self):
+        return self._call("unfinished")
+
+    def close(self):
+        self.connection.close()
+
+
+REMOTE_METHODS = {"claim", "renew", "complete", "fail", "unfinished"}
+
+
+def _handle(queue, connection):
+    with connection:
+        while True:
+            try:
+                method, args = connection.recv()
+            except EOFError:
+                return
+            if method == "lease_seconds":
+                connection.send((True, queue.lease_seconds))
+            elif method not in REMOTE_METHODS:
+                connection.send((False, f"Unknown queue method {method!r}"))
+            else:
+                try:
+                    connection.send((True, getattr(queue, method)(*args)))
+                except Exception as error:
+                    connection.send((False, repr(error)))
+
+
+def serve(queue, address, authkey=None):
+    # Serves the queue to RemoteQueue workers until the process is stopped, one thread per connection.
+    # Without PEGGLE_QUEUE_KEY a random key is generated and printed once, for the workers to use.
+    authkey = queue_key() if authkey is None else authkey
+    if authkey is None:
+        key = secrets.token_hex(16)
+        print(f"PEGGLE_QUEUE_KEY is not set; start the workers with PEGGLE_QUEUE_KEY={key}")
+        authkey = key.encode()
+    with Listener(address, authkey=authkey) as listener:
+        print(f"Serving work queue on {listener.address[0]}:{listener.address[1]}")
+        while True:
+            try:
+                connection = listener.accept()
+            except (AuthenticationError, OSError) as error:     # A client with the wrong key must not stop the coordinator
+                print(f"Rejected a connection: {error!r}")
+                continue
+            threading.Thread(target=_handle, args=(queue, connection), daemon=True).start()
+
+
+def play(item, simulator, cache=None):
+    np.random.seed(item["seed"])      # The strategies draw from the global NumPy RNG too, so the whole game is seeded
+    pegs = json.loads(item["board"]) if item["board"] else None
+    simulation = Simulation(False, simulator=simulator, pegs=pegs, cache=cache)
+    start_time = time.perf_counter()
+    pegs_hit = simulation.run(item["mode"])
+    return {
+        "pegs_hit": pegs_hit,
+        "total_misses": simulation.total_misses,
+        "shots": simulation.shots_taken,
+        "angles_evaluated": simulation.game.shots_simulated,
+        "ticks_simulated": simulation.game.ticks_simulated,
+        "seconds": time.perf_counter() - start_time,
+    }
+
+
+def heartbeat(queue, item_id, worker, stop):
+    while not stop.wait(queue.lease_seconds / 3):
+        if not queue.renew(item_id, worker):
+            return
+
+
+def work(queue, worker=None, poll_interval=1):
+    # Plays items until none are pending or leased; returns the number of items this worker completed
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    simulator = BatchSimulator()
+    cache = PersistentShotCache(SHOT_CACHE, simulator) if SHOT_CACHE else None
+    completed = 0
+    while True:
+        item = queue.claim(worker)
+        if item is None:
+            if queue.unfinished() == 0:
+                if cache is not None:
+                    cache.close()
+                return completed
+            time.sleep(poll_interval)     # Other workers hold the rest; wait in case one of them dies
+            continue
+
+        stop = threading.Event()
+        renewer = threading.Thread(target=heartbeat, args=(queue, item["id"], worker, stop), daemon=True)
+        renewer.start()
+        try:
+            result = play(item, simulator, cache)
+        except Exception as error:
+            queue.fail(item["id"], worker, repr(error))
+        else:
+            queue.complete(item["id"], worker, result)
+            completed += 1
+        finally:
+            stop.set()
+            renewer.join()
+
+
+def open_queue(target):
+    # "host:port" connects to a coordinator; anything else is a queue file on this machine
+    host, _, port = target.rpartition(":")
+    if host and port.isdigit():
+        return RemoteQueue((host, int(port)))
+    return WorkQueue(target)
+
+
+def _worker_process(target):
+    queue = open_queue(target)
+    work(queue)
+    queue.close()
+
+
+def print_summary(queue):
+    print(f"Items: {queue.counts()}")
+    for row in queue.summary():
+        rate = row["pegs_per_million_ticks"]
+        print(f"{row['mode']}: {row['games']} games, {row['average_pegs_hit']:.2f} pegs hit on average, "
+              f"{row['total_misses']} total misses" + ("" if rate is None else f", {rate:.2f} pegs hit per million ticks"))
+
+
+def main(command, args):
+    if command == "enqueue":    # enqueue <db> <mode[,mode...]> <num_seeds> [first_seed]
+        queue = WorkQueue(args[0])
+        first_seed = int(args[3]) if len(args) > 3 else 0
+        added = queue.add(args[1].split(","), range(first_seed, first_seed + int(args[2])))
+        print(f"Added {added} items")
+    elif command == "serve":    # serve <db> <[host:]port>, on localhost unless a host is given
+        host, _, port = args[1].rpartition(":")
+        serve(WorkQueue(args[0]), (host or "127.0.0.1", int(port)))
+    elif command == "worker":   # worker <db | host:port>
+        queue = open_queue(args[0])
+        print(f"Completed {work(queue)} items")
+        queue.close()
+    elif command == "local":    # local <db> <mode[,mode...]> <num_seeds> <workers>
+        queue = WorkQueue(args[0])
+        queue.add(args[1].split(","), range(int(args[2])))
+        workers = [Process(target=_worker_process, args=(args[0],)) for _ in range(int(args[3]))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        print_summary(queue)
+    elif command == "summary":  # summary <db>
+        print_summary(WorkQueue(args[0]))
+    else:
+        print("Usage: python peggle_distributed.py enqueue|serve|worker|local|summary ...")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        main(None, [])
+    main(sys.argv[1], sys.argv[2:])
@@ -4,6 +4,10 @@ import math
 import numpy as np
 import time
 import ctypes
+import threading
+
+from gym_peggle.envs.peggle import RESTITUTION, WALL_DAMPING, Game as PreviewGame
+from gym_peggle.sim import BatchSimulator
 
 # Only works on Windows
 try:
@@ -25,6 +29,9 @@ WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
 PEG_COLOR = (255, 0, 0)
 DOTTED_LINE_COLOR = (200, 200, 200)
+HINT_COLOR = (0, 200, 0)
+HINT_ANGLE_STEP = .01
+HINT_CHUNK = 64     # Angles per BatchSimulator call in the hint sweep; a new aim is previewed between chunks
 
 # Ball class
 class Ball:
@@ -43,10 +50,10 @@ class Ball:
         # Bounce off the sides
         if self.x > WIDTH - self.radius:
             self.x = WIDTH - self.radius
-            self.vx *= -0.7 
+            self.vx *= -WALL_DAMPING
         if self.x < 0 + self.radius:
             self.x = 0 + self.radius
-            self.vx *= -0.7
+            self.vx *= -WALL_DAMPING
 
     def in_bounds(self):
         return self.y < HEIGHT   
@@ -72,6 +79,86 @@ class Peg:
         distance = math.sqrt((self.x - ball.x) ** 2 + (self.y - ball.y) ** 2)
         return distance < (self.radius + ball.radius)
 
+# Where the ball goes until its second bounce: the aim dots of the env's Game, so the preview uses the same physics
+def preview_points(pegs, direction):
+    return [(int(x), int(y)) for x, y in PreviewGame(0, list(pegs), 0, direction).aim_dots]
+
+# Background worker for the aim preview and the best-shot hint, so the 60 FPS loop never waits on a simulation.
+# The hint sweep runs in BatchSimulator, whose NumPy loops release the GIL, in chunks of HINT_CHUNK angles. It
+# only restarts when the board changes, and it yields to pending previews between chunks instead of starting over.
+class ShotPreviewWorker:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.running = True
+        self.aim_generation = 0
+        self.aim_job = None         # (generation, pegs, direction)
+        self.board_generation = 0
+        self.hint_job = None        # [generation, pegs, next angle index, most pegs hit, best angle]
+        self.preview = None         # (board generation, direction, points) of the latest finished preview
+        self.hint = None            # (direction, points, pegs hit) of the best shot on the current board
+        self.simulator = BatchSimulator()
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def request_preview(self, pegs, direction):
+        with self.condition:
+            self.aim_generation += 1
+            self.aim_job = (self.aim_generation, self.board_generation, tuple(pegs), direction)
+            self.condition.notify()
+
+    def request_hint(self, pegs):
+        with self.condition:
+            self.board_generation += 1
+            self.hint = None
+            self.hint_job = [self.board_generation, tuple(pegs), 0, 0, None]
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def work(self):
+        while True:
+            with self.condition:
+                while self.running and self.aim_job is None and self.hint_job is None:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                aim_job, self.aim_job = self.aim_job, None
+                hint_job = self.hint_job
+
+            if aim_job is not None:
+                generation, board_generation, pegs, direction = aim_job
+                points = preview_points(pegs, direction)
+                if self.aim_generation == generation:   # A newer aim supersedes this one
+                    self.preview = (board_generation, direction, points)
+            else:
+                self.advance_hint(hint_job)
+
+    def advance_hint(self, hint_job):
+        generation, pegs = hint_job[0], hint_job[1]
+        angles = np.arange(int(np.pi / HINT_ANGLE_STEP) + 1) * HINT_ANGLE_STEP
+        peg_array = np.array(pegs, dtype=float).reshape(-1, 2)
+        alive = np.ones(len(peg_array), dtype=bool)
+        while hint_job[2] < len(angles):
+            if self.aim_job is not None or self.board_generation != generation or not self.running:
+                return      # Resumed from hint_job[2] once the preview is done
+            chunk = angles[hint_job[2]:hint_job[2] + HINT_CHUNK]
+            pegs_hit, _ = self.simulator.scores(peg_array, alive, chunk)
+            best = int(np.argmax(pegs_hit))     # The lowest angle among ties, like the sweep one angle at a time
+            if pegs_hit[best] > hint_job[3]:
+                hint_job[3], hint_job[4] = int(pegs_hit[best]), float(chunk[best])
+            hint_job[2] += len(chunk)
+
+        hint = None
+        if hint_job[4] is not None:
+            hint = (hint_job[4], preview_points(pegs, hint_job[4]), hint_job[3])
+        with self.condition:
+            if self.board_generation == generation:
+                self.hint = hint
+                self.hint_job = None
+
 # Game class
 class Game:
     def __init__(self):
@@ -84,12 +171,27 @@ class Game:
         self.pegs = [Peg(random.randint(50, WIDTH - 100), random.randint(100, WIDTH-100)) for _ in range(NUM_PEGS)]
         self.is_ball_moving = False
         self.launch_direction = np.pi / 2
+        self.font = pygame.font.Font('freesansbold.ttf', 32)
+        self.end_font = pygame.font.Font('freesansbold.ttf', 60)
+        self.show_hint = False
+        self.preview_worker = ShotPreviewWorker()
+        self.previewed_direction = None
+        self.request_previews(board_changed=True)
+
+    def request_previews(self, board_changed=False):
+        pegs = [(peg.x, peg.y) for peg in self.pegs]
+        if board_changed:
+            self.preview_worker.request_hint(pegs)
+        self.preview_worker.request_preview(pegs, self.launch_direction)
+        self.previewed_direction = self.launch_direction
 
     def run(self):
         while self.running:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     self.running = False
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_h:
+                    self.show_hint = not self.show_hint
 
             pressed_keys = pygame.key.get_pressed()
         
@@ -102,6 +204,9 @@ class Game:
             elif pressed_keys[pygame.K_RETURN] and not self.is_ball_moving:
                     self.launch_ball(self.launch_direction)
 
+            if not self.is_ball_moving and self.launch_direction != self.previewed_direction:
+                self.request_previews()
+
             self.update()
       
             self.draw()
@@ -110,6 +215,7 @@ class Game:
             if (self.balls == 0 and self.is_ball_moving == False) or len(self.pegs) == 0:
                 self.draw(game_end=True)
                 self.clock.tick()
+                self.preview_worker.stop()
                 pygame.quit()
 
     def launch_ball(self, direction):
@@ -133,6 +239,7 @@ class Game:
             if not self.ball.in_bounds():
                 self.is_ball_moving = False
                 self.ball.reset()
+                self.request_previews(board_changed=True)
 
 
     def handle_collision(self, peg):
@@ -145,8 +252,8 @@ class Game:
 
         # Reflect the ball's velocity
         dot_product = self.ball.vx * nx + self.ball.vy * ny
-        self.ball.vx -= 1.9 * dot_product * nx
-        self.ball.vy -= 1.9 * dot_product * ny
+        self.ball.vx -= RESTITUTION * dot_product * nx
+        self.ball.vy -= RESTITUTION * dot_product * ny
         
         # Move the ball outside the peg to prevent sticking
         overlap = self.ball.radius + peg.radius - math.sqrt((self.ball.x - peg.x) ** 2 + (self.ball.y - peg.y) ** 2)
@@ -187,9 +294,12 @@ class Game:
         for point in points:
             pygame.draw.circle(self.screen, DOTTED_LINE_COLOR, point, 3)
 
+    def draw_preview(self, points, color):
+        for point in points:
+            pygame.draw.circle(self.screen, color, point, 3)
+
     def draw(self, game_end=False):
-        font = pygame.font.Font('freesansbold.ttf', 32)
-        text = font.render("Balls: " + str(self.balls), True, (255, 255, 255))
+        text = self.font.render("Balls: " + str(self.balls), True, (255, 255, 255))
         textRect = text.get_rect()
         textRect.center = (70, 20)
 
@@ -198,15 +308,23 @@ class Game:
         for peg in self.pegs:
             peg.draw(self.screen)
 
-        # Draw the trajectory line if the ball is not moving
+        # Draw the trajectory line if the ball is not moving. While the aim moves, the newest collision-aware
+        # preview on this board is kept until the one for the current aim arrives, a frame or two later; the
+        # free-flight arc is only drawn before the first preview of a board is ready.
         if not self.is_ball_moving:
-            self.draw_trajectory(GRAVITY, LAUNCH_VELOCITY)
+            hint = self.preview_worker.hint
+            if self.show_hint and hint is not None:
+                self.draw_preview(hint[1], HINT_COLOR)
+            preview = self.preview_worker.preview
+            if preview is not None and preview[0] == self.preview_worker.board_generation:
+                self.draw_preview(preview[2], DOTTED_LINE_COLOR)
+            else:
+                self.draw_trajectory(GRAVITY, LAUNCH_VELOCITY)
 
         self.screen.blit(text, textRect)
 
         if game_end:
-            font2 = pygame.font.Font('freesansbold.ttf', 60)
-            text2 = font2.render("Pegs hit: " + str(NUM_PEGS - len(self.pegs)), True, (255, 255, 255))
+            text2 = self.end_font.render("Pegs hit: " + str(NUM_PEGS - len(self.pegs)), True, (255, 255, 255))
             textRect2 = text2.get_rect()
             textRect2.center = (WIDTH // 2, HEIGHT // 2)
             self.screen.blit(text2, textRect2)
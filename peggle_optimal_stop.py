@@ -2,6 +2,15 @@ import pygame
 import numpy as np
 import math
 import sys
+import time
+
+from gym_peggle.envs.peggle import REMOVED_PEG
+from gym_peggle.events import EventSink
+from gym_peggle.levels import load_level
+from gym_peggle.sim import BatchSimulator, FirstContactIndex, FreeFlightTable, RobustScorer, SweepPool
+from gym_peggle.sim.batch import PRUNE_INTERVAL
+from gym_peggle.sim.reachability import ReachabilityBounds, ticks_until_below
+from gym_peggle.tracing import span
 
 # Constants
 WIDTH, HEIGHT = 1200, 1200
@@ -18,8 +27,11 @@ class DummyGame:
         self.running = True
         self.ball = Ball(BALL_X_START, BALL_Y_START)
         self.pegs = []
-        for peg in pegs:
+        self.alive_mask = 0
+        for i, peg in enumerate(pegs):
             self.pegs.append(Peg(peg.getX(), peg.getY()))
+            if not (peg.getX() == REMOVED_PEG and peg.getY() == REMOVED_PEG):
+                self.alive_mask |= 1 << i
         self.is_ball_moving = False
         self.launch_direction = direction
         self.pegs_in_trajectory = 0
@@ -37,13 +49,13 @@ class DummyGame:
             self.ball.update()
 
             # Check for collisions
-            for peg in self.pegs:
+            for i, peg in enumerate(self.pegs):
                 if peg.is_colliding(self.ball):
-                    self.handle_collision(peg)
+                    self.handle_collision(peg, i)
                     return True
             return False
 
-    def handle_collision(self, peg):
+    def handle_collision(self, peg, index):
         # Calculate the normal vector at the point of collision
         nx = self.ball.x - peg.x
         ny = self.ball.y - peg.y
@@ -62,7 +74,8 @@ class DummyGame:
         self.ball.y += ny * overlap
         
         # Remove the peg
-        peg.setCoords(-50, -50) #TODO
+        peg.setCoords(REMOVED_PEG, REMOVED_PEG)
+        self.alive_mask &= ~(1 << index)
 
 
 # Ball class
@@ -138,9 +151,17 @@ class Game:
         if len(pegs) > 0:
             for i in range(len(pegs)):
                 self.pegs.append(Peg(pegs[i][0], pegs[i][1]))
+        self.peg_coords = [(peg.getX(), peg.getY()) for peg in self.pegs]    # Original peg positions, used to restore snapshots
+        self.alive_mask = (1 << len(self.pegs)) - 1     # Bit i is set while peg i is still on the board
+        self.reachability = ReachabilityBounds(self.peg_coords, np.ones(len(self.pegs), dtype=bool), WIDTH,
+                                               PEG_RADIUS + BALL_RADIUS, GRAVITY)
+        self.prune = True       # End simulated shots as soon as the ball cannot reach another peg
         self.is_ball_moving = False
         self.launch_direction = direction
         self.pegs_in_trajectory = 0
+        self.shots_simulated = 0        # Calls to get_shot_score/get_shot_outcome, i.e. angles evaluated
+        self.ticks_simulated = 0        # Physics ticks spent on those simulated shots
+        self.ticks_pruned = 0           # Ticks skipped by ending hopeless shots early (estimated)
         self.aim_dots = self.get_aim_dots()
 
     def launch_ball(self):
@@ -162,13 +183,13 @@ class Game:
             self.ball.update()
 
             # Check for collisions
-            for peg in self.pegs:
+            for i, peg in enumerate(self.pegs):
                 if peg.is_colliding(self.ball):
-                    self.handle_collision(peg)
+                    self.handle_collision(peg, i)
                     return True
             return False
 
-    def handle_collision(self, peg):
+    def handle_collision(self, peg, index):
         # Calculate the normal vector at the point of collision
         nx = self.ball.x - peg.x
         ny = self.ball.y - peg.y
@@ -187,13 +208,34 @@ class Game:
         self.ball.y += ny * overlap
         
         # Remove the peg
-        peg.setCoords(-50, -50) #TODO
+        peg.setCoords(REMOVED_PEG, REMOVED_PEG)
+        self.alive_mask &= ~(1 << index)
+        self.reachability.remove_peg(index)
         self.pegs_hit += 1
 
+    def snapshot(self):         # Cheap copy of everything a shot can change, restored with restore()
+        return (self.alive_mask, self.balls, self.pegs_hit, self.launch_direction)
+
+    def restore(self, snapshot):
+        alive_mask, self.balls, self.pegs_hit, self.launch_direction = snapshot
+
+        # Only touch the pegs whose alive bit differs from the current board
+        changed = self.alive_mask ^ alive_mask
+        while changed:
+            low_bit = changed & -changed
+            i = low_bit.bit_length() - 1
+            if alive_mask & low_bit:
+                self.pegs[i].setCoords(*self.peg_coords[i])
+            else:
+                self.pegs[i].setCoords(REMOVED_PEG, REMOVED_PEG)
+            self.reachability.set_alive(i, bool(alive_mask & low_bit))
+            changed ^= low_bit
+        self.alive_mask = alive_mask
+
     def get_num_remaining_pegs(self):
         num_remaining_pegs = len(self.pegs)
         for peg in self.pegs:
-            if peg.getX() == -50 and peg.getY() == -50: #TODO
+            if peg.getX() == REMOVED_PEG and peg.getY() == REMOVED_PEG:
                 num_remaining_pegs -= 1
         return num_remaining_pegs
 
@@ -220,32 +262,491 @@ class Game:
         return aim_dots
     
     def get_shot_score(self):     # Runs the current shot on a copy of the game state to see where the ball will go
+        self.shots_simulated += 1
         num_peg_bounces = 0
 
         dummy_game = DummyGame(self.pegs, self.launch_direction)
 
         dummy_game.launch_ball()
 
-        while dummy_game.ball.in_bounds():
+        ticks = 0
+        ball = dummy_game.ball
+        while ball.in_bounds():
+            ticks += 1
             bounce_occurred = dummy_game.update()
             if bounce_occurred:
                 num_peg_bounces += 1
+            elif self.prune and ticks % PRUNE_INTERVAL == 0 and ball.vy >= 0 and self.reachability.hopeless(ball.x, ball.y, ball.vx, ball.vy):
+                self.ticks_pruned += int(ticks_until_below(ball.y, ball.vy, GRAVITY, HEIGHT))
+                break
+        self.ticks_simulated += ticks
     
         return num_peg_bounces
 
+    def get_shot_outcome(self, direction):     # Like get_shot_score, but also returns the board the shot leaves behind
+        self.shots_simulated += 1
+        num_peg_bounces = 0
+
+        dummy_game = DummyGame(self.pegs, direction)
+
+        dummy_game.launch_ball()
+
+        ticks = 0
+        ball = dummy_game.ball
+        while ball.in_bounds():
+            ticks += 1
+            bounce_occurred = dummy_game.update()
+            if bounce_occurred:
+                num_peg_bounces += 1
+            elif self.prune and ticks % PRUNE_INTERVAL == 0 and ball.vy >= 0 and self.reachability.hopeless(ball.x, ball.y, ball.vx, ball.vy):
+                self.ticks_pruned += int(ticks_until_below(ball.y, ball.vy, GRAVITY, HEIGHT))
+                break
+        self.ticks_simulated += ticks
+
+        return num_peg_bounces, dummy_game.alive_mask
+
+
+# Lookahead planner class
+class LookaheadPlanner:
+    """
+    Beam search over the game's remaining balls. Each node is a board (the alive-peg
+    bitmask), each edge is a shot. The successors of a board do not depend on how many
+    balls are left, so expansions are stored in a transposition table keyed by the alive
+    mask and a board is never re-searched, even across shots of the same game.
+    """
+
+    def __init__(self, game, beam_width=4, max_depth=3, angle_step=0.01, max_nodes=5000, time_limit=None):
+        self.game = game
+        self.beam_width = beam_width
+        self.max_depth = max_depth      # None searches all the way to the last ball
+        self.angles = np.arange(0, np.pi, angle_step)
+        self.max_nodes = max_nodes      # Budget in simulated shots per call to plan()
+        self.time_limit = time_limit    # Budget in seconds per call to plan()
+        self.transpositions = {}        # alive mask -> [(angle, pegs_hit, child_mask), ...]
+        self.nodes = 0
+        self.transposition_hits = 0
+        self.search_time = 0
+
+    def plan(self, max_nodes=None, max_ticks=None):
+        # Angle of the first shot of the best line found, or None if no line it searched hits a peg
+        start_time = time.perf_counter()
+        deadline = None if self.time_limit is None else start_time + self.time_limit
+        node_limit = self.nodes + (self.max_nodes if max_nodes is None else min(self.max_nodes, max_nodes))
+        tick_limit = None if max_ticks is None else self.game.ticks_simulated + max_ticks
+        limits = (node_limit, deadline, tick_limit)
+        root = self.game.snapshot()
+
+        depth = self.game.balls
+        if self.max_depth is not None:
+            depth = min(depth, self.max_depth)
+
+        beam = [(0, root[0], None)]     # (pegs hit so far, alive mask, first shot of the line)
+        best_total, best_angle = 0, None
+        for _ in range(depth):
+            candidates = {}
+            for total, alive_mask, first_angle in beam:
+                children = self.expand(alive_mask, root, limits)
+                for angle, pegs_hit, child_mask in children:
+                    child_total = total + pegs_hit
+                    # Two lines that reach the same board at the same depth are interchangeable
+                    if child_mask not in candidates or candidates[child_mask][0] < child_total:
+                        candidates[child_mask] = (child_total, child_mask, angle if first_angle is None else first_angle)
+                if self.out_of_budget(*limits):
+                    break
+
+            if len(candidates) == 0:
+                break
+
+            beam = sorted(candidates.values(), key=lambda candidate: -candidate[0])[:self.beam_width]
+            if beam[0][0] > best_total:
+                best_total, best_angle = beam[0][0], beam[0][2]
+
+            if self.out_of_budget(*limits):
+                break
+
+        self.game.restore(root)
+        self.search_time += time.perf_counter() - start_time
+        return best_angle
+
+    def expand(self, alive_mask, root, limits):     # Every distinct board one shot away from alive_mask
+        if alive_mask in self.transpositions:
+            self.transposition_hits += 1
+            return self.transpositions[alive_mask]
+
+        self.game.restore((alive_mask,) + root[1:])
+        children = []
+        seen = set()
+        for angle in self.angles:
+            if self.out_of_budget(*limits):
+                return children     # Partial expansions are not stored
+            pegs_hit, child_mask = self.game.get_shot_outcome(angle)
+            self.nodes += 1
+            if pegs_hit > 0 and child_mask not in seen:
+                seen.add(child_mask)
+                children.append((angle, pegs_hit, child_mask))
+
+        self.transpositions[alive_mask] = children
+        return children
+
+    def out_of_budget(self, node_limit, deadline, tick_limit=None):
+        if self.nodes >= node_limit:
+            return True
+        if tick_limit is not None and self.game.ticks_simulated >= tick_limit:
+            return True
+        return deadline is not None and time.perf_counter() >= deadline
+
+    def nodes_per_second(self):
+        if self.search_time == 0:
+            return 0
+        return self.nodes / self.search_time
+
+    def report(self):
+        return (f"Lookahead searched {self.nodes} nodes in {self.search_time:.2f}s "
+                f"({self.nodes_per_second():.0f} nodes/sec, {len(self.transpositions)} boards stored, "
+                f"{self.transposition_hits} transposition hits)")
+
+
+# Shot scorer class
+class ShotScorer:
+    """
+    The handle strategies evaluate shots through. Every trajectory and physics tick it
+    spends is counted on the game, and sweeps over many angles go to the simulation's
+    BatchSimulator or SweepPool when it has one, which score shots exactly like
+    get_shot_score. With a ShotOutcomeCache, shots already scored on this board are not
+    simulated again. With a FirstContactIndex, sweeps over its angle grid start at each
+    shot's first bounce, and only the ticks after it are counted.
+    """
+
+    def __init__(self, game, simulator=None, pool=None, cache=None, first_contacts=None):
+        self.game = game
+        self.simulator = simulator
+        self.pool = pool
+        self.cache = cache
+        self.first_contacts = first_contacts
+        self.start_trajectories = game.shots_simulated
+        self.start_ticks = game.ticks_simulated
+
+    @property
+    def trajectories(self):
+        return self.game.shots_simulated - self.start_trajectories
+
+    @property
+    def ticks(self):
+        return self.game.ticks_simulated - self.start_ticks
+
+    @property
+    def batch_size(self):       # Angles worth scoring per call when the strategy may stop early
+        return 1 if self.simulator is None else 64
+
+    def score(self, direction):
+        self.game.change_aim(direction, False)
+        return self.game.get_shot_score()
+
+    def scores(self, directions, simulator=None):
+        # `simulator` overrides the scorer's own, e.g. with a coarser quality level for ranking
+        directions = np.asarray(directions, dtype=float)
+        if self.cache is not None and simulator is None:
+            pegs_hit = self.cache.scores(*BatchSimulator.board_arrays(self.game), directions)
+            self.game.shots_simulated += self.cache.last_trajectories
+            self.game.ticks_simulated += self.cache.last_ticks
+            return pegs_hit
+
+        if simulator is None and self.first_contacts is not None:
+            indices = self.first_contacts.table.grid_indices(directions)
+            if indices is not None:
+                return self.first_contact_scores(indices)
+
+        simulator = self.simulator if simulator is None else simulator
+        if simulator is None:
+            return np.array([self.score(direction) for direction in directions], dtype=np.intp)
+
+        pegs, alive = BatchSimulator.board_arrays(self.game)
+        pegs_hit, ticks = simulator.scores(pegs, alive, directions)
+        self.game.shots_simulated += len(directions)
+        self.game.ticks_simulated += int(ticks.sum()) // simulator.timestep   # Steps actually computed
+        return pegs_hit
+
+    def first_contact_scores(self, indices):
+        index = self.first_contacts
+        index.update_alive(BatchSimulator.board_arrays(self.game)[1])
+        pegs_hit, ticks = index.scores(indices)
+        hits = index.first_peg[indices] >= 0
+        self.game.shots_simulated += len(indices)
+        # The free flight up to the first contact is read from the table, so only the ticks after it are computed
+        self.game.ticks_simulated += int((ticks - np.where(hits, index.first_tick[indices] + 1, ticks)).sum())
+        return pegs_hit
+
+    def best_shot(self, directions):
+        # (angle, pegs hit) of the first shot that hits the most pegs, or (0, 0) if none of them hits anything
+        if len(directions) == 0:
+            return 0, 0
+        if self.pool is not None and self.cache is None:
+            self.pool.update_game(self.game)
+            direction, most_pegs_hit = self.pool.best_shot(directions)
+            self.game.shots_simulated += len(directions)
+            self.game.ticks_simulated += self.pool.last_ticks
+        else:
+            pegs_hit = self.scores(directions)
+            best = int(np.argmax(pegs_hit))
+            direction, most_pegs_hit = float(directions[best]), int(pegs_hit[best])
+
+        if most_pegs_hit == 0:
+            return 0, 0
+        return direction, most_pegs_hit
+
+    def robust_scores(self, directions, robust):
+        # (mean, variance) of pegs hit under a RobustScorer's aim noise; every distinct perturbed shot counts
+        mean, variance = robust.scores_game(self.game, directions)
+        self.game.shots_simulated += robust.last_trajectories
+        self.game.ticks_simulated += robust.last_ticks
+        return mean, variance
+
+    def outcome(self, direction):
+        return self.game.get_shot_outcome(direction)
+
+
+# Budget class
+class Budget:
+    # Limits on what a strategy may spend through its ShotScorer on one shot. None means no limit.
+    def __init__(self, max_trajectories=None, max_ticks=None):
+        self.max_trajectories = max_trajectories
+        self.max_ticks = max_ticks
+        self.ticks_per_direction = None     # Cost of a direction in the last batches() call, kept for the next one
+
+    def exhausted(self, scorer):
+        if self.max_trajectories is not None and scorer.trajectories >= self.max_trajectories:
+            return True
+        return self.max_ticks is not None and scorer.ticks >= self.max_ticks
+
+    def trajectories_left(self, scorer):
+        if self.exhausted(scorer):
+            return 0
+        if self.max_trajectories is None:
+            return None
+        return self.max_trajectories - scorer.trajectories
+
+    def ticks_left(self, scorer):
+        if self.max_ticks is None:
+            return None
+        return max(0, self.max_ticks - scorer.ticks)
+
+    def take(self, scorer, directions):
+        # The leading part of `directions` the budget still pays for. Under a tick limit the ticks left are
+        # divided by ticks_per_direction, so this is an estimate; batches() enforces the limit.
+        left = self.trajectories_left(scorer)
+        if self.max_ticks is not None and left != 0 and self.ticks_per_direction:
+            affordable = max(1, int(self.ticks_left(scorer) // self.ticks_per_direction))
+            left = affordable if left is None else min(left, affordable)
+        return directions if left is None else directions[:left]
+
+    def batches(self, scorer, directions, batch_size=None):
+        # Consecutive leading chunks of `directions` the budget pays for, to be scored one after the other.
+        # Without a tick limit or a batch_size that is a single chunk. With a tick limit, chunks are at most
+        # scorer.batch_size long, the first one probes a single direction while there is no cost estimate yet,
+        # and the limit is checked before each, so a shot spends at most max_ticks plus one chunk.
+        if batch_size is None:
+            batch_size = len(directions) if self.max_ticks is None else scorer.batch_size
+        start_ticks, scored = scorer.ticks, 0
+        begin = 0
+        while begin < len(directions):
+            size = max(1, batch_size)
+            if self.max_ticks is not None:
+                if scored > 0:
+                    self.ticks_per_direction = (scorer.ticks - start_ticks) / scored
+                elif self.ticks_per_direction is None:
+                    size = 1
+            chunk = self.take(scorer, directions[begin:begin + size])
+            if len(chunk) == 0:
+                return
+            yield chunk
+            begin += len(chunk)
+            scored += len(chunk)
+
+
+def best_shot(scorer, budget, directions):
+    # Angle of the first shot that hits the most pegs among the `directions` the budget pays for, or 0
+    optimal_aim, most_pegs_hit = 0, 0
+    for shots in budget.batches(scorer, directions):
+        aim, pegs_hit = scorer.best_shot(shots)
+        if pegs_hit > most_pegs_hit:    # Strictly better only, so ties go to the earliest chunk
+            optimal_aim, most_pegs_hit = aim, pegs_hit
+    return optimal_aim
+
+
+def scored(scorer, budget, directions, score):
+    # The leading part of `directions` the budget pays for and score(chunk) of its chunks, joined on the last axis
+    taken, results = [], []
+    for shots in budget.batches(scorer, directions):
+        taken.append(shots)
+        results.append(np.asarray(score(shots)))
+    if len(taken) == 0:
+        return directions[:0], None
+    return np.concatenate(taken), np.concatenate(results, axis=-1)
+
+
+STRATEGIES = {}     # Mode name -> ShotStrategy subclass
+
+
+def register_strategy(name):
+    # Class decorator that makes a strategy available as a mode of Simulation.run and main
+    def register(cls):
+        cls.name = name
+        STRATEGIES[name] = cls
+        return cls
+    return register
+
+
+# Shot strategy base class
+class ShotStrategy:
+    # One instance is made per game; choose_shot gets a fresh ShotScorer for every shot
+    name = None
+
+    def __init__(self, game):
+        self.game = game
+
+    def choose_shot(self, scorer, budget):
+        raise NotImplementedError
+
+    def report(self):       # Optional line printed after each game
+        return None
+
+
+@register_strategy("random")
+class RandomStrategy(ShotStrategy):
+    def choose_shot(self, scorer, budget):
+        return np.random.randint(0, 314160)/100000
+
+
+@register_strategy("default")
+class DefaultStrategy(ShotStrategy):
+    def choose_shot(self, scorer, budget):
+        selection_of_shots = np.random.permutation(3142)[:120] / 1000
+        return best_shot(scorer, budget, selection_of_shots)
+
+
+@register_strategy("perfect")
+class PerfectStrategy(ShotStrategy):
+    def choose_shot(self, scorer, budget):
+        return best_shot(scorer, budget, np.arange(0, 3142) / 1000)
+
+
+@register_strategy("optimal-stop")
+class OptimalStopStrategy(ShotStrategy):
+    def choose_shot(self, scorer, budget):
+        all_possible_shots = np.random.permutation(3142)[:3142] / 1000
+
+        threshold_index = math.floor(len(all_possible_shots) * .37)  # TODO: Is lower threshold better?
+
+        pre_threshold_shots, pre_threshold_hits = scored(scorer, budget, all_possible_shots[:threshold_index], scorer.scores)  # Slice from the beginning to threshold
+        post_threshold_shots = all_possible_shots[threshold_index:]  # Slice from threshold to the end
+
+        if pre_threshold_hits is None:
+            pre_threshold_hits = np.zeros(0, dtype=np.intp)
+        most_pegs_pre_threshold = pre_threshold_hits.max(initial=0)
+
+        hitting = np.flatnonzero(pre_threshold_hits > 0)
+        optimal_stopping_shot = 0
+        if len(hitting) > 0:
+            optimal_stopping_shot = float(pre_threshold_shots[hitting[-1]])    # A backup shot that got at least 1 peg so that the bot doesn't just miss (at least not often)
+
+        # Scored a few at a time when batched; the first good enough shot is the same either way
+        for shots in budget.batches(scorer, post_threshold_shots, scorer.batch_size):
+            pegs_hit = scorer.scores(shots)
+            good_enough = np.flatnonzero(pegs_hit / (most_pegs_pre_threshold + 1) >= .2)   # We want the shot taken to be worse than the optimal shot
+            if len(good_enough) > 0:
+                return float(shots[good_enough[0]])
+
+        return optimal_stopping_shot
+
+
+@register_strategy("two-stage")
+class TwoStageStrategy(ShotStrategy):
+    # The perfect sweep ranked with a coarse simulator; only the top_k candidates are scored exactly
+    def __init__(self, game, quality="coarse", top_k=16):
+        super().__init__(game)
+        self.coarse = BatchSimulator.from_game(game).with_quality(quality)
+        self.top_k = top_k
+
+    def choose_shot(self, scorer, budget):
+        all_shots, coarse_hits = scored(scorer, budget, np.arange(0, 3142) / 1000,
+                                        lambda shots: scorer.scores(shots, self.coarse))
+        if coarse_hits is None:
+            return 0
+        candidates = np.sort(np.argsort(-coarse_hits, kind="stable")[:self.top_k])     # Kept in angle order, so ties go to the lowest angle
+        return best_shot(scorer, budget, all_shots[candidates])
+
+
+@register_strategy("robust")
+class RobustStrategy(ShotStrategy):
+    # The perfect sweep, scored by expected pegs hit when the aim and launch speed are jittered
+    def __init__(self, game, samples=32, risk=0):
+        super().__init__(game)
+        self.robust = RobustScorer(BatchSimulator.from_game(game), samples)
+        self.risk = risk    # Standard deviations taken off the mean, so steadier shots win
+
+    def choose_shot(self, scorer, budget):
+        all_shots, moments = scored(scorer, budget, np.arange(0, 3142) / 1000,
+                                    lambda shots: scorer.robust_scores(shots, self.robust))
+        if moments is None:
+            return 0
+        mean, variance = moments
+        return float(all_shots[np.argmax(mean - self.risk * np.sqrt(variance))])
+
+
+@register_strategy("lookahead")
+class LookaheadStrategy(ShotStrategy):
+    def __init__(self, game):
+        super().__init__(game)
+        self.planner = LookaheadPlanner(game)     # Kept for the whole game so its transposition table is reused
+
+    def choose_shot(self, scorer, budget):
+        # The planner's own node budget is capped by the trajectories left, and it stops once the ticks left are spent
+        angle = self.planner.plan(budget.trajectories_left(scorer), budget.ticks_left(scorer))
+        if angle is None:   # Nothing the planner searched hits a peg, e.g. its budget ran out first
+            return best_shot(scorer, budget, np.arange(0, 3142) / 1000)
+        return angle
+
+    def report(self):
+        return self.planner.report()
+
 
 # Simulation class
 class Simulation:
-    def __init__(self, render=True):
+    def __init__(self, render=True, pool=None, events=None, simulator=None, budget=None, pegs=None, cache=None,
+                 level=None):
         self.render = render
+        self.pool = pool    # Optional SweepPool that full sweeps are spread over
+        self.simulator = simulator      # Optional gym_peggle.sim.BatchSimulator that scores many angles at once
+        self.events = events    # Optional gym_peggle.events.EventSink for shot and game events
+        self.budget = Budget() if budget is None else budget
+        self.cache = cache      # Optional gym_peggle.sim.ShotOutcomeCache shared between shots and games
+        self.first_contacts = None      # FirstContactIndex of the board, for an exact simulator
+        self.shots_taken = 0
+        self.total_misses = 0
         if render:
             pygame.init()
             pygame.display.init()
             self.window = pygame.display.set_mode((WIDTH, HEIGHT))
             self.clock = pygame.time.Clock()
             self.canvas = pygame.Surface((WIDTH, HEIGHT))
-        temp_pegs = np.random.randint(100, WIDTH - 100, size=(30, 2))
-        self.game = Game(0, temp_pegs, 10, np.pi/2)
+        balls = 10
+        self.level = None
+        if level is not None:       # A compiled level (or anything gym_peggle.levels.load_level accepts) instead of a random board
+            self.level = load_level(level)
+            if (self.level.width, self.level.height, self.level.peg_radius, self.level.ball_radius) != (WIDTH, HEIGHT, PEG_RADIUS, BALL_RADIUS):
+                raise ValueError(f"Level {self.level.name!r} does not use this game's board size and radii")
+            pegs, balls = np.array(self.level.pegs), self.level.balls
+            if cache is not None:   # Its angle table already scores every shot on the full board
+                cache.store(pegs, np.ones(len(pegs), dtype=bool), self.level.angles, self.level.scores)
+        temp_pegs = np.random.randint(100, WIDTH - 100, size=(30, 2)) if pegs is None else pegs
+        self.game = Game(0, temp_pegs, balls, np.pi/2)
+        self.strategy = None
+        if simulator is not None and simulator.timestep == 1:
+            table = FreeFlightTable(simulator)
+            if self.level is not None and np.array_equal(self.level.angles, table.angles):
+                self.first_contacts = self.level.first_contact_index(table)     # No path comparisons on a compiled level
+            else:
+                self.first_contacts = FirstContactIndex.from_game(table, self.game)
 
     def render_frame(self):
         self.canvas.fill((0, 0, 0))
@@ -289,162 +790,101 @@ class Simulation:
 
         self.clock.tick(60)
 
+    def start_shot(self):
+        return (time.perf_counter(), self.game.shots_simulated, self.game.ticks_simulated, self.game.pegs_hit)
+
+    def fire(self, direction, mode, shot_start):
+        self.game.change_aim(direction)
+        self.game.launch_ball()
+
+        while self.game.ball.in_bounds():
+            self.game.update()
+            if self.render:
+                self.render_frame()
+
+        start_time, start_shots_simulated, start_ticks_simulated, start_pegs_hit = shot_start
+        pegs_hit = self.game.pegs_hit - start_pegs_hit
+        if pegs_hit == 0:
+            self.total_misses += 1
+        if self.events is not None:
+            self.events.emit("shot", mode=mode, shot=self.shots_taken, angle=direction, pegs_hit=pegs_hit,
+                             total_miss=pegs_hit == 0, angles_evaluated=self.game.shots_simulated - start_shots_simulated,
+                             ticks_simulated=self.game.ticks_simulated - start_ticks_simulated,
+                             seconds=time.perf_counter() - start_time)
+        self.shots_taken += 1
+
     def run(self, mode):
+        if mode not in STRATEGIES:
+            raise ValueError(f"Unknown mode {mode!r}, expected one of: {', '.join(STRATEGIES)}")
+        run_start = time.perf_counter()
         if self.render:
             self.render_frame()
 
-        if mode == "random":
-            while self.game.balls > 0:
-                if self.game.pegs_hit == len(self.game.pegs):
-                    break
-
-                self.game.change_aim(np.random.randint(0, 314160)/100000)
-                self.game.launch_ball()
-
-                while self.game.ball.in_bounds():
-                    self.game.update()
-                    if self.render:
-                        self.render_frame()
-
-        if mode == "default":
-            while self.game.balls > 0:
-                if self.game.pegs_hit == len(self.game.pegs):
-                    break
-
-                self.game.change_aim(self.get_default_shot())
-                self.game.launch_ball()
-
-                while self.game.ball.in_bounds():
-                    self.game.update()
-                    if self.render:
-                        self.render_frame()
-
-        if mode == "perfect":
-            while self.game.balls > 0:
-                if self.game.pegs_hit == len(self.game.pegs):
-                    break
-
-                self.game.change_aim(self.get_perfect_shot())
-                self.game.launch_ball()
-
-                while self.game.ball.in_bounds():
-                    self.game.update()
-                    if self.render:
-                        self.render_frame()
-
-        if mode == "optimal-stop":
-            while self.game.balls > 0:
-                if self.game.pegs_hit == len(self.game.pegs):
-                    break
+        self.strategy = STRATEGIES[mode](self.game)
+        while self.game.balls > 0:
+            if self.game.pegs_hit == len(self.game.pegs):
+                break
 
-                self.game.change_aim(self.get_optimal_stopping_shot())
-                self.game.launch_ball()
+            shot_start = self.start_shot()
+            scorer = ShotScorer(self.game, self.simulator, self.pool, self.cache, self.first_contacts)
+            with span("choose_shot", mode=mode, shot=self.shots_taken):
+                direction = self.strategy.choose_shot(scorer, self.budget)
+            with span("fire", mode=mode, shot=self.shots_taken):
+                self.fire(direction, mode, shot_start)
 
-                while self.game.ball.in_bounds():
-                    self.game.update()
-                    if self.render:
-                        self.render_frame()
+        if self.events is not None:
+            self.events.emit("game", mode=mode, pegs_hit=self.game.pegs_hit, shots=self.shots_taken,
+                             total_misses=self.total_misses, angles_evaluated=self.game.shots_simulated,
+                             ticks_simulated=self.game.ticks_simulated, ticks_pruned=self.game.ticks_pruned,
+                             seconds=time.perf_counter() - run_start)
 
         return self.game.pegs_hit
-    
-
-    def get_perfect_shot(self):
-        most_pegs_hit = 0
-        optimal_aim = 0
-        for i in range(0, 3142):
-            aiming_float = i / 1000
-            self.game.change_aim(aiming_float, False)
-
-            pegs_hit = self.game.get_shot_score()
-
-            if pegs_hit > most_pegs_hit:
-                most_pegs_hit = pegs_hit
-                optimal_aim = aiming_float
-
-        return optimal_aim
-    
-    def get_default_shot(self):
-        most_pegs_hit = 0
-        optimal_aim = 0
-        selection_of_shots = np.random.permutation(3142)[:120]
-
-        for shot in selection_of_shots:
-            aiming_float = shot / 1000
-            self.game.change_aim(aiming_float, False)
-
-            pegs_hit = self.game.get_shot_score()
-
-            if pegs_hit > most_pegs_hit:
-                most_pegs_hit = pegs_hit
-                optimal_aim = aiming_float
-
-        if (most_pegs_hit == 0):
-            print("0 pegs hit this time")
-
-        return optimal_aim
-    
-    def get_optimal_stopping_shot(self):
-        all_possible_shots = np.random.permutation(3142)[:3142]
-
-        threshold_index = math.floor(len(all_possible_shots) * .37)  # TODO: Is lower threshold better?
-
-        pre_threshold_shots = all_possible_shots[:threshold_index]  # Slice from the beginning to threshold
-        post_threshold_shots = all_possible_shots[threshold_index:]  # Slice from threshold to the end
-
-        most_pegs_pre_threshold = 0
-
-        backup_shot = 0
-        pegs_hit_chosen_shot = 0    
-
-        for shot in pre_threshold_shots:
-            aiming_float = shot / 1000
-            self.game.change_aim(aiming_float, False)
-
-            pegs_hit = self.game.get_shot_score()
-            if pegs_hit > 0:
-                backup_shot = aiming_float        # A backup shot that got at least 1 peg so that the bot doesn't just miss (at least not often)
-                pegs_hit_chosen_shot = pegs_hit
-
-            if pegs_hit > most_pegs_pre_threshold:
-                most_pegs_pre_threshold = pegs_hit
-
-        optimal_stopping_shot = backup_shot
-                                              
-        for shot in post_threshold_shots:
-            aiming_float = shot / 1000
-            self.game.change_aim(aiming_float, False)
-
-            pegs_hit = self.game.get_shot_score()
-
-            if (pegs_hit/(most_pegs_pre_threshold+1)) >= .2:   # We want the shot taken to be worse than the optimal shot
-                optimal_stopping_shot = aiming_float    
-                pegs_hit_chosen_shot = pegs_hit
-                break
-
-        # print(f"Most pegs hit pre-threshold: {most_pegs_pre_threshold}")
-        # print(f"Pegs hit on chosen shot: {pegs_hit_chosen_shot}")
-        if (pegs_hit_chosen_shot == 0):
-            print("0 pegs hit this time")
-
-        return optimal_stopping_shot
 
 
 
-def main(mode, simulations, render):
+def main(mode, simulations, render, workers=0, events_path=None):
+    simulator = BatchSimulator()
+    pool = SweepPool(workers, simulator) if workers > 0 else None
+    events = EventSink(events_path, flush_interval=5) if events_path is not None else None
+    run_start = time.perf_counter()
     total_pegs_hit = 0
+    total_misses = 0
+    total_trajectories = 0
+    total_ticks = 0
     for i in range(simulations):
-        simulation = Simulation(render)
+        simulation = Simulation(render, pool, events, simulator)
         pegs_hit = simulation.run(mode)
+        total_misses += simulation.total_misses
+        total_trajectories += simulation.game.shots_simulated
+        total_ticks += simulation.game.ticks_simulated
         print(f"{mode} Simulation {i} saw {pegs_hit} pegs get hit.")
+        report = simulation.strategy.report()
+        if report is not None:
+            print(report)
         total_pegs_hit += pegs_hit
 
     print(f"Average number of pegs hit over {simulations} simulations: {total_pegs_hit/simulations}")
+    if total_misses > 0:
+        print(f"{total_misses} total misses")
+    if total_ticks > 0:
+        print(f"{mode}: {total_pegs_hit / total_ticks * 1e6:.2f} pegs hit per million simulated ticks "
+              f"({total_trajectories} trajectories, {total_ticks} ticks)")
+
+    if events is not None:
+        events.emit("run", mode=mode, simulations=simulations, average_pegs_hit=total_pegs_hit/simulations,
+                    total_misses=total_misses, angles_evaluated=total_trajectories, ticks_simulated=total_ticks,
+                    seconds=time.perf_counter() - run_start)
+        events.close()
+    if pool is not None:
+        pool.close()
     
     
 if __name__ == "__main__":
     mode = "optimal-stop"
     simulations = 1
     render = False
+    workers = 0
+    events_path = None
 
     if len(sys.argv) > 1:
         mode = sys.argv[1]
@@ -453,5 +893,9 @@ if __name__ == "__main__":
     if len(sys.argv) > 3:
         if sys.argv[3] == "render" or sys.argv[3] == "true":
             render = True
+    if len(sys.argv) > 4:
+        workers = int(sys.argv[4])
+    if len(sys.argv) > 5:
+        events_path = sys.argv[5]
 
-    main(mode, simulations, render)
\ No newline at end of file
+    main(mode, simulations, render, workers, events_path)
\ No newline at end of file